@@ -0,0 +1,106 @@
+import os
+import subprocess
+import sys
+import time
+
+
+# Import-time profile of the entry points
+#
+# Each module is imported in a fresh interpreter with `python -X importtime` so nothing is already
+#   cached in sys.modules. We report wall time of the whole interpreter, the cumulative import time
+#   of the module itself, and the slowest packages it pulled in
+#
+# Run from the project root:
+#
+#   python Benchmark/import_profile.py
+#
+# Output goes to Benchmark/output/import_profile.txt
+
+ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+OUTPUT_PATH = os.path.join(ROOT_DIR, "Benchmark", "output", "import_profile.txt")
+
+MODULES = [
+    "Util.CommonUtil",
+    "Util.EvaluationUtil",
+    "Util.SqlLiteUtil",
+    "Service.spider.SpiderService",
+    "Service.bird.BirdService",
+    "Service.server.TextToSqlServer",
+    "Service.UniversalRAG",
+    "Main",
+    "Cli",
+]
+
+# Packages we never want on a path that does not retrieve
+HEAVY_PACKAGES = ["sklearn", "scipy", "numpy", "requests"]
+
+
+def profile_module(module):
+    # -X importtime lines look like:  "import time:   self [us] | cumulative | imported package"
+    code = f"import sys, {module}; print(','.join(p for p in {HEAVY_PACKAGES!r} if p in sys.modules))"
+
+    start = time.perf_counter()
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        cwd=ROOT_DIR,
+        capture_output=True,
+        text=True,
+    )
+    wall = time.perf_counter() - start
+
+    if proc.returncode != 0:
+        return {"module": module, "error": proc.stderr.strip().splitlines()[-1]}
+
+    rows = []
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+
+        _, cumulative_us, name = line.split(":", 1)[1].split("|")
+        rows.append((int(cumulative_us), name.strip()))
+
+    own = next((us for us, name in rows if name == module), 0)
+    top_level = sorted(((us, name) for us, name in rows if "." not in name), reverse=True)[:5]
+
+    return {
+        "module": module,
+        "wall_ms": wall * 1000,
+        "import_ms": own / 1000,
+        "heavy": proc.stdout.strip() or "-",
+        "top": top_level,
+    }
+
+
+def main():
+    lines = [
+        f"Import-time profile ( python {sys.version.split()[0]}, {sys.platform} )",
+        "",
+        f"{'module':<34} {'wall ms':>9} {'import ms':>10}  heavy packages loaded",
+        "-" * 90,
+    ]
+
+    details = []
+    for module in MODULES:
+        result = profile_module(module)
+
+        if "error" in result:
+            lines.append(f"{module:<34} {'ERROR':>9}  {result['error']}")
+            continue
+
+        lines.append(f"{module:<34} {result['wall_ms']:>9.1f} {result['import_ms']:>10.1f}  {result['heavy']}")
+
+        details.append(f"\n{module}: slowest top-level imports")
+        for us, name in result["top"]:
+            details.append(f"    {us / 1000:>8.1f} ms  {name}")
+
+    report = "\n".join(lines + details) + "\n"
+
+    os.makedirs(os.path.dirname(OUTPUT_PATH), exist_ok=True)
+    with open(OUTPUT_PATH, "w", encoding="utf-8") as f:
+        f.write(report)
+
+    print(report)
+
+
+if __name__ == "__main__":
+    main()
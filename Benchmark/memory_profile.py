@@ -0,0 +1,129 @@
+import argparse
+import json
+import os
+import sys
+
+
+# Memory profile of a full pipeline run, with a regression check
+#
+# Runs the load test ( in-process gold SQL stub, no API key ) with a Util.MemoryProfiler, then compares
+#   peak RSS and the bytes attributed to the RAG index, result sets and items against
+#   Benchmark/memory_baseline.json. Anything more than --threshold above its baseline is a regression
+#   and the script exits 1; so does a dataset / item count with no baseline at all, since nothing
+#   was checked
+#
+# Run from the project root:
+#
+#   python Benchmark/memory_profile.py
+#   python Benchmark/memory_profile.py --update-baseline    # after an intended change
+#
+# Output goes to Benchmark/output/memory_profile.txt
+
+ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+OUTPUT_PATH = os.path.join(ROOT_DIR, "Benchmark", "output", "memory_profile.txt")
+BASELINE_PATH = os.path.join(ROOT_DIR, "Benchmark", "memory_baseline.json")
+
+sys.path.insert(0, ROOT_DIR)
+
+
+def profile_run(dataset, items, seed):
+    from Service.stub.LoadGenerator import LoadGenerator
+    from Util.MemoryProfiler import MemoryProfiler
+
+    profiler = MemoryProfiler()
+    try:
+        LoadGenerator(
+            dataset, items, seed=seed,
+            stub_options={"latency": "fixed:0.001"},
+            run_options={"workers": 4, "memory_profiler": profiler},
+        ).run()
+    finally:
+        profiler.close()
+
+    return profiler
+
+
+def measurements(summary):
+    # KEY measured quantity, VALUE bytes
+    return {"peak_rss": summary["peak_rss"], **{f"bytes:{name}": size for name, size in summary["attributions"].items()}}
+
+
+def compare(current, baseline, threshold):
+    # (lines, regressed names)
+    mb = 1024 * 1024
+    lines = [f"{'measure':<28} {'baseline MB':>12} {'now MB':>10} {'change':>8}", "-" * 62]
+    regressed = []
+
+    for name, now in current.items():
+        before = baseline.get(name)
+        if not before:
+            lines.append(f"{name:<28} {'-':>12} {now / mb:>10.2f} {'new':>8}")
+            continue
+
+        change = now / before - 1
+        flag = ""
+        if change > threshold:
+            regressed.append(name)
+            flag = "  REGRESSION"
+        lines.append(f"{name:<28} {before / mb:>12.2f} {now / mb:>10.2f} {change:>+8.1%}{flag}")
+
+    return lines, regressed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="memory profile of a stubbed pipeline run")
+    parser.add_argument("--dataset", default="spider-1.0", choices=["bird", "spider-1.0"])
+    parser.add_argument("--items", type=int, default=200)
+    parser.add_argument("--seed", default="memory-profile")
+    parser.add_argument("--threshold", type=float, default=0.20, help="allowed growth over the baseline")
+    parser.add_argument("--update-baseline", action="store_true")
+    args = parser.parse_args()
+
+    # The pipeline reads Dataset/ and writes Cache/ relative to the working directory
+    os.chdir(ROOT_DIR)
+
+    profiler = profile_run(args.dataset, args.items, args.seed)
+    current = measurements(profiler.summary())
+
+    baselines = {}
+    if os.path.exists(BASELINE_PATH):
+        with open(BASELINE_PATH, "r", encoding="utf-8") as f:
+            baselines = json.load(f)
+
+    # Baselines are per dataset and item count; a different run has nothing to compare with
+    key = f"{args.dataset}:{args.items}"
+    baseline = baselines.get(key, {})
+    lines, regressed = compare(current, baseline, args.threshold)
+
+    header = [
+        f"Memory profile ( {args.dataset}, {args.items} items, python {sys.version.split()[0]}, {sys.platform} )",
+        f"threshold +{args.threshold:.0%} over {os.path.relpath(BASELINE_PATH, ROOT_DIR)} [{key}]",
+        "",
+    ]
+    report = "\n".join(header + lines + [profiler.report()]) + "\n"
+
+    os.makedirs(os.path.dirname(OUTPUT_PATH), exist_ok=True)
+    with open(OUTPUT_PATH, "w", encoding="utf-8") as f:
+        f.write(report)
+
+    print("\n".join(header + lines))
+
+    if args.update_baseline:
+        baselines[key] = current
+        with open(BASELINE_PATH, "w", encoding="utf-8") as f:
+            json.dump(baselines, f, indent=1, sort_keys=True)
+        print(f"\nBaseline {key} updated")
+        return
+
+    if not baseline:
+        print(f"\n[ERROR] No baseline for {key} in {os.path.relpath(BASELINE_PATH, ROOT_DIR)}; "
+              f"record one with --update-baseline")
+        sys.exit(1)
+
+    if regressed:
+        print(f"\n[ERROR] Memory regression: {', '.join(regressed)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,143 @@
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+
+# Size and query latency of the RAG index, full build vs a compact one
+#
+# Builds each variant from the training files, persists it to a scratch directory and loads it back
+#   the way every run after the first does ( numpy-only TfidfIndex ), then times retrieve() for the
+#   dev questions of the dataset. Also reports how many top-k example lists contain near-identical
+#   questions, which dedup is meant to remove
+#
+# Run from the project root:
+#
+#   python Benchmark/rag_compaction.py --dataset spider-1.0
+#
+# Output goes to Benchmark/output/rag_compaction.txt
+
+ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+OUTPUT_PATH = os.path.join(ROOT_DIR, "Benchmark", "output", "rag_compaction.txt")
+
+sys.path.insert(0, ROOT_DIR)
+
+
+def load_variant(dataset, build_options, scratch):
+    from Service.UniversalRAG import UniversalRAG
+
+    index_dir = os.path.join(scratch, "compact" if build_options else "full")
+    dataset_root = os.path.join("Dataset", dataset)
+
+    start = time.perf_counter()
+    UniversalRAG(dataset_root, dataset, index_dir=index_dir, build_options=build_options).initialize()
+    build_seconds = time.perf_counter() - start
+
+    rag = UniversalRAG(dataset_root, dataset, index_dir=index_dir, build_options=build_options)
+    rag.initialize()
+
+    return rag, build_seconds
+
+
+def near_identical_lists(rag, questions, k):
+    # Top-k lists holding two examples whose questions share >= 80% of their words
+    from Service.MinHashDedup import MinHashDedup
+
+    count = 0
+    for question, db_id in questions:
+        words = [set(example["question"].lower().split()) for example in rag.run_rag(question, k, db_id)]
+        if any(MinHashDedup.jaccard(a, b) >= 0.8 for i, a in enumerate(words) for b in words[i + 1:]):
+            count += 1
+
+    return count
+
+
+def measure(rag, build_seconds, questions, k):
+    # One untimed pass warms the candidate cache both variants would have warm in a run
+    for question, db_id in questions:
+        rag.run_rag(question, k, db_id)
+
+    latencies = []
+    for question, db_id in questions:
+        start = time.perf_counter()
+        rag.run_rag(question, k, db_id)
+        latencies.append(time.perf_counter() - start)
+
+    latencies = np.array(latencies) * 1000
+    index = rag.tfidf_index
+
+    return {
+        "rows": index.num_rows,
+        "terms": len(index.vocabulary),
+        "postings": len(index.rows),
+        "mb": index.nbytes() / 1e6,
+        "build_s": build_seconds,
+        "p50_ms": float(np.percentile(latencies, 50)),
+        "p95_ms": float(np.percentile(latencies, 95)),
+        "near_identical": near_identical_lists(rag, questions, k),
+    }
+
+
+def main():
+    from Service.UniversalRAG import UniversalRAG
+    from Service.impls.LoadDevJson import LoadDevJson
+
+    parser = argparse.ArgumentParser(description="RAG index size and latency, full vs compact build")
+    parser.add_argument("--dataset", default="spider-1.0", choices=["bird", "spider-1.0"])
+    parser.add_argument("--questions", type=int, default=500, help="dev questions timed")
+    parser.add_argument("--k", type=int, default=5)
+    args = parser.parse_args()
+
+    os.chdir(ROOT_DIR)
+
+    # Imported up front so neither variant's build time includes it
+    import sklearn.feature_extraction.text  # noqa: F401
+
+    dev_list = LoadDevJson.load_bird_dev_json() if args.dataset == "bird" else LoadDevJson.load_spider_dev_json()
+    questions = [(obj.dev_question, obj.dev_db_id) for obj in dev_list[: args.questions]]
+
+    scratch = tempfile.mkdtemp(prefix="rag_compaction_")
+    try:
+        results = {}
+        for name, build_options in (("full", None), ("compact", UniversalRAG.COMPACT_BUILD)):
+            rag, build_seconds = load_variant(args.dataset, build_options, scratch)
+            results[name] = measure(rag, build_seconds, questions, args.k)
+    finally:
+        shutil.rmtree(scratch, ignore_errors=True)
+
+    full, compact = results["full"], results["compact"]
+    lines = [
+        f"RAG index, full vs compact ( {args.dataset}, {len(questions)} dev questions, k={args.k} )",
+        f"compact build: {UniversalRAG.COMPACT_BUILD}",
+        "",
+        f"{'':<22} {'full':>12} {'compact':>12} {'change':>9}",
+        "-" * 58,
+    ]
+    for key, label in (
+        ("rows", "training rows"),
+        ("terms", "vocabulary"),
+        ("postings", "postings"),
+        ("mb", "index MB"),
+        ("build_s", "build s"),
+        ("p50_ms", "retrieve p50 ms"),
+        ("p95_ms", "retrieve p95 ms"),
+        ("near_identical", "near-identical top-k"),
+    ):
+        change = f"{compact[key] / full[key] - 1:>+9.1%}" if full[key] else f"{'-':>9}"
+        lines.append(f"{label:<22} {full[key]:>12.3f} {compact[key]:>12.3f} {change}")
+
+    report = "\n".join(lines) + "\n"
+
+    os.makedirs(os.path.dirname(OUTPUT_PATH), exist_ok=True)
+    with open(OUTPUT_PATH, "w", encoding="utf-8") as f:
+        f.write(report)
+
+    print(report)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,386 @@
+import argparse
+
+from Util.CommonUtil import CommonUtil
+from Util.Log import Log
+from Util.RateLimiter import RateLimiter
+
+
+# Command line entry point for everything that is not the default Main.py demo run
+#
+#   python Cli.py serve --warm bird spider-1.0
+#   python Cli.py stub --port 8766
+#   python Cli.py run spider-1.0 --items 1000 --shard 3/8 --shard-dir Cache/shards
+#   python Cli.py merge Cache/shards
+#   python Cli.py multi --job bird:nightly-a:500 --job spider-1.0:nightly-a:500 --job spider-1.0:nightly-b:500
+#   python Cli.py advise bird && python Cli.py run bird --indexed-eval
+#   python Cli.py loadtest spider-1.0 --items 200 --workers 8 --latency lognormal:0.8,0.5 --rate-429 0.05
+
+
+def serve(args):
+    from Service.server.TextToSqlServer import TextToSqlServer
+
+    server = TextToSqlServer(
+        CommonUtil._get_api_key(),
+        host=args.host,
+        port=args.port,
+        max_concurrency=args.max_concurrency,
+        max_queue=args.max_queue,
+        top_k=args.top_k,
+    )
+    server.run(warm_datasets=args.warm)
+
+
+def stub_options(args):
+    return {
+        "chunk_size": args.chunk_size,
+        "chunk_delay": args.chunk_delay,
+        "latency": args.latency,
+        "rate_429": args.rate_429,
+        "rate_5xx": args.rate_5xx,
+        "seed": args.stub_seed,
+    }
+
+
+def generation_options(args):
+    # SQL generation and semantic cache knobs; same keys as RunOptions
+    return {
+        "sql_candidates": args.sql_candidates,
+        "hedge": args.hedge,
+        "stream_llm": args.stream,
+        "semantic_cache_threshold": args.semantic_cache_threshold,
+        "semantic_cache_reuse_sql": args.semantic_cache_reuse_sql,
+    }
+
+
+def responder_options(args):
+    return {"wrong_rate": args.wrong_rate, "malformed_rate": args.malformed_rate, "replay_path": args.replay}
+
+
+def stub(args):
+    from Service.stub.LLMStubServer import LLMStubServer
+    from Service.stub.GoldSqlResponder import GoldSqlResponder
+
+    responder = GoldSqlResponder(**responder_options(args)) if args.gold else None
+    server = LLMStubServer(responder=responder, port=args.port, **stub_options(args))
+    print(f"Point the pipeline at it with: export OPENROUTER_API_URL={server.url}")
+    server.serve_forever()
+
+
+def memory_profiler(args):
+    from Util.MemoryProfiler import MemoryProfiler
+
+    return MemoryProfiler() if args.memory_profile else None
+
+
+def rag_build(args):
+    # UniversalRAG ( and numpy ) only load when a non-default build is asked for
+    if not args.compact_rag:
+        return None
+
+    from Service.UniversalRAG import UniversalRAG
+    return dict(UniversalRAG.COMPACT_BUILD)
+
+
+def loadtest(args):
+    from Service.stub.LoadGenerator import LoadGenerator
+
+    profiler = memory_profiler(args)
+
+    generator = LoadGenerator(
+        args.dataset,
+        args.items,
+        seed=args.seed,
+        url=args.url,
+        stub_options=stub_options(args),
+        responder_options=responder_options(args),
+        run_options={
+            "workers": args.workers,
+            **generation_options(args),
+            "model_routes": parse_routes(args.route),
+            "memory_db_budget": int(args.memory_db_mb * 1024 * 1024) if args.memory_db_mb else None,
+            "capture_path": args.capture,
+            "results_path": args.results,
+            "memory_profiler": profiler,
+            "rag_build": rag_build(args),
+            "persist_exec_memo": args.persist_memo,
+        },
+    )
+    report = generator.run()
+    if profiler:
+        profiler.close()
+
+    if args.report:
+        with open(args.report, "w", encoding="utf-8") as f:
+            f.write(report + "\n")
+
+
+def add_stub_arguments(cmd):
+    cmd.add_argument("--chunk-size", type=int, default=8)
+    cmd.add_argument("--chunk-delay", type=float, default=0.01)
+    cmd.add_argument("--latency", default=None, help="fixed:S, uniform:LO,HI or lognormal:MEDIAN,SIGMA seconds")
+    cmd.add_argument("--rate-429", type=float, default=0.0, help="share of requests answered 429")
+    cmd.add_argument("--rate-5xx", type=float, default=0.0, help="share of requests answered 503")
+    cmd.add_argument("--stub-seed", default="stub")
+    cmd.add_argument("--wrong-rate", type=float, default=0.0, help="share of SQL answers that run but are wrong")
+    cmd.add_argument("--malformed-rate", type=float, default=0.0, help="share of answers with nothing parseable")
+    cmd.add_argument("--replay", default=None, help="JSON lines of recorded completions {prompt_sha256, content}")
+
+
+def add_generation_arguments(cmd):
+    cmd.add_argument("--sql-candidates", type=int, default=1, help="> 1 generates that many SQL candidates at once")
+    cmd.add_argument("--hedge", action="store_true", help="add a backup candidate once one is slower than the LLM p95")
+    cmd.add_argument("--stream", action="store_true", help="stream completions and stop at the end of the answer")
+    cmd.add_argument("--semantic-cache-threshold", type=float, default=None, metavar="COSINE",
+                     help="reuse the linked schema of a near-duplicate question on the same database")
+    cmd.add_argument("--semantic-cache-reuse-sql", action="store_true",
+                     help="with --semantic-cache-threshold, also reuse the near-duplicate's SQL")
+
+
+def parse_shard(value):
+    # "i/n" -> (i, n)
+    try:
+        shard_index, num_shards = (int(part) for part in value.split("/"))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"expected INDEX/COUNT like 3/8, got '{value}'")
+
+    if num_shards < 1 or not 0 <= shard_index < num_shards:
+        raise argparse.ArgumentTypeError(f"shard index must be in [0, {num_shards}), got '{value}'")
+
+    return shard_index, num_shards
+
+
+def parse_job(value):
+    # "dataset:seed:items" -> (dataset, seed, items); the seed may itself contain ':'
+    try:
+        dataset_name, rest = value.split(":", 1)
+        seed, num_items = rest.rsplit(":", 1)
+        num_items = int(num_items)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"expected DATASET:SEED:ITEMS like bird:nightly:500, got '{value}'")
+
+    if dataset_name not in {"bird", "spider-1.0"}:
+        raise argparse.ArgumentTypeError(f"dataset must be bird or spider-1.0, got '{dataset_name}'")
+
+    return dataset_name, seed, num_items
+
+
+def parse_routes(specs):
+    from Util.ModelRouter import ModelRouter
+
+    return ModelRouter.parse(specs) if specs else None
+
+
+def run(args):
+    from Model.RunOptions import RunOptions
+
+    shard_index, num_shards = args.shard
+    options = RunOptions(
+        sample_mode=args.sample_mode,
+        schedule=args.schedule,
+        workers=args.workers,
+        shard_index=shard_index,
+        num_shards=num_shards,
+        shard_dir=args.shard_dir,
+        budget_usd=args.budget_usd,
+        budget_tokens=args.budget_tokens,
+        tokens_per_minute=args.tokens_per_minute,
+        ledger_path=args.ledger,
+        model_routes=parse_routes(args.route),
+        memory_db_budget=int(args.memory_db_mb * 1024 * 1024) if args.memory_db_mb else None,
+        indexed_eval=args.indexed_eval,
+        capture_path=args.capture,
+        bootstrap_replicates=args.bootstrap,
+        results_path=args.results,
+        memory_profiler=memory_profiler(args),
+        rag_build=rag_build(args),
+        persist_exec_memo=args.persist_memo,
+        **generation_options(args),
+    )
+
+    if args.dataset == "bird":
+        from Service.bird.BirdService import BirdService
+        BirdService.test_algo_on_bird_dataset(CommonUtil._get_api_key(), args.items, args.seed, options)
+    else:
+        from Service.spider.SpiderService import SpiderService
+        SpiderService.test_algo_on_spider_dataset(CommonUtil._get_api_key(), args.items, args.seed, options)
+
+    if options.memory_profiler:
+        options.memory_profiler.close()
+
+
+def multi(args):
+    from Service.impls.MultiDatasetRunner import MultiDatasetRunner
+
+    runner = MultiDatasetRunner(
+        CommonUtil._get_api_key(),
+        args.job,
+        args.out,
+        workers=args.workers,
+        pool_size=args.pool_size,
+        tokens_per_minute=args.tokens_per_minute,
+        run_options={
+            "model_routes": parse_routes(args.route),
+            "cooldown_seconds": args.cooldown,
+            "rag_build": rag_build(args),
+            "persist_exec_memo": args.persist_memo,
+            **generation_options(args),
+        },
+    )
+    runner.run()
+
+
+def merge(args):
+    from Service.impls.ShardResults import ShardResults
+
+    ShardResults.merge(args.paths, args.bootstrap)
+
+
+def advise(args):
+    from Service.impls.IndexAdvisor import IndexAdvisor
+    from Util.SqlLiteUtil import SqlLiteUtil
+
+    advisor = IndexAdvisor(
+        args.dataset,
+        SqlLiteUtil.load_sqlite_databases(args.dataset, base_path="Dataset"),
+        min_queries=args.min_queries,
+        max_indexes_per_db=args.max_indexes,
+        repeats=args.repeats,
+    )
+    manifest, measurements = advisor.run()
+    report = IndexAdvisor.report(manifest, measurements, top=args.top)
+
+    if args.report:
+        with open(args.report, "w", encoding="utf-8") as f:
+            f.write(report + "\n")
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="COSC 5600 Text-to-SQL tools")
+    parser.add_argument("--log-level", default=None, choices=["debug", "info", "warning", "error"],
+                        help="default info, or LOG_LEVEL")
+    parser.add_argument("--log-json", action="store_true", default=None, help="JSON lines logs ( or LOG_FORMAT=json )")
+    parser.add_argument("--log-file", default=None, help="write logs here instead of stdout")
+    parser.add_argument("--llm-rpm", type=int, default=None,
+                        help="LLM requests per minute shared by every local process ( or LLM_REQUESTS_PER_MINUTE )")
+    parser.add_argument("--llm-tpm", type=int, default=None,
+                        help="LLM tokens per minute shared by every local process ( or LLM_TOKENS_PER_MINUTE )")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    serve_cmd = commands.add_parser("serve", help="long-lived local service that keeps indexes warm")
+    serve_cmd.add_argument("--host", default="127.0.0.1")
+    serve_cmd.add_argument("--port", type=int, default=8765)
+    serve_cmd.add_argument("--max-concurrency", type=int, default=4)
+    serve_cmd.add_argument("--max-queue", type=int, default=64)
+    serve_cmd.add_argument("--top-k", type=int, default=5)
+    serve_cmd.add_argument("--warm", nargs="*", default=[], choices=["bird", "spider-1.0"],
+                           help="datasets to build before accepting requests")
+    serve_cmd.set_defaults(func=serve)
+
+    stub_cmd = commands.add_parser("stub", help="local OpenRouter-compatible stub ( JSON and SSE )")
+    stub_cmd.add_argument("--port", type=int, default=8766)
+    stub_cmd.add_argument("--gold", action="store_true", help="answer with the datasets' gold SQL ( plus noise )")
+    add_stub_arguments(stub_cmd)
+    stub_cmd.set_defaults(func=stub)
+
+    load_cmd = commands.add_parser("loadtest", help="full pipeline against the gold SQL stub; items/s and latency")
+    load_cmd.add_argument("dataset", choices=["bird", "spider-1.0"])
+    load_cmd.add_argument("--items", type=int, default=100)
+    load_cmd.add_argument("--seed", default="load-test")
+    load_cmd.add_argument("--workers", type=int, default=4)
+    add_generation_arguments(load_cmd)
+    load_cmd.add_argument("--route", action="append", default=[], metavar="STAGE=MODEL[,MODEL...]",
+                          help="escalation chain per stage, or cheap-first; repeatable")
+    load_cmd.add_argument("--memory-db-mb", type=float, default=None,
+                          help="serve hot databases from in-memory copies within this many MB")
+    load_cmd.add_argument("--capture", default=None,
+                          help="write plan and runtime of every evaluated statement here ( columnar JSON )")
+    load_cmd.add_argument("--results", default=None,
+                          help="append every scored item to this columnar results store ( directory )")
+    load_cmd.add_argument("--memory-profile", action="store_true",
+                          help="RSS and top allocations per stage, and the bytes of the main structures")
+    load_cmd.add_argument("--url", default=None, help="use this endpoint instead of an in-process stub")
+    load_cmd.add_argument("--report", default=None, help="also write the report to this file")
+    add_stub_arguments(load_cmd)
+    load_cmd.add_argument("--compact-rag", action="store_true",
+                          help="deduplicated, vocabulary-pruned float32 RAG index ( UniversalRAG.COMPACT_BUILD )")
+    load_cmd.add_argument("--persist-memo", action="store_true", help="keep execution results in Cache/exec_memo.sqlite for later runs")
+    load_cmd.set_defaults(func=loadtest)
+
+    run_cmd = commands.add_parser("run", help="evaluation run, optionally one shard of it")
+    run_cmd.add_argument("dataset", choices=["bird", "spider-1.0"])
+    run_cmd.add_argument("--items", type=int, default=25)
+    run_cmd.add_argument("--seed", default="fall-2025-cosc-5600-graduate-project-sapostu")
+    run_cmd.add_argument("--shard", type=parse_shard, default=(0, 1), metavar="INDEX/COUNT",
+                         help="only run this shard's share of the sample, e.g. 3/8")
+    run_cmd.add_argument("--shard-dir", default=None, help="write per-item results here for merge")
+    run_cmd.add_argument("--sample-mode", default="compat", choices=["compat", "hash"])
+    run_cmd.add_argument("--schedule", default="db_id", choices=["none", "db_id", "size_class"])
+    run_cmd.add_argument("--workers", type=int, default=1)
+    run_cmd.add_argument("--budget-usd", type=float, default=None, help="stop before spending more than this")
+    run_cmd.add_argument("--budget-tokens", type=int, default=None)
+    run_cmd.add_argument("--tokens-per-minute", type=int, default=None, help="target LLM token rate")
+    run_cmd.add_argument("--ledger", default=None, help="write the per-call token / cost ledger here ( JSON )")
+    run_cmd.add_argument("--route", action="append", default=[], metavar="STAGE=MODEL[,MODEL...]",
+                         help="escalation chain per stage, or cheap-first; repeatable")
+    run_cmd.add_argument("--memory-db-mb", type=float, default=None,
+                         help="serve hot databases from in-memory copies within this many MB")
+    run_cmd.add_argument("--indexed-eval", action="store_true",
+                         help="evaluate on the index advisor's scratch copies ( run advise first )")
+    run_cmd.add_argument("--capture", default=None,
+                         help="write plan and runtime of every evaluated statement here ( columnar JSON )")
+    run_cmd.add_argument("--results", default=None,
+                         help="append every scored item to this columnar results store ( directory )")
+    run_cmd.add_argument("--memory-profile", action="store_true",
+                         help="RSS and top allocations per stage, and the bytes of the main structures")
+    run_cmd.add_argument("--bootstrap", type=int, default=0, metavar="REPLICATES",
+                         help="bootstrap the metric CIs ( default: normal approximation )")
+    run_cmd.add_argument("--compact-rag", action="store_true",
+                         help="deduplicated, vocabulary-pruned float32 RAG index ( UniversalRAG.COMPACT_BUILD )")
+    run_cmd.add_argument("--persist-memo", action="store_true", help="keep execution results in Cache/exec_memo.sqlite for later runs")
+    add_generation_arguments(run_cmd)
+    run_cmd.set_defaults(func=run)
+
+    multi_cmd = commands.add_parser("multi", help="several dataset / seed runs at once, sharing RAG, memo and workers")
+    multi_cmd.add_argument("--job", type=parse_job, action="append", required=True, metavar="DATASET:SEED:ITEMS",
+                           help="one run; repeatable")
+    multi_cmd.add_argument("--out", default="Cache/multi", help="each job writes under OUT/<dataset>-<seed>/")
+    multi_cmd.add_argument("--workers", type=int, default=4, help="per job")
+    multi_cmd.add_argument("--pool-size", type=int, default=None, help="threads shared by all jobs ( default workers x jobs )")
+    multi_cmd.add_argument("--tokens-per-minute", type=int, default=None, help="target LLM token rate across all jobs")
+    multi_cmd.add_argument("--cooldown", type=float, default=5.0, help="seconds between schema linking and SQL generation")
+    multi_cmd.add_argument("--route", action="append", default=[], metavar="STAGE=MODEL[,MODEL...]",
+                           help="escalation chain per stage, or cheap-first; repeatable")
+    multi_cmd.add_argument("--compact-rag", action="store_true",
+                           help="deduplicated, vocabulary-pruned float32 RAG index ( UniversalRAG.COMPACT_BUILD )")
+    multi_cmd.add_argument("--persist-memo", action="store_true", help="keep execution results in Cache/exec_memo.sqlite for later runs")
+    add_generation_arguments(multi_cmd)
+    multi_cmd.set_defaults(func=multi)
+
+    advise_cmd = commands.add_parser("advise", help="index gold-query scans on scratch database copies")
+    advise_cmd.add_argument("dataset", choices=["bird", "spider-1.0"])
+    advise_cmd.add_argument("--min-queries", type=int, default=2, help="queries that must want an index")
+    advise_cmd.add_argument("--max-indexes", type=int, default=8, help="per database")
+    advise_cmd.add_argument("--repeats", type=int, default=3, help="timing runs per query ( best is kept )")
+    advise_cmd.add_argument("--top", type=int, default=20, help="queries listed in the report")
+    advise_cmd.add_argument("--report", default=None, help="also write the report to this file")
+    advise_cmd.set_defaults(func=advise)
+
+    merge_cmd = commands.add_parser("merge", help="merge shard result files and print the metrics")
+    merge_cmd.add_argument("paths", nargs="+", help="shard files or directories of them")
+    merge_cmd.add_argument("--bootstrap", type=int, default=0, metavar="REPLICATES",
+                           help="bootstrap the metric CIs ( default: normal approximation )")
+    merge_cmd.set_defaults(func=merge)
+
+    return parser
+
+
+def main():
+    args = build_parser().parse_args()
+    Log.configure(level=args.log_level, json_lines=args.log_json, path=args.log_file)
+    if args.llm_rpm or args.llm_tpm:
+        RateLimiter.configure(args.llm_rpm, args.llm_tpm)
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,3 @@
-from Service.spider.SpiderService import SpiderService
-from Service.bird.BirdService import BirdService
 from Util.CommonUtil import CommonUtil
 
 
@@ -31,9 +29,15 @@ def main():
     # PLEASE ONLY TEST ONE AT A TIME
     #
     # Uncomment the one you want to test; comment the other
+    #
+    # Services are imported here so only the one you run gets loaded
+    #
+    # Both datasets ( or several seeds ) at once: python Cli.py multi --job bird:SEED:25 --job spider-1.0:SEED:25
 
+    # from Service.bird.BirdService import BirdService
     # BirdService.test_algo_on_bird_dataset(LLM_API_KEY, NUM_ITEMS_TO_TEST, SEED)
 
+    from Service.spider.SpiderService import SpiderService
     SpiderService.test_algo_on_spider_dataset(LLM_API_KEY, NUM_ITEMS_TO_TEST, SEED)
     
     
@@ -4,6 +4,15 @@ from dataclasses import dataclass, field
 from typing import Any, Dict, List
 
 
+def _seeded_random(seed):
+    # Using SHA-256, we can create a deterministic number from the seed string
+    seed_bytes = seed.encode('utf-8')
+    hash_digest = hashlib.sha256(seed_bytes).hexdigest()
+    int_seed = int(hash_digest, 16)
+
+    return random.Random(int_seed)
+
+
 def deterministic_random_sample(data_list, seed, length):
 
     # Randomly choose 'length' amount of objects from data_list
@@ -18,14 +27,60 @@ def deterministic_random_sample(data_list, seed, length):
     if length > len(data_list):
         raise ValueError("length cannot be greater than size of data_list")
 
-    seed_bytes = seed.encode('utf-8')
-    hash_digest = hashlib.sha256(seed_bytes).hexdigest()
-    int_seed = int(hash_digest, 16)
-
-    rnd = random.Random(int_seed)
+    rnd = _seeded_random(seed)
     return rnd.sample(data_list, length)
 
 
+def deterministic_sample_indices(seed, population_size, length):
+
+    # The positions deterministic_random_sample() would pick, without the objects
+    #
+    # random.sample() only ever looks at len(population) and indexes into it, so sampling a range()
+    #   of the same size draws the same positions in the same order. A streaming loader can count
+    #   the records, ask for the positions, then build objects for those positions only
+
+    if length > population_size:
+        raise ValueError("length cannot be greater than size of data_list")
+
+    rnd = _seeded_random(seed)
+    return rnd.sample(range(population_size), length)
+
+
+def hash_sample_key(seed, sort_id):
+
+    # Sort key for keyed-hash sampling: the 'length' records with the smallest keys are the sample
+    #
+    # Needs no record count up front and only ever holds 'length' keys, so it works in one pass over
+    #   a file of any size. Not the same selection as deterministic_random_sample()
+
+    digest = hashlib.sha256(f"sample:{seed}:{sort_id}".encode("utf-8")).digest()
+    return int.from_bytes(digest[:8], "big")
+
+
+def shard_of(seed, sort_id, num_shards):
+
+    # Which shard ( 0 .. num_shards - 1 ) an item belongs to
+    #
+    # SHA-256 of "seed:sort_id", so every process on every machine agrees without talking to each
+    #   other, and an item stays in the same shard whatever else was sampled
+
+    digest = hashlib.sha256(f"{seed}:{sort_id}".encode("utf-8")).digest()
+    return int.from_bytes(digest[:8], "big") % num_shards
+
+
+def select_shard(data_list, seed, shard_index, num_shards):
+
+    # This shard's share of an already sampled list, in the same order
+    #
+    # Every shard draws the same deterministic_random_sample() first, so the union of all shards is
+    #   exactly the unsharded sample
+
+    if not 0 <= shard_index < num_shards:
+        raise ValueError(f"shard_index must be in [0, {num_shards}), got {shard_index}")
+
+    return [obj for obj in data_list if shard_of(seed, obj.sort_id, num_shards) == shard_index]
+
+
 @dataclass
 class DatasetTestObj:
     # Set on init
@@ -35,6 +90,7 @@ class DatasetTestObj:
     dev_question: str = ""
     dev_gold_sql: str = ""
     dev_gold_sql_output: str = ""
+    difficulty: str = ""        # Bird only: simple / moderate / challenging
 
     # Set before calling LLM
     rag_examples: List[Any] = field(default_factory=list)           # Python interpreter requires type definition
@@ -50,3 +106,4 @@ class DatasetTestObj:
     em: float = 0.0
     ex: float = 0.0
     partial_correctness: float = 0.0
+    outcome: str = ""           # EvaluationEngine.outcome(): gen_failed / gold_error / pred_error / wrong / correct
@@ -0,0 +1,99 @@
+from dataclasses import dataclass
+from typing import Any, Optional
+
+
+@dataclass
+class RunOptions:
+    # Optional knobs for a Spider/Bird run
+    #
+    # Main.py never passes these; the defaults keep the original sequential behaviour
+
+    # Util.ExecutionMemo.ExecutionMemo to reuse; None creates one for the run
+    exec_memo: Any = None
+
+    # Execution memo: the one created for the run also lives in Cache/exec_memo.sqlite, so later runs
+    #   start warm; False keeps it in memory for this run only
+    persist_exec_memo: bool = False
+
+    # SQL generation: > 1 fires that many candidates at once, first one that compiles wins
+    sql_candidates: int = 1
+
+    # SQL generation: start one candidate and only add backups once it is slower than the LLM p95
+    hedge: bool = False
+
+    # LLM calls: stream completions and stop reading once the list / statement is complete
+    stream_llm: bool = False
+
+    # Semantic cache: reuse the linked schema of a near-duplicate question on the same database when
+    #   TF-IDF cosine similarity >= threshold; None turns it off
+    semantic_cache_threshold: Optional[float] = None
+
+    # Semantic cache: also reuse the near-duplicate's SQL
+    semantic_cache_reuse_sql: bool = False
+
+    # Scheduling: "db_id" groups work by database, "size_class" runs the largest databases first,
+    #   "none" keeps the sampled order. Results are reported in sort_id order either way
+    schedule: str = "db_id"
+
+    # Workers for schema setup and evaluation; per-database caps come from LocalityScheduler
+    workers: int = 1
+
+    # Sampling: "compat" picks what deterministic_random_sample() always picked ( two passes over
+    #   dev.json ), "hash" is a one-pass keyed-hash selection for corpora too big to count twice
+    sample_mode: str = "compat"
+
+    # Sharding: this process only runs items with shard_of(seed, sort_id, num_shards) == shard_index
+    shard_index: int = 0
+    num_shards: int = 1
+
+    # Sharding: directory for this shard's per-item results ( ShardResults ); None writes nothing
+    shard_dir: Optional[str] = None
+
+    # Model routing: KEY stage, VALUE escalation chain ( Util.ModelRouter ); None = one model for all
+    model_routes: Optional[dict] = None
+
+    # Util.UsageLedger.UsageLedger to charge; None creates one for the run
+    ledger: Any = None
+
+    # Pause between schema linking and SQL generation for the API rate limit; once per run
+    cooldown_seconds: float = 5.0
+
+    # Budget: stop starting items once the next batch would not fit; None = no limit, 0 starts nothing
+    budget_usd: Optional[float] = None
+    budget_tokens: Optional[int] = None
+
+    # Budget: target LLM tokens per minute; calls wait while the last minute is over it
+    tokens_per_minute: Optional[int] = None
+
+    # Budget: write the full per-call ledger ( UsageLedger.write ) here
+    ledger_path: Optional[str] = None
+
+    # Evaluation: byte budget for in-memory copies of hot databases ( Util.MemoryDbCache ); None = off
+    memory_db_budget: Optional[int] = None
+
+    # Evaluation: run queries on the index advisor's verified scratch copies ( Service.impls.IndexAdvisor )
+    indexed_eval: bool = False
+
+    # Evaluation: capture plan, time, rows and VM steps of every executed statement ( Util.QueryCapture )
+    #   and write them here as columnar JSON; None captures nothing
+    capture_path: Optional[str] = None
+
+    # Reporting: bootstrap replicates for the metric CIs ( Util.EvaluationEngine ); 0 uses the normal
+    #   approximation from the running totals
+    bootstrap_replicates: int = 0
+
+    # Results: append every scored item to this columnar store ( Util.ResultsStore ); None writes nothing
+    results_path: Optional[str] = None
+
+    # Reporting: Util.MemoryProfiler.MemoryProfiler to record RSS and allocations per stage into, and
+    #   the bytes held by the RAG index, result sets and items; None records nothing
+    memory_profiler: Any = None
+
+    # Shared resources ( Service.impls.MultiDatasetRunner ): an initialized UniversalRAG for this dataset
+    #   and a ThreadPoolExecutor for setup and evaluation workers; None builds / starts this run's own
+    rag: Any = None
+    worker_pool: Any = None
+
+    # RAG: index build options ( Service.UniversalRAG.DEFAULT_BUILD keys, e.g. COMPACT_BUILD ); None is
+    #   the full-size index
+    rag_build: Optional[dict] = None
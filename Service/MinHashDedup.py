@@ -0,0 +1,109 @@
+import re
+import zlib
+
+import numpy as np
+
+
+class MinHashDedup:
+
+    # Near-duplicate (question, SQL) training pairs, found with MinHash and LSH banding
+    #
+    # Spider's train files repeat many questions with a word or two changed and the same SQL. Every
+    #   copy costs a row in the RAG index and, worse, they come back together as "different" few-shot
+    #   examples
+    #
+    # Each item becomes a set of shingles: word unigrams and bigrams of the question and of the
+    #   normalized SQL ( prefixed so the two never match each other ). Its MinHash signature is the
+    #   minimum of num_perm hash functions over those shingles; two signatures agree in a position
+    #   with probability equal to the sets' Jaccard similarity
+    #
+    # Signatures are cut into bands; items sharing a band ( and a db_id ) are candidates, and a
+    #   candidate pair is a duplicate when the exact Jaccard of its shingle sets is >= threshold.
+    #   With 16 bands of 4 rows a pair at 0.8 shares some band > 99.9% of the time; candidates below
+    #   the threshold cost one set comparison each and are dropped
+    #
+    # Duplicates are grouped transitively; the first item of each group ( training order ) is kept
+
+    # Hash functions h(x) = (a * x + b) mod PRIME over 32-bit shingle hashes; a * x + b fits in uint64
+    PRIME = np.uint64(4294967291)
+
+    _word_re = re.compile(r"\w+")
+
+    def __init__(self, threshold=0.8, num_perm=64, bands=16, seed=0):
+        if num_perm % bands:
+            raise ValueError(f"num_perm ({num_perm}) must be a multiple of bands ({bands})")
+
+        self.threshold = threshold
+        self.num_perm = num_perm
+        self.bands = bands
+
+        rng = np.random.default_rng(seed)
+        self._a = rng.integers(1, int(MinHashDedup.PRIME), size=num_perm, dtype=np.uint64)
+        self._b = rng.integers(0, int(MinHashDedup.PRIME), size=num_perm, dtype=np.uint64)
+
+    @staticmethod
+    def shingles(question, sql):
+        def grams(prefix, text):
+            words = MinHashDedup._word_re.findall(text.lower())
+            return {f"{prefix}{w}" for w in words} | {f"{prefix}{a} {b}" for a, b in zip(words, words[1:])}
+
+        return grams("q:", question or "") | grams("s:", sql or "")
+
+    def signature(self, shingles):
+        if not shingles:
+            return np.full(self.num_perm, MinHashDedup.PRIME, dtype=np.uint64)
+
+        # crc32, not hash(): str hashes change between processes and signatures must not
+        x = np.fromiter((zlib.crc32(s.encode("utf-8")) for s in shingles), dtype=np.uint64, count=len(shingles))
+
+        return ((self._a[:, None] * x[None, :] + self._b[:, None]) % MinHashDedup.PRIME).min(axis=1)
+
+    @staticmethod
+    def jaccard(a, b):
+        if not a or not b:
+            return 0.0
+
+        return len(a & b) / len(a | b)
+
+    def keep_indices(self, items, question_key="question", sql_key="SQL", db_key="db_id"):
+        # Indices of the items to keep ( first of each duplicate group ), in order
+
+        shingle_sets = [MinHashDedup.shingles(item[question_key], item[sql_key]) for item in items]
+        signatures = np.stack([self.signature(s) for s in shingle_sets]) if items else np.zeros((0, self.num_perm))
+
+        # Union-find over confirmed duplicate pairs; the root is always the smallest index
+        parent = list(range(len(items)))
+
+        def find(i):
+            while parent[i] != i:
+                parent[i] = parent[parent[i]]
+                i = parent[i]
+            return i
+
+        rows = self.num_perm // self.bands
+        checked = set()
+
+        for band in range(self.bands):
+            # KEY (db_id, band values), VALUE items seen with them so far
+            buckets = {}
+            for i, item in enumerate(items):
+                key = (item.get(db_key), signatures[i, band * rows:(band + 1) * rows].tobytes())
+                bucket = buckets.setdefault(key, [])
+
+                for j in bucket:
+                    if (j, i) in checked or find(i) == find(j):
+                        continue
+                    checked.add((j, i))
+
+                    if MinHashDedup.jaccard(shingle_sets[j], shingle_sets[i]) >= self.threshold:
+                        root_i, root_j = find(i), find(j)
+                        parent[max(root_i, root_j)] = min(root_i, root_j)
+
+                bucket.append(i)
+
+        return [i for i in range(len(items)) if find(i) == i]
+
+    def dedup(self, items, **keys):
+        # (kept items, number removed)
+        keep = self.keep_indices(items, **keys)
+        return [items[i] for i in keep], len(items) - len(keep)
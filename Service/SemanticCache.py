@@ -0,0 +1,203 @@
+import threading
+from collections import OrderedDict
+
+from Util.EvaluationUtil import EvaluationUtil
+from Util.SqlLiteUtil import SqlLiteUtil
+
+
+class SemanticCache:
+
+    # Near-duplicate question cache per database
+    #
+    # Lots of questions are paraphrases of each other on the same db_id:
+    #
+    #   "How many singers do we have?"  /  "How many singers are there?"
+    #
+    # Each one still pays for its own schema linking and SQL generation calls. UniversalRAG already
+    #   turns questions into TF-IDF vectors, so we keep the vectors of questions we answered per
+    #   database and reuse the linked schema ( and optionally the SQL ) of the closest one when the
+    #   cosine similarity is above the threshold
+    #
+    # Every lookup is recorded with its best similarity, hit or miss, so report() can show what hit
+    #   rate AND what accuracy other thresholds would have given on the same run
+
+    def __init__(self, rag, threshold=0.9, reuse_sql=False, max_entries=4096):
+        self.rag = rag
+        self.threshold = threshold
+        self.reuse_sql = reuse_sql
+        self.max_entries = max_entries
+
+        # KEY (db_id, sort_id), VALUE entry dict; least recently used first
+        self._entries = OrderedDict()
+
+        # KEY db_id, VALUE set of entry keys; only the target database's entries are compared
+        self._by_db = {}
+        self._lock = threading.Lock()
+
+        # Vectors computed at lookup time, reused by store(); KEY (db_id, sort_id)
+        self._vectors = {}
+
+        # KEY stage, VALUE list of observations {"sort_id", "similarity", "source", "hit"}
+        self.observations = {"schema_linking": [], "sql": []}
+
+        # KEY sort_id, VALUE {"fresh_ex", "reuse_ex", "similarity"}; filled by evaluate_reuse(). fresh_ex
+        #   is None for items whose SQL was reused: no fresh SQL was ever generated for them
+        self.reuse_outcomes = {}
+
+    @staticmethod
+    def _cosine(a, b):
+        # Both vectors are l2-normalized {term id: weight} dicts
+        if len(a) > len(b):
+            a, b = b, a
+
+        return sum(weight * b.get(term, 0.0) for term, weight in a.items())
+
+    def _best_match(self, db_id, vector, need_sql=False, exclude=None):
+        best, best_similarity = None, 0.0
+
+        for key in self._by_db.get(db_id, ()):
+            entry = self._entries[key]
+            if key == exclude or (need_sql and not entry["sql"]):
+                continue
+
+            similarity = self._cosine(vector, entry["vector"])
+            if similarity > best_similarity:
+                best, best_similarity = entry, similarity
+
+        return best, best_similarity
+
+    def _lookup(self, stage, obj, need_sql):
+        vector = self.rag.vectorize_question(obj.dev_question)
+
+        with self._lock:
+            entry, similarity = self._best_match(obj.dev_db_id, vector, need_sql, (obj.dev_db_id, obj.sort_id))
+            hit = entry is not None and similarity >= self.threshold
+
+            self.observations[stage].append({
+                "sort_id": obj.sort_id,
+                "similarity": similarity,
+                "source": entry,
+                "hit": hit,
+            })
+
+            if hit:
+                self._entries.move_to_end(entry["key"])
+
+            self._vectors[(obj.dev_db_id, obj.sort_id)] = vector
+
+        return entry if hit else None
+
+    def lookup_schema_linking(self, obj):
+        # Linked schema of a near-duplicate question on the same database, or None
+
+        entry = self._lookup("schema_linking", obj, need_sql=False)
+
+        return None if entry is None else list(entry["schema_linking"])
+
+    def lookup_sql(self, obj):
+        # SQL of a near-duplicate question on the same database, or None ( always None unless reuse_sql )
+
+        if not self.reuse_sql:
+            return None
+
+        entry = self._lookup("sql", obj, need_sql=True)
+
+        return None if entry is None else entry["sql"]
+
+    def store(self, obj):
+        # Remember an answered question; called after schema linking, and again after SQL generation
+
+        key = (obj.dev_db_id, obj.sort_id)
+        vector = self._vectors.pop(key, None) or self.rag.vectorize_question(obj.dev_question)
+
+        sql = obj.llm_returned_sql if obj.llm_returned_sql and not obj.llm_returned_sql.startswith("-- ERROR") else ""
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                vector = entry["vector"]
+            else:
+                entry = {"key": key, "question": obj.dev_question, "vector": vector}
+                self._entries[key] = entry
+                self._by_db.setdefault(obj.dev_db_id, set()).add(key)
+
+            entry["schema_linking"] = list(obj.schema_linking_tables)
+            entry["sql"] = sql
+            self._entries.move_to_end(key)
+
+            # LRU eviction across all databases
+            while len(self._entries) > self.max_entries:
+                evicted_key, _ = self._entries.popitem(last=False)
+                self._by_db[evicted_key[0]].discard(evicted_key)
+
+    def evaluate_reuse(self, obj_list, db_map, exec_memo=None):
+        # For every item that had ANY earlier question on its database, run that question's SQL on
+        #   this item's database and score it against this item's gold result
+        #
+        # That is the accuracy we would get by reusing it, whatever the threshold
+        #
+        # An item whose SQL came from the cache has obj.ex of the reused SQL, not of a fresh one; it
+        #   gets no fresh EX, or the fresh vs reuse delta would compare the reused SQL with itself
+
+        sql_hits = {observation["sort_id"] for observation in self.observations["sql"] if observation["hit"]}
+
+        best_source = {}
+        for stage in ("schema_linking", "sql"):
+            for observation in self.observations[stage]:
+                source = observation["source"]
+                if source is not None and source["sql"]:
+                    best_source[observation["sort_id"]] = (source, observation["similarity"])
+
+        for obj in obj_list:
+            if obj.sort_id not in best_source:
+                continue
+
+            source, similarity = best_source[obj.sort_id]
+            reused_result = SqlLiteUtil.run_sql_query_memo(source["sql"], db_map[obj.dev_db_id], exec_memo)
+
+            self.reuse_outcomes[obj.sort_id] = {
+                "similarity": similarity,
+                "fresh_ex": None if obj.sort_id in sql_hits else obj.ex,
+                "reuse_ex": EvaluationUtil.compute_ex(obj.dev_gold_sql_output, reused_result),
+            }
+
+    def report(self, thresholds=(0.6, 0.7, 0.8, 0.85, 0.9, 0.95)):
+        # Hit rates per stage, and EX with vs without reuse, for each candidate threshold
+
+        lines = [f"\n-----SEMANTIC CACHE ( threshold {self.threshold}, reuse_sql {self.reuse_sql} )-----"]
+
+        for stage, observations in self.observations.items():
+            if not observations:
+                continue
+
+            hits = sum(1 for o in observations if o["hit"])
+            lines.append(f"{stage}: {hits}/{len(observations)} hits ({hits / len(observations):.1%})")
+
+        schema_observations = self.observations["schema_linking"]
+        if schema_observations:
+            lines.append(f"\n{'threshold':>9} {'hit rate':>9} {'items':>6} {'fresh EX':>9} {'reuse EX':>9} {'delta':>7}")
+
+            for threshold in thresholds:
+                would_hit = [o for o in schema_observations if o["similarity"] >= threshold]
+                hit_rate = len(would_hit) / len(schema_observations)
+
+                # Items that would have hit AND whose source SQL we could score AND that have a fresh EX
+                outcomes = [
+                    self.reuse_outcomes[o["sort_id"]] for o in would_hit
+                    if o["sort_id"] in self.reuse_outcomes and self.reuse_outcomes[o["sort_id"]]["fresh_ex"] is not None
+                ]
+                if outcomes:
+                    fresh = sum(o["fresh_ex"] for o in outcomes) / len(outcomes)
+                    reuse = sum(o["reuse_ex"] for o in outcomes) / len(outcomes)
+                    lines.append(f"{threshold:>9} {hit_rate:>9.1%} {len(outcomes):>6} {fresh:>9.3f} {reuse:>9.3f} {reuse - fresh:>+7.3f}")
+                else:
+                    lines.append(f"{threshold:>9} {hit_rate:>9.1%} {0:>6} {'-':>9} {'-':>9} {'-':>7}")
+
+            reused = sum(1 for outcome in self.reuse_outcomes.values() if outcome["fresh_ex"] is None)
+            if reused:
+                lines.append(f"{reused} items reused SQL and have no fresh EX; they are left out of the EX columns")
+
+        report = "\n".join(lines)
+        print(report)
+
+        return report
@@ -0,0 +1,173 @@
+import json
+import os
+import re
+from collections import Counter
+
+import numpy as np
+
+
+class TfidfIndex:
+
+    # Inverted TF-IDF index that answers queries with numpy only
+    #
+    # sklearn is only needed to FIT the vectorizer. Once fitted, a query vector is just
+    #   "count the vocabulary tokens, multiply by idf, l2-normalize", and the training rows are already
+    #   l2-normalized, so cosine similarity is a dot product
+    #
+    # Stored column-major (one postings list per term), so a query only touches the rows that share
+    #   at least one term with it
+    #
+    # Saved next to the training items by UniversalRAG; loading it skips importing sklearn entirely
+    #
+    # compact=True stores weights and idf as float32 and postings as int32: half the bytes, and
+    #   scores still accumulate in float64
+
+    FILENAME = "tfidf.npz"
+    VOCAB_FILENAME = "vocabulary.json"
+
+    def __init__(self, vocabulary, idf, indptr, rows, weights, num_rows, token_pattern, lowercase=True):
+        # KEY term, VALUE column id
+        self.vocabulary = vocabulary
+        self.idf = idf
+
+        # Postings of term t are rows[indptr[t]:indptr[t + 1]] with weights[indptr[t]:indptr[t + 1]]
+        self.indptr = indptr
+        self.rows = rows
+        self.weights = weights
+
+        self.num_rows = num_rows
+        self.token_pattern = token_pattern
+        self.lowercase = lowercase
+        self._token_re = re.compile(token_pattern)
+
+    @classmethod
+    def from_sklearn(cls, vectorizer, matrix, compact=False):
+        # Convert a fitted TfidfVectorizer and its training matrix
+        csc = matrix.tocsc()
+        csc.sort_indices()
+
+        vocabulary = {term: int(col) for term, col in vectorizer.vocabulary_.items()}
+
+        # int32 postings as long as they can address every row and posting
+        float_dtype = np.float32 if compact else np.float64
+        index_dtype = np.int32 if compact and max(matrix.shape[0], csc.nnz) < 2 ** 31 else np.int64
+
+        return cls(
+            vocabulary,
+            np.asarray(vectorizer.idf_, dtype=float_dtype),
+            csc.indptr.astype(index_dtype),
+            csc.indices.astype(index_dtype),
+            csc.data.astype(float_dtype),
+            matrix.shape[0],
+            vectorizer.token_pattern,
+            vectorizer.lowercase,
+        )
+
+    def transform(self, text):
+        # Same analyzer as sklearn's default: lowercase, r"(?u)\b\w\w+\b" tokens, unigram counts
+        #
+        # Stop words never made it into the vocabulary, so dropping out-of-vocabulary tokens
+        #   also drops them
+
+        if self.lowercase:
+            text = text.lower()
+
+        counts = Counter(
+            self.vocabulary[token] for token in self._token_re.findall(text) if token in self.vocabulary
+        )
+        if not counts:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float64)
+
+        term_ids = np.fromiter(sorted(counts), dtype=np.int64)
+        weights = np.array([counts[t] for t in term_ids], dtype=np.float64) * self.idf[term_ids]
+
+        return term_ids, weights / np.linalg.norm(weights)
+
+    def scores(self, text):
+        # Cosine similarity between the text and every training row
+        #
+        # The query terms' postings go through one bincount: one index conversion for int32 postings
+        #   instead of one per term, and each row still sums its terms in query order
+        term_ids, weights = self.transform(text)
+        if not len(term_ids):
+            return np.zeros(self.num_rows)
+
+        spans = list(zip(self.indptr[term_ids], self.indptr[term_ids + 1]))
+        rows = np.concatenate([self.rows[start:end] for start, end in spans])
+        contributions = np.concatenate([weight * self.weights[start:end] for weight, (start, end) in zip(weights, spans)])
+
+        return np.bincount(rows, weights=contributions, minlength=self.num_rows)
+
+    def subset(self, rows):
+        # Index over only the given training rows ( sorted, unique ), renumbered 0..len(rows) - 1
+        #
+        # Postings of the other rows are dropped, so scoring the subset costs its own postings, not
+        #   the whole index's. Vocabulary and idf are shared with this index
+
+        position = np.full(self.num_rows, -1, dtype=np.int64)
+        position[rows] = np.arange(len(rows))
+
+        new_rows = position[self.rows]
+        keep = new_rows >= 0
+
+        term_of_posting = np.repeat(np.arange(len(self.idf)), np.diff(self.indptr))
+        indptr = np.zeros(len(self.idf) + 1, dtype=self.indptr.dtype)
+        np.cumsum(np.bincount(term_of_posting[keep], minlength=len(self.idf)), out=indptr[1:])
+
+        return TfidfIndex(
+            self.vocabulary,
+            self.idf,
+            indptr,
+            new_rows[keep].astype(self.rows.dtype),
+            self.weights[keep],
+            len(rows),
+            self.token_pattern,
+            self.lowercase,
+        )
+
+    def typicality(self):
+        # Dot product of every row with the centroid of all rows
+        term_of_posting = np.repeat(np.arange(len(self.idf)), np.diff(self.indptr))
+
+        centroid = np.bincount(term_of_posting, weights=self.weights, minlength=len(self.idf)) / max(self.num_rows, 1)
+
+        return np.bincount(self.rows, weights=self.weights * centroid[term_of_posting], minlength=self.num_rows)
+
+    def nbytes(self):
+        return self.idf.nbytes + self.indptr.nbytes + self.rows.nbytes + self.weights.nbytes
+
+    def save(self, index_dir):
+        os.makedirs(index_dir, exist_ok=True)
+
+        np.savez(
+            os.path.join(index_dir, self.FILENAME),
+            idf=self.idf,
+            indptr=self.indptr,
+            rows=self.rows,
+            weights=self.weights,
+            num_rows=np.array([self.num_rows]),
+        )
+
+        with open(os.path.join(index_dir, self.VOCAB_FILENAME), "w", encoding="utf-8") as f:
+            json.dump({
+                "token_pattern": self.token_pattern,
+                "lowercase": self.lowercase,
+                "vocabulary": self.vocabulary,
+            }, f)
+
+    @classmethod
+    def load(cls, index_dir):
+        with open(os.path.join(index_dir, cls.VOCAB_FILENAME), "r", encoding="utf-8") as f:
+            meta = json.load(f)
+
+        with np.load(os.path.join(index_dir, cls.FILENAME)) as arrays:
+            return cls(
+                meta["vocabulary"],
+                arrays["idf"],
+                arrays["indptr"],
+                arrays["rows"],
+                arrays["weights"],
+                int(arrays["num_rows"][0]),
+                meta["token_pattern"],
+                meta["lowercase"],
+            )
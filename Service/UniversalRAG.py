@@ -1,8 +1,13 @@
 import json
 import os
+import threading
 
-from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.metrics.pairwise import cosine_similarity
+import numpy as np
+
+from Service.TfidfIndex import TfidfIndex
+
+# sklearn is imported inside build_index() and retrieve(); when a persisted index is loaded it is
+#   never imported at all
 
 
 class UniversalRAG:
@@ -25,9 +30,27 @@ class UniversalRAG:
     # This is also adaptable to whether you are using BIRD or Spider 1.0 datasets; no excessive code waste
 
 
-    def __init__(self, dataset_root: str, dataset_name: str):
+    # Index build options ( build_options= ); the defaults are the original full-size index
+    #
+    #   dedup_threshold : drop (question, SQL) pairs whose shingle Jaccard with an earlier pair on the
+    #                     same database is at least this ( Service.MinHashDedup ); None keeps all
+    #   min_df          : ignore terms in fewer training questions than this
+    #   max_features    : keep only this many most frequent terms; None is unbounded
+    #   compact         : float32 weights and int32 postings instead of float64 / int64
+    DEFAULT_BUILD = {"dedup_threshold": None, "min_df": 1, "max_features": None, "compact": False}
+
+    # Smaller index with fewer near-identical few-shot examples
+    COMPACT_BUILD = {"dedup_threshold": 0.8, "min_df": 2, "max_features": 20000, "compact": True}
+
+    def __init__(self, dataset_root: str, dataset_name: str, index_dir=None, build_options=None):
         # Directory containing the passed dataset's json files
         self.dataset_root = dataset_root
+
+        # How the index is built; a persisted index built with other options is rebuilt
+        self.build_options = {**UniversalRAG.DEFAULT_BUILD, **(build_options or {})}
+
+        # Where the built index is persisted; None means always rebuild in memory
+        self.index_dir = index_dir
         
         # The dataset you are using
         self.dataset_name = dataset_name.lower().strip()
@@ -45,6 +68,32 @@ class UniversalRAG:
         self.vectorizer = None
         self.question_vectors = None
 
+        # Numpy-only inverted index; used instead of the two above when loaded from index_dir
+        self.tfidf_index = None
+
+        # Schemas of the databases we retrieve FOR; BIRD keeps its dev databases in a separate file
+        #   from the training ones, Spider 1.0 keeps them all in tables.json
+        self.target_schemas = {}
+
+        # Training matrix partitions; KEY db_id, VALUE sorted numpy array of row indices
+        self.partitions = {}
+
+        # Per row db code, lets the schema score be looked up per database instead of per row
+        self.row_db_codes = None
+        self.db_codes = []
+
+        # Schema-overlap clusters of training databases; KEY cluster id, VALUE list of db_ids
+        self.clusters = {}
+        self.db_cluster = {}
+
+        # Small global fallback that is always scored next to the partitions
+        self.global_fallback_rows = None
+
+        # Candidate rows and their sliced matrix per target db_id; keeps hot partitions ready. retrieve()
+        #   runs on worker threads, so lookups, stores and evictions all go through the lock
+        self._candidate_cache = {}
+        self._candidate_lock = threading.Lock()
+
         # Flag to check if index + schema have been built
         self.ready = False
 
@@ -59,12 +108,10 @@ class UniversalRAG:
                 self.train_items = json.load(f)
 
         elif self.dataset_name == "spider-1.0":
-            spider_files = ["train_spider.json", "train_others.json"]
             combined = []
 
             # Builds a full file path for each JSON file inside the dataset folder.
-            for filename in spider_files:
-                path = os.path.join(self.dataset_root, filename)
+            for path in self._train_files():
                 if os.path.exists(path):
                     with open(path, "r") as f:
                         combined.extend(json.load(f))
@@ -81,9 +128,40 @@ class UniversalRAG:
             # Wrong string or a dataset not supported for this project
             raise ValueError(f"Unsupported dataset: {self.dataset_name}")
 
+        # Near-duplicate pairs add rows but no new examples
+        if self.build_options["dedup_threshold"] is not None:
+            from Service.MinHashDedup import MinHashDedup
+
+            self.train_items, removed = MinHashDedup(self.build_options["dedup_threshold"]).dedup(self.train_items)
+            print(f"Dropped {removed} near-duplicate training pairs; {len(self.train_items)} left.")
+
         # Store only questions for vector index
         self.train_questions = [item["question"] for item in self.train_items]
 
+    def _train_files(self):
+        # Training files per dataset; also what a persisted index is checked against
+        if self.dataset_name == "bird":
+            filenames = ["train.json"]
+
+        elif self.dataset_name == "spider-1.0":
+            filenames = ["train_spider.json", "train_others.json"]
+
+        else:
+            # Wrong string or a dataset not supported for this project
+            raise ValueError(f"Unsupported dataset: {self.dataset_name}")
+
+        return [os.path.join(self.dataset_root, filename) for filename in filenames]
+
+    def _source_fingerprint(self):
+        # Name, size and mtime of each training file; a persisted index built from other files is stale
+        fingerprint = []
+        for path in self._train_files():
+            if os.path.exists(path):
+                stat = os.stat(path)
+                fingerprint.append([os.path.basename(path), stat.st_size, stat.st_mtime_ns])
+
+        return fingerprint
+
     # Load table and column names for all databases
     def load_rag_schema(self):
         
@@ -91,10 +169,24 @@ class UniversalRAG:
         filename = "train_tables.json" if self.dataset_name == "bird" else "tables.json"
         path = os.path.join(self.dataset_root, filename)
 
+        self.schemas = self._read_schema_file(path)
+
+        # Target databases are the training ones plus BIRD's dev databases when present
+        self.target_schemas = dict(self.schemas)
+        dev_path = os.path.join(self.dataset_root, "dev_tables.json")
+        if self.dataset_name == "bird" and os.path.exists(dev_path):
+            self.target_schemas.update(self._read_schema_file(dev_path))
+
+    @staticmethod
+    def _read_schema_file(path):
+        # Read a *tables.json file into KEY db_id, VALUE {"tables": set, "columns": set}
+
         # Open the file and load json
         with open(path, "r") as f:
             raw = json.load(f)
 
+        schemas = {}
+
         # BIRD and Spider 1.0 jsons are not uniform; need to process accordingly
         for entry in raw:
             db_id = entry["db_id"]
@@ -102,10 +194,12 @@ class UniversalRAG:
             table_names = {name.lower() for name in entry["table_names_original"]}
             col_names = {col[1].lower() for col in entry["column_names_original"]}
 
-            self.schemas[db_id] = {
+            schemas[db_id] = {
                 "tables": table_names,
                 "columns": col_names,
             }
+
+        return schemas
             
     # Build the semantic index using TF-IDF
     def build_index(self):
@@ -117,10 +211,186 @@ class UniversalRAG:
         #
         # With everything in vector form, we can compare questions numerically to find the closest matches
 
-        self.vectorizer = TfidfVectorizer(stop_words="english")
+        from sklearn.feature_extraction.text import TfidfVectorizer
+
+        self.vectorizer = TfidfVectorizer(
+            stop_words="english",
+            min_df=self.build_options["min_df"],
+            max_features=self.build_options["max_features"],
+            dtype=np.float32 if self.build_options["compact"] else np.float64,
+        )
         self.question_vectors = self.vectorizer.fit_transform(self.train_questions)
 
-        print(f"Indexed {len(self.train_questions)} questions.")
+        index = TfidfIndex.from_sklearn(self.vectorizer, self.question_vectors, compact=self.build_options["compact"])
+        print(f"Indexed {len(self.train_questions)} questions ( {len(index.vocabulary)} terms, "
+              f"{index.nbytes() / 1e6:.2f} MB ).")
+
+    def save_index(self, index_dir):
+        # Persist the fitted index and the training items it was built from
+
+        TfidfIndex.from_sklearn(self.vectorizer, self.question_vectors, compact=self.build_options["compact"]).save(index_dir)
+
+        with open(os.path.join(index_dir, "train_items.json"), "w", encoding="utf-8") as f:
+            json.dump(self.train_items, f)
+
+        with open(os.path.join(index_dir, "meta.json"), "w", encoding="utf-8") as f:
+            json.dump({
+                "dataset_name": self.dataset_name,
+                "source_fingerprint": self._source_fingerprint(),
+                "build_options": self.build_options,
+                "num_rows": len(self.train_items),
+            }, f)
+
+        print(f"Saved RAG index to {index_dir}")
+
+    def load_index(self, index_dir):
+        # Load a persisted index; returns False when there is none or it is stale
+
+        meta_path = os.path.join(index_dir, "meta.json")
+        if not os.path.exists(meta_path):
+            return False
+
+        with open(meta_path, "r", encoding="utf-8") as f:
+            meta = json.load(f)
+
+        # Indexes saved before build options existed were built with the defaults
+        built_with = {**UniversalRAG.DEFAULT_BUILD, **meta.get("build_options", {})}
+
+        if (meta.get("dataset_name") != self.dataset_name or meta.get("source_fingerprint") != self._source_fingerprint()
+                or built_with != self.build_options):
+            print(f"RAG index at {index_dir} is stale; rebuilding...")
+            return False
+
+        with open(os.path.join(index_dir, "train_items.json"), "r", encoding="utf-8") as f:
+            self.train_items = json.load(f)
+
+        self.train_questions = [item["question"] for item in self.train_items]
+        self.tfidf_index = TfidfIndex.load(index_dir)
+
+        print(f"Loaded RAG index with {len(self.train_items)} questions from {index_dir}")
+        return True
+
+    # Split the training matrix by db_id and group databases by schema overlap
+    def build_partitions(self, cluster_threshold=0.3, fallback_size=200):
+
+        # Scoring every training question for every dev question wastes most of the work; the few
+        #   examples that matter almost always come from databases that look like the target one
+        #
+        # Partition rows by db_id, then cluster the databases themselves by how much their table and
+        #   column names overlap (Jaccard). Spider and BIRD test cross-database, so the dev db is
+        #   never in train; the clusters are how we find "databases like this one"
+
+        rows_per_db = {}
+        for i, item in enumerate(self.train_items):
+            rows_per_db.setdefault(item["db_id"], []).append(i)
+
+        self.db_codes = sorted(rows_per_db)
+        code_of = {db_id: code for code, db_id in enumerate(self.db_codes)}
+
+        self.row_db_codes = np.empty(len(self.train_items), dtype=np.int32)
+        self.partitions = {}
+        for db_id, rows in rows_per_db.items():
+            self.partitions[db_id] = np.asarray(rows, dtype=np.int64)
+            self.row_db_codes[rows] = code_of[db_id]
+
+        # Greedy leader clustering; deterministic because db_ids are visited in sorted order
+        #
+        #   leader "concert_singer" {singer, concert, stadium, ...}
+        #   "singer" overlaps enough -> joins; "flight_1" does not -> new cluster
+        self.clusters = {}
+        self.db_cluster = {}
+        leaders = []
+        for db_id in self.db_codes:
+            terms = self._schema_terms(self.schemas.get(db_id))
+
+            for cluster_id, leader_terms in leaders:
+                if self._jaccard(terms, leader_terms) >= cluster_threshold:
+                    break
+            else:
+                cluster_id = len(leaders)
+                leaders.append((cluster_id, terms))
+
+            self.clusters.setdefault(cluster_id, []).append(db_id)
+            self.db_cluster[db_id] = cluster_id
+
+        # Global fallback: the questions closest to the centroid of the whole matrix, i.e. the most
+        #   "typical" ones; they keep retrieval sane when the partitions are a bad fit
+        fallback_size = min(fallback_size, len(self.train_items))
+        if self.question_vectors is not None:
+            centroid = np.asarray(self.question_vectors.mean(axis=0)).ravel()
+            typicality = self.question_vectors @ centroid
+        else:
+            typicality = self.tfidf_index.typicality()
+        self.global_fallback_rows = np.sort(np.argsort(-typicality, kind="stable")[:fallback_size])
+
+        with self._candidate_lock:
+            self._candidate_cache = {}
+
+        print(f"Partitioned {len(self.train_items)} questions into {len(self.partitions)} databases "
+              f"and {len(self.clusters)} schema clusters.")
+
+    @staticmethod
+    def _schema_terms(schema):
+        # Table and column names of one schema; '*' is in every Spider schema so it carries no signal
+        if not schema:
+            return set()
+
+        return (schema["tables"] | schema["columns"]) - {"*"}
+
+    @staticmethod
+    def _jaccard(a, b):
+        if not a or not b:
+            return 0.0
+
+        return len(a & b) / len(a | b)
+
+    def candidate_rows(self, db_id, min_overlap=0.05, max_clusters=3, cache_size=64):
+        # ( row indices worth scoring for a question about db_id, their sliced matrix or sub-index );
+        #   ( None, None ) means "scan everything". Both come from one lookup, so an eviction by another
+        #   thread can't separate them
+
+        if db_id is None or db_id not in self.target_schemas:
+            return None, None
+
+        with self._candidate_lock:
+            cached = self._candidate_cache.get(db_id)
+        if cached is not None:
+            return cached
+
+        # Rank clusters by the best overlap any member database has with the target schema
+        target_terms = self._schema_terms(self.target_schemas[db_id])
+        cluster_overlap = {}
+        for train_db_id in self.db_codes:
+            overlap = self._jaccard(target_terms, self._schema_terms(self.schemas.get(train_db_id)))
+            cluster_id = self.db_cluster[train_db_id]
+
+            if overlap >= min_overlap and overlap > cluster_overlap.get(cluster_id, 0.0):
+                cluster_overlap[cluster_id] = overlap
+
+        best_clusters = sorted(cluster_overlap, key=lambda c: (-cluster_overlap[c], c))[:max_clusters]
+
+        # Same database in train (in-domain use) is always a candidate
+        chosen_dbs = {db_id} if db_id in self.partitions else set()
+        for cluster_id in best_clusters:
+            chosen_dbs.update(self.clusters[cluster_id])
+
+        parts = [self.partitions[d] for d in chosen_dbs] + [self.global_fallback_rows]
+        rows = np.unique(np.concatenate(parts))
+
+        # Keep the sliced matrix ( or, for a loaded index, the sub-index ) next to the rows so repeated
+        #   questions on the db skip the slicing and only score the candidates
+        if self.question_vectors is not None:
+            matrix = self.question_vectors[rows]
+        else:
+            matrix = self.tfidf_index.subset(rows)
+
+        # Two threads may both build the same entry; either one is correct, the second just replaces it
+        with self._candidate_lock:
+            if db_id not in self._candidate_cache and len(self._candidate_cache) >= cache_size:
+                self._candidate_cache.pop(next(iter(self._candidate_cache)))
+            self._candidate_cache[db_id] = (rows, matrix)
+
+        return rows, matrix
 
     # Function to init everything; only needs to be called once
     def initialize(self):
@@ -128,10 +398,18 @@ class UniversalRAG:
         if self.ready:
             return
 
-        # Load data, schema, and build index
-        self.load_train()
+        # Schemas are small json files; always read them
         self.load_rag_schema()
-        self.build_index()
+
+        # Load data and build index, unless a persisted one from the same training files exists
+        if not (self.index_dir and self.load_index(self.index_dir)):
+            self.load_train()
+            self.build_index()
+
+            if self.index_dir:
+                self.save_index(self.index_dir)
+
+        self.build_partitions()
 
         self.ready = True
 
@@ -154,37 +432,33 @@ class UniversalRAG:
         return len(col_match) + 0.5 * len(table_match)
 
     # Our main entry point; this is the function that effectively 'runs' everything
-    def retrieve(self, question, k):
+    def retrieve(self, question, k, db_id=None):
         
         # Entry point can't run on a object that hasn't been initialized
         if not self.ready:
             raise RuntimeError("UniversalRAG must be initialized before running retrieve().")
 
-        # Convert our passed question into TF-IDF vector; benefits of this listed earlier; can elaborate
-        #   much more if needed
-        vector = self.vectorizer.transform([question])
-
-        # Compute semantic similarity between passed question and all training questions
-        semantic_scores = cosine_similarity(vector, self.question_vectors).flatten()
+        # Only score the partitions that overlap the target database; no db_id means full scan
+        rows, matrix = self.candidate_rows(db_id)
 
-        # List to store final ranking of training items
-        ranking = []
-        
-        # Loop
-        for i, sem in enumerate(semantic_scores):
+        # Compute semantic similarity between passed question and the candidate training questions
+        semantic_scores = self._semantic_scores(question, matrix)
+        if rows is None:
+            rows = np.arange(len(self.train_items))
 
-            # For each training item, get item and its DB ID
-            item = self.train_items[i]
-            db_id = item["db_id"]
+        # Schema relevance only depends on the training item's database, so compute it once per
+        #   database and spread it over the rows
+        row_codes = self.row_db_codes[rows]
+        schema_rel = np.zeros(len(self.db_codes))
+        for code in np.unique(row_codes):
+            schema_rel[code] = self.rag_schema_score(question, self.db_codes[code])
 
-            # Compute final score for the question's DB then add
-            schema_rel = self.rag_schema_score(question, db_id)
-            final_score = float(sem) + 0.1 * schema_rel
-            ranking.append((final_score, i))
+        # Compute final score for every candidate row
+        final_scores = semantic_scores + 0.1 * schema_rel[row_codes]
 
-        # Sort by final score descending and grab top k
-        ranking.sort(key=lambda x: x[0], reverse=True)
-        top = ranking[:k]
+        # Sort by final score descending and grab top k; stable so ties keep training order
+        order = np.argsort(-final_scores, kind="stable")[:k]
+        top = [(float(final_scores[j]), int(rows[j])) for j in order]
 
         # Build results
         results = []
@@ -206,7 +480,38 @@ class UniversalRAG:
         # Return
         return results
 
-    def run_rag(self, question, k):
+    def _semantic_scores(self, question, matrix=None):
+        # matrix is the candidate slice from candidate_rows(); None scores every training question
+
+        # Loaded from disk: numpy-only inverted index, sklearn is never imported
+        if self.vectorizer is None:
+            index = self.tfidf_index if matrix is None else matrix
+            return index.scores(question)
+
+        from sklearn.metrics.pairwise import cosine_similarity
+
+        # Convert our passed question into TF-IDF vector; benefits of this listed earlier; can elaborate
+        #   much more if needed
+        vector = self.vectorizer.transform([question])
+        if matrix is None:
+            matrix = self.question_vectors
+
+        return cosine_similarity(vector, matrix).flatten()
+
+    def vectorize_question(self, question):
+        # TF-IDF vector of a question as {term id: weight}, l2-normalized; used by SemanticCache
+
+        if self.vectorizer is None:
+            term_ids, weights = self.tfidf_index.transform(question)
+        else:
+            row = self.vectorizer.transform([question])
+            term_ids, weights = row.indices, row.data
+
+        return dict(zip(term_ids.tolist(), weights.tolist()))
+
+    def run_rag(self, question, k, db_id=None):
         
         # Get RAG per question and number, k, of examples you want
-        return self.retrieve(question, k)
+        #
+        # Pass the question's db_id to only score partitions whose schemas overlap it
+        return self.retrieve(question, k, db_id)
@@ -1,19 +1,52 @@
-from Service.UniversalRAG import UniversalRAG
+import hashlib
+import json
+
+from Util.CommonUtil import CommonUtil
 
 class GetRag:
+
+    # UniversalRAG is imported on first use; numpy/sklearn only load for runs that actually retrieve
+    #
+    # The built index is persisted under Cache/rag_index/<dataset>; later runs load it without sklearn
+    #
+    # build_options ( UniversalRAG.DEFAULT_BUILD keys ) other than the defaults persist to their own
+    #   Cache/rag_index/<dataset>-<hash>, so switching between builds does not rebuild every time
+
+    @staticmethod
+    def index_dir(dataset_name, build_options=None):
+        from Service.UniversalRAG import UniversalRAG
+
+        options = {**UniversalRAG.DEFAULT_BUILD, **(build_options or {})}
+        if options == UniversalRAG.DEFAULT_BUILD:
+            return CommonUtil.get_cache_dir("rag_index", dataset_name)
+
+        digest = hashlib.sha256(json.dumps(options, sort_keys=True).encode("utf-8")).hexdigest()[:10]
+        return CommonUtil.get_cache_dir("rag_index", f"{dataset_name}-{digest}")
     
     @staticmethod
-    def get_bird_rag():
+    def get_bird_rag(build_options=None):
+        from Service.UniversalRAG import UniversalRAG
 
-        rag = UniversalRAG(dataset_root="Dataset/bird", dataset_name="bird")
+        rag = UniversalRAG(
+            dataset_root="Dataset/bird",
+            dataset_name="bird",
+            index_dir=GetRag.index_dir("bird", build_options),
+            build_options=build_options,
+        )
         rag.initialize()
 
         return rag
     
     @staticmethod
-    def get_spider_rag():
+    def get_spider_rag(build_options=None):
+        from Service.UniversalRAG import UniversalRAG
 
-        rag = UniversalRAG(dataset_root="Dataset/spider-1.0", dataset_name="spider-1.0")
+        rag = UniversalRAG(
+            dataset_root="Dataset/spider-1.0",
+            dataset_name="spider-1.0",
+            index_dir=GetRag.index_dir("spider-1.0", build_options),
+            build_options=build_options,
+        )
         rag.initialize()
 
         return rag
\ No newline at end of file
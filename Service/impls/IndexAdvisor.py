@@ -0,0 +1,381 @@
+import json
+import os
+import re
+import sqlite3
+import time
+from collections import Counter
+
+from Service.impls.LoadDevJson import LoadDevJson
+from Util.CommonUtil import CommonUtil
+from Util.SqlLiteUtil import SqlLiteUtil
+from Util.Log import Log
+
+
+class IndexAdvisor:
+
+    # Indexes for the evaluation queries, built on scratch copies of the databases
+    #
+    # Gold and predicted SQL filter and join on columns the dataset files never indexed, so on the
+    #   big Bird databases evaluation is mostly full table scans. The advisor:
+    #
+    #   1. runs EXPLAIN QUERY PLAN on every gold query of dev.json
+    #   2. for each SCAN of a table, takes the columns the query compares ( =, <, >, IN, BETWEEN,
+    #      join keys ) on that table; for each AUTOMATIC INDEX, the columns SQLite indexed itself
+    #   3. keeps the ( table, columns ) candidates that at least min_queries queries want
+    #   4. copies the database into Cache/index_advisor/<dataset>/ ( backup API ) and creates them there
+    #   5. re-runs every affected gold query on the original and on the copy: results must match as
+    #      multisets ( EX ignores row order ), and the timings give the per-query speedup
+    #
+    # Order-insensitive is not plan-insensitive: ORDER BY count(*) DESC LIMIT 1 over a tie returns
+    #   whichever row the plan reaches first. Such queries are reported as "limit ties"; like any
+    #   other difference they keep the whole database on its original file
+    #
+    # Files under Dataset/ are only ever opened read-only. evaluation_db_map() swaps in the copies
+    #   of verified databases; everything else ( schema extraction, compile checks ) keeps the originals
+
+    # A quoted or bare SQL identifier
+    IDENT = r'(?:"[^"]+"|`[^`]+`|\[[^\]]+\]|[A-Za-z_][A-Za-z0-9_]*)'
+
+    TABLE_REF = re.compile(rf"\b(?:FROM|JOIN)\s+({IDENT})(?:\s+(?:AS\s+)?({IDENT}))?", re.IGNORECASE)
+    COLUMN_OP = re.compile(rf"(?:({IDENT})\.)?({IDENT})\s*(?:=|<=|>=|<|>|\bIN\b|\bBETWEEN\b)", re.IGNORECASE)
+    OP_COLUMN = re.compile(rf"(?:=|<=|>=|<|>)\s*({IDENT})\.({IDENT})", re.IGNORECASE)
+    PLAN_ROW = re.compile(r"^(SCAN|SEARCH)\s+(?:TABLE\s+)?(\S+)(?:\s+AS\s+(\S+))?(.*)$")
+    AUTOMATIC = re.compile(r"AUTOMATIC (?:PARTIAL )?(?:COVERING )?INDEX \((.*?)\)")
+    TRAILING_LIMIT = re.compile(r"\bLIMIT\s+\d+(?:\s*(?:,|OFFSET)\s*\d+)?\s*;?\s*$", re.IGNORECASE)
+
+    # Words the column pattern can catch that are never columns
+    KEYWORDS = {"and", "or", "not", "on", "where", "when", "then", "else", "case", "having", "select", "by", "is", "null"}
+
+    def __init__(self, dataset_name, db_map, min_queries=2, max_indexes_per_db=8, repeats=3):
+        self.dataset_name = dataset_name
+        self.db_map = db_map
+        self.min_queries = min_queries
+        self.max_indexes_per_db = max_indexes_per_db
+        self.repeats = repeats
+
+        self.scratch_dir = CommonUtil.get_cache_dir("index_advisor", dataset_name)
+
+        # KEY db_id, VALUE list of gold SQL
+        self.queries = {}
+
+        # KEY db_id, VALUE Counter of (table, columns) -> number of queries that want it
+        self.candidates = {}
+
+        # KEY (db_id, sql), VALUE set of (table, columns) the query wants
+        self.query_candidates = {}
+
+    @staticmethod
+    def _unquote(name):
+        if name[:1] in "\"`[":
+            return name[1:-1]
+        return name
+
+    @staticmethod
+    def manifest_path(dataset_name):
+        return os.path.join(CommonUtil.get_cache_dir("index_advisor", dataset_name), "advice.json")
+
+    @staticmethod
+    def _table_columns(conn):
+        # KEY lower-case table name, VALUE (table name, {lower-case column: column name})
+        tables = {}
+        for (table,) in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND name NOT LIKE 'sqlite_%'"):
+            columns = {row[1].lower(): row[1] for row in conn.execute(f'PRAGMA table_info("{table}")')}
+            tables[table.lower()] = (table, columns)
+
+        return tables
+
+    @staticmethod
+    def _existing_leading_columns(conn, table):
+        leading = set()
+        for index in conn.execute(f'PRAGMA index_list("{table}")'):
+            info = conn.execute(f'PRAGMA index_info("{index[1]}")').fetchall()
+            if info and info[0][2] is not None:
+                leading.add(info[0][2].lower())
+
+        return leading
+
+    def load_gold_sql(self):
+        path = LoadDevJson.BIRD_DEV_PATH if self.dataset_name == "bird" else LoadDevJson.SPIDER_DEV_PATH
+        sql_key = "SQL" if self.dataset_name == "bird" else "query"
+
+        for item in LoadDevJson.iter_json_array(path):
+            sql = item.get(sql_key, "").strip()
+            if sql and item.get("db_id") in self.db_map:
+                queries = self.queries.setdefault(item["db_id"], [])
+                if sql not in queries:
+                    queries.append(sql)
+
+        return self
+
+    def _wanted_indexes(self, sql, plan, tables):
+        # (table, columns) candidates for one query from its plan and its comparisons
+
+        aliases = {}
+        for table, alias in IndexAdvisor.TABLE_REF.findall(sql):
+            table = IndexAdvisor._unquote(table)
+            if table.lower() in tables:
+                aliases[table.lower()] = table.lower()
+                if alias and alias.lower() not in IndexAdvisor.KEYWORDS:
+                    aliases[IndexAdvisor._unquote(alias).lower()] = table.lower()
+
+        # Compared columns per table; unqualified ones go to every referenced table that has them
+        compared = {}
+        for qualifier, column in IndexAdvisor.COLUMN_OP.findall(sql) + IndexAdvisor.OP_COLUMN.findall(sql):
+            column = IndexAdvisor._unquote(column).lower()
+            if column in IndexAdvisor.KEYWORDS:
+                continue
+
+            if qualifier:
+                owners = [aliases.get(IndexAdvisor._unquote(qualifier).lower())]
+            else:
+                owners = set(aliases.values())
+
+            for owner in owners:
+                if owner and column in tables[owner][1]:
+                    compared.setdefault(owner, []).append(tables[owner][1][column])
+
+        wanted = set()
+        for detail in plan:
+            match = IndexAdvisor.PLAN_ROW.match(detail)
+            if not match:
+                continue
+
+            kind, name, alias, rest = match.groups()
+            table = aliases.get((alias or name).lower()) or aliases.get(name.lower())
+            if table is None:
+                continue
+
+            automatic = IndexAdvisor.AUTOMATIC.search(rest)
+            if automatic:
+                columns = [part.split("=")[0].split(">")[0].split("<")[0].strip() for part in automatic.group(1).split(" AND ")]
+                columns = [tables[table][1].get(column.lower()) for column in columns]
+                if all(columns):
+                    wanted.add((tables[table][0], tuple(columns)))
+
+            elif kind == "SCAN":
+                for column in dict.fromkeys(compared.get(table, [])):
+                    wanted.add((tables[table][0], (column,)))
+
+        return wanted
+
+    def collect(self):
+        # EXPLAIN QUERY PLAN for every gold query, then count the indexes they want
+
+        for db_id, queries in self.queries.items():
+            counts = Counter()
+
+            with SqlLiteUtil.read_only_connection(self.db_map[db_id]) as conn:
+                tables = IndexAdvisor._table_columns(conn)
+
+                for sql in queries:
+                    try:
+                        plan = [row[3] for row in conn.execute("EXPLAIN QUERY PLAN " + sql)]
+                    except Exception as e:
+                        Log.warn("[IndexAdvisor] EXPLAIN failed", db_id=db_id, error=str(e), sample="advisor_explain_failed")
+                        continue
+
+                    wanted = self._wanted_indexes(sql, plan, tables)
+                    self.query_candidates[(db_id, sql)] = wanted
+                    counts.update(wanted)
+
+                # Drop what an existing index already leads with
+                for (table, columns) in list(counts):
+                    if columns[0].lower() in IndexAdvisor._existing_leading_columns(conn, table):
+                        del counts[(table, columns)]
+
+            self.candidates[db_id] = counts
+
+        return self
+
+    def advice(self, db_id):
+        # Repeated candidates, most wanted first
+        counts = self.candidates.get(db_id, Counter())
+        chosen = [c for c, n in sorted(counts.items(), key=lambda kv: (-kv[1], kv[0])) if n >= self.min_queries]
+
+        return chosen[: self.max_indexes_per_db]
+
+    def build(self, db_id, indexes):
+        # Scratch copy of one database with the indexes added; the source is opened read-only
+
+        scratch_path = os.path.join(self.scratch_dir, f"{db_id}.sqlite")
+        tmp_path = scratch_path + ".tmp"
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+        source = sqlite3.connect(f"file:{self.db_map[db_id]}?mode=ro", uri=True)
+        target = sqlite3.connect(tmp_path)
+        try:
+            source.backup(target)
+
+            for n, (table, columns) in enumerate(indexes):
+                quoted = ", ".join('"' + column.replace('"', '""') + '"' for column in columns)
+                target.execute(f'CREATE INDEX "advisor_{n}" ON "{table}" ({quoted})')
+            target.commit()
+        finally:
+            source.close()
+            target.close()
+
+        os.replace(tmp_path, scratch_path)
+
+        return scratch_path
+
+    def _time_query(self, sql, db_path):
+        # Best of 'repeats' runs; (seconds, rows)
+
+        conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+        try:
+            best, rows = None, None
+            for _ in range(self.repeats):
+                start = time.perf_counter()
+                rows = conn.execute(sql).fetchall()
+                elapsed = time.perf_counter() - start
+                best = elapsed if best is None else min(best, elapsed)
+        finally:
+            conn.close()
+
+        return best, rows
+
+    def run(self):
+        # Collect, build, verify and time; writes the manifest evaluation_db_map() reads
+
+        self.load_gold_sql().collect()
+
+        manifest = {}
+        measurements = []
+
+        for db_id in sorted(self.queries):
+            indexes = self.advice(db_id)
+            if not indexes:
+                continue
+
+            source_path = self.db_map[db_id]
+            stat = os.stat(source_path)
+            scratch_path = self.build(db_id, indexes)
+            Log.info("[IndexAdvisor] Built scratch copy", db_id=db_id, indexes=len(indexes), path=scratch_path)
+
+            verified = True
+            for sql in self.queries[db_id]:
+                if not self.query_candidates.get((db_id, sql), set()) & set(indexes):
+                    continue
+
+                # Each side on its own: a query that fails the same way on both is just a broken gold
+                #   query, one that fails on only one side ( or differently ) is a mismatch
+                try:
+                    original_seconds, original_rows = self._time_query(sql, source_path)
+                    original_error = None
+                except Exception as e:
+                    original_error = str(e)
+                try:
+                    indexed_seconds, indexed_rows = self._time_query(sql, scratch_path)
+                    indexed_error = None
+                except Exception as e:
+                    indexed_error = str(e)
+
+                if original_error or indexed_error:
+                    if original_error != indexed_error:
+                        verified = False
+                    Log.warn("[IndexAdvisor] Timing failed", db_id=db_id, original_error=original_error,
+                             indexed_error=indexed_error, sample="advisor_timing_failed")
+                    continue
+
+                identical = Counter(original_rows) == Counter(indexed_rows)
+                verified = verified and identical
+
+                limit_ties = False
+                if not identical and IndexAdvisor.TRAILING_LIMIT.search(sql):
+                    unlimited = IndexAdvisor.TRAILING_LIMIT.sub("", sql)
+                    limit_ties = Counter(self._time_query(unlimited, source_path)[1]) == \
+                        Counter(self._time_query(unlimited, scratch_path)[1])
+
+                measurements.append({
+                    "db_id": db_id,
+                    "sql": sql,
+                    "original_ms": 1000 * original_seconds,
+                    "indexed_ms": 1000 * indexed_seconds,
+                    "speedup": original_seconds / indexed_seconds if indexed_seconds else None,
+                    "identical": identical,
+                    "limit_ties": limit_ties,
+                })
+
+            if not verified:
+                Log.warn("[IndexAdvisor] Results differ on the indexed copy; it will not be used for evaluation", db_id=db_id)
+
+            manifest[db_id] = {
+                "source": os.path.abspath(source_path),
+                "source_size": stat.st_size,
+                "source_mtime": stat.st_mtime,
+                "scratch": scratch_path,
+                "indexes": [[table, list(columns)] for table, columns in indexes],
+                "verified": verified,
+            }
+
+        path = IndexAdvisor.manifest_path(self.dataset_name)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(manifest, f, indent=1)
+        os.replace(tmp_path, path)
+
+        return manifest, measurements
+
+    @staticmethod
+    def report(manifest, measurements, top=20):
+        lines = ["\n-----INDEX ADVISOR-----"]
+
+        for db_id, entry in manifest.items():
+            indexes = ", ".join(f"{table}({', '.join(columns)})" for table, columns in entry["indexes"])
+            lines.append(f"{db_id:<28} {'verified' if entry['verified'] else 'REJECTED':<9} {indexes}")
+
+        if measurements:
+            original = sum(m["original_ms"] for m in measurements)
+            indexed = sum(m["indexed_ms"] for m in measurements)
+            lines += [
+                f"\n{len(measurements)} affected gold queries: {original:.1f} ms -> {indexed:.1f} ms "
+                f"( {original / indexed if indexed else 0.0:.2f}x ), "
+                f"{sum(not m['identical'] for m in measurements)} differ "
+                f"( {sum(m['limit_ties'] for m in measurements)} only by LIMIT over ties )",
+                f"\n{'db_id':<28} {'original ms':>12} {'indexed ms':>11} {'speedup':>8}  sql",
+            ]
+
+            for m in sorted(measurements, key=lambda m: -(m["original_ms"] - m["indexed_ms"]))[:top]:
+                speedup = f"{m['speedup']:.2f}x" if m["speedup"] else "-"
+                flag = "" if m["identical"] else "  [LIMIT TIES]" if m["limit_ties"] else "  [DIFFERS]"
+                lines.append(
+                    f"{m['db_id']:<28} {m['original_ms']:>12.2f} {m['indexed_ms']:>11.2f} {speedup:>8}  "
+                    f"{' '.join(m['sql'].split())[:80]}{flag}"
+                )
+
+        report = "\n".join(lines)
+
+        # The report is printed; let the queued log lines go first
+        Log.flush()
+        print(report)
+
+        return report
+
+    @staticmethod
+    def evaluation_db_map(dataset_name, db_map):
+        # db_map with verified, up-to-date scratch copies swapped in; everything else unchanged
+
+        path = IndexAdvisor.manifest_path(dataset_name)
+        if not os.path.exists(path):
+            Log.warn(f"[IndexAdvisor] No index advice; run 'python Cli.py advise {dataset_name}' first", dataset=dataset_name)
+            return db_map
+
+        with open(path, "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+
+        eval_map = dict(db_map)
+        for db_id, entry in manifest.items():
+            source_path = db_map.get(db_id)
+            if source_path is None or not entry["verified"] or not os.path.exists(entry["scratch"]):
+                continue
+
+            stat = os.stat(source_path)
+            if (os.path.abspath(source_path) != entry["source"] or stat.st_size != entry["source_size"]
+                    or stat.st_mtime != entry["source_mtime"]):
+                Log.warn("[IndexAdvisor] Index advice is stale; evaluating on the original", db_id=db_id)
+                continue
+
+            eval_map[db_id] = entry["scratch"]
+
+        return eval_map
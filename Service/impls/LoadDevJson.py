@@ -1,21 +1,57 @@
+import heapq
 import json
 import os
 from typing import List
 
-from Model.DatasetTestObj import DatasetTestObj
+from Model.DatasetTestObj import DatasetTestObj, deterministic_sample_indices, hash_sample_key
 
 class LoadDevJson:
 
+    BIRD_DEV_PATH = "Dataset/bird/dev.json"
+    SPIDER_DEV_PATH = "Dataset/spider-1.0/dev.json"
+
+    # Sampling modes for the streaming loaders
+    #
+    #   compat: exactly the items deterministic_random_sample() picks for the same seed; two passes
+    #           over the file ( count, then collect ), holds the chosen positions only
+    #   hash:   the items with the smallest sha256(seed, position); one pass, holds 'length' items
+    SAMPLE_MODES = {"compat", "hash"}
+
+    @staticmethod
+    def _bird_obj(item, sort_id):
+        return DatasetTestObj(
+            sort_id=sort_id,
+            dev_db_id=item.get("db_id", ""),
+            dev_db_path=item.get("db_path", ""),
+            dev_question=item.get("question", ""),
+            dev_gold_sql=item.get("SQL", ""),
+            llm_sql_output="",
+            dev_gold_sql_output="",
+            difficulty=item.get("difficulty", "")
+        )
+
+    @staticmethod
+    def _spider_obj(item, sort_id):
+        return DatasetTestObj(
+            sort_id=sort_id,
+            dev_db_id=item.get("db_id", ""),
+            dev_db_path="",
+            dev_question=item.get("question", ""),
+            dev_gold_sql=item.get("query", ""),
+            llm_sql_output="",
+            dev_gold_sql_output=""
+        )
+
     @staticmethod
     def load_bird_dev_json():
         # Load all items from dev.json into a list of DatasetTestObj objects
 
         # Check if file exists
-        if not os.path.exists("Dataset/bird/dev.json"):
-            raise FileNotFoundError(f"Could not find file at Dataset/bird/dev.json")
+        if not os.path.exists(LoadDevJson.BIRD_DEV_PATH):
+            raise FileNotFoundError(f"Could not find file at {LoadDevJson.BIRD_DEV_PATH}")
 
         # Open file and load json
-        with open("Dataset/bird/dev.json", "r", encoding="utf-8") as f:
+        with open(LoadDevJson.BIRD_DEV_PATH, "r", encoding="utf-8") as f:
             raw_items = json.load(f)
 
         dataset_objects: List[DatasetTestObj] = []
@@ -24,15 +60,7 @@ class LoadDevJson:
         # Load
         for item in raw_items:
 
-            obj = DatasetTestObj(
-                sort_id=counter,
-                dev_db_id=item.get("db_id", ""),
-                dev_db_path=item.get("db_path", ""),
-                dev_question=item.get("question", ""),
-                dev_gold_sql=item.get("SQL", ""),
-                llm_sql_output="",
-                dev_gold_sql_output=""
-            )
+            obj = LoadDevJson._bird_obj(item, counter)
 
             dataset_objects.append(obj)
             counter += 1
@@ -42,7 +70,7 @@ class LoadDevJson:
     @staticmethod
     def load_spider_dev_json():
         # Load all items from dev.json into a list of DatasetTestObj objects
-        dev_path = "Dataset/spider-1.0/dev.json"
+        dev_path = LoadDevJson.SPIDER_DEV_PATH
 
         # Ensure file exists
         if not os.path.exists(dev_path):
@@ -59,18 +87,131 @@ class LoadDevJson:
         counter = 0
         for item in raw_items:
 
-            obj = DatasetTestObj(
-                sort_id=counter,
-                dev_db_id=item.get("db_id", ""),
-                dev_db_path="",
-                dev_question=item.get("question", ""),
-                dev_gold_sql=item.get("query", ""),
-                llm_sql_output="",
-                dev_gold_sql_output=""
-            )
+            obj = LoadDevJson._spider_obj(item, counter)
 
             dataset_objects.append(obj)
             counter += 1
 
         return dataset_objects
 
+    @staticmethod
+    def iter_json_array(path, chunk_size=1024 * 1024):
+        # Yield the elements of a top-level JSON array one at a time
+        #
+        # json.load() holds the whole file and every parsed record at once. Here we keep one read
+        #   buffer and decode element by element with raw_decode(), reading more whenever an element
+        #   runs past the end of the buffer
+
+        decoder = json.JSONDecoder()
+
+        with open(path, "r", encoding="utf-8") as f:
+            buffer = ""
+            pos = 0
+            eof = False
+
+            def fill():
+                nonlocal buffer, pos, eof
+                chunk = f.read(chunk_size)
+                if not chunk:
+                    eof = True
+                # Drop what we already consumed so the buffer stays around one chunk
+                buffer = buffer[pos:] + chunk
+                pos = 0
+
+            def skip_whitespace():
+                nonlocal pos
+                while True:
+                    while pos < len(buffer) and buffer[pos] in " \t\r\n":
+                        pos += 1
+                    if pos < len(buffer) or eof:
+                        return
+                    fill()
+
+            skip_whitespace()
+            if pos >= len(buffer) or buffer[pos] != "[":
+                raise ValueError(f"{path}: expected a JSON array")
+            pos += 1
+
+            expect_comma = False
+            while True:
+                skip_whitespace()
+                if pos >= len(buffer):
+                    raise ValueError(f"{path}: unexpected end of file inside the array")
+
+                if buffer[pos] == "]":
+                    return
+
+                if expect_comma:
+                    if buffer[pos] != ",":
+                        raise ValueError(f"{path}: expected ',' between array elements")
+                    pos += 1
+                    skip_whitespace()
+
+                # Decode one element; a decode error means read more and retry. A number is only
+                #   complete once its terminating ',', ']' or whitespace is in the buffer: "2." or "3e"
+                #   at a chunk boundary decodes as 2 or 3 with the rest still unread
+                while True:
+                    try:
+                        element, end = decoder.raw_decode(buffer, pos)
+                        is_number = isinstance(element, (int, float)) and not isinstance(element, bool)
+                        if eof or (end < len(buffer) and (not is_number or buffer[end] in ",] \t\r\n")):
+                            break
+                    except json.JSONDecodeError:
+                        if eof:
+                            raise
+                    fill()
+
+                pos = end
+                expect_comma = True
+                yield element
+
+    @staticmethod
+    def stream_sample_dev_json(path, make_obj, seed, length, mode="compat"):
+        # Deterministic sample of 'length' items without loading the file
+        #
+        # Only the chosen records become DatasetTestObj; see SAMPLE_MODES for the two selections.
+        #   Returns them in the order the selection draws them, like deterministic_random_sample()
+
+        if mode not in LoadDevJson.SAMPLE_MODES:
+            raise ValueError(f"Unknown sample mode '{mode}'. Expected one of {sorted(LoadDevJson.SAMPLE_MODES)}")
+
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"Could not find file at {path}")
+
+        if mode == "compat":
+            # Pass 1: count; pass 2: keep the drawn positions
+            population_size = sum(1 for _ in LoadDevJson.iter_json_array(path))
+            indices = deterministic_sample_indices(seed, population_size, length)
+            draw_order = {sort_id: i for i, sort_id in enumerate(indices)}
+
+            chosen = [None] * length
+            for sort_id, item in enumerate(LoadDevJson.iter_json_array(path)):
+                if sort_id in draw_order:
+                    chosen[draw_order[sort_id]] = make_obj(item, sort_id)
+
+            return chosen
+
+        # hash: max-heap of the 'length' smallest keys seen so far ( negated for heapq )
+        heap = []
+        population_size = 0
+        for sort_id, item in enumerate(LoadDevJson.iter_json_array(path)):
+            population_size += 1
+            key = hash_sample_key(seed, sort_id)
+
+            if len(heap) < length:
+                heapq.heappush(heap, (-key, sort_id, item))
+            elif key < -heap[0][0]:
+                heapq.heapreplace(heap, (-key, sort_id, item))
+
+        if length > population_size:
+            raise ValueError("length cannot be greater than size of data_list")
+
+        return [make_obj(item, sort_id) for _, sort_id, item in sorted(heap, reverse=True)]
+
+    @staticmethod
+    def sample_bird_dev_json(seed, length, mode="compat"):
+        return LoadDevJson.stream_sample_dev_json(LoadDevJson.BIRD_DEV_PATH, LoadDevJson._bird_obj, seed, length, mode)
+
+    @staticmethod
+    def sample_spider_dev_json(seed, length, mode="compat"):
+        return LoadDevJson.stream_sample_dev_json(LoadDevJson.SPIDER_DEV_PATH, LoadDevJson._spider_obj, seed, length, mode)
@@ -0,0 +1,136 @@
+import contextvars
+from contextlib import nullcontext
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+
+class LocalityScheduler:
+
+    # Sits between sampling and processing
+    #
+    # deterministic_random_sample() returns items in random order, so consecutive items jump between
+    #   databases and every connection, page cache and schema cache goes cold between them. Grouping
+    #   the work by database keeps them warm:
+    #
+    #   sampled:   [financial, card_games, financial, formula_1, card_games]
+    #   scheduled: [financial, financial, card_games, card_games, formula_1]
+    #
+    # Results are still reported in sort_id order ( restore_order )
+    #
+    # run() also caps how many workers touch one database at the same time, by size class, so a
+    #   multi-GB BIRD file isn't read by every worker at once
+
+    MODES = {"none", "db_id", "size_class"}
+
+    # Upper bound in bytes, class name, default max concurrent workers per database
+    SIZE_CLASSES = [
+        (64 * 1024 * 1024, "small", None),
+        (512 * 1024 * 1024, "medium", 4),
+        (float("inf"), "large", 2),
+    ]
+
+    def __init__(self, mode="db_id", db_sizes=None, per_db_limits=None, pool=None):
+        if mode not in self.MODES:
+            raise ValueError(f"Unknown schedule mode '{mode}'. Expected one of {sorted(self.MODES)}")
+
+        self.mode = mode
+
+        # KEY db_id, VALUE file size in bytes; from SqlLiteUtil.load_sqlite_manifest()
+        self.db_sizes = db_sizes or {}
+
+        # KEY size class, VALUE max concurrent workers per database ( None = no cap )
+        self.per_db_limits = {name: limit for _, name, limit in self.SIZE_CLASSES}
+        self.per_db_limits.update(per_db_limits or {})
+
+        # A limit of 0 would never start that database's items and run() would wait on them forever
+        invalid = {name: limit for name, limit in self.per_db_limits.items() if limit is not None and limit < 1}
+        if invalid:
+            raise ValueError(f"Per-database limits must be at least 1 ( or None for no cap ), got {invalid}")
+
+        # ThreadPoolExecutor shared with other runs in the process; None gives every run() its own
+        self.pool = pool
+
+    @staticmethod
+    def from_manifest(manifest, mode="db_id", per_db_limits=None, pool=None):
+        db_sizes = {entry["db_id"]: entry["size"] for entry in manifest.values() if entry["valid"]}
+        return LocalityScheduler(mode, db_sizes, per_db_limits, pool)
+
+    def size_class(self, db_id):
+        size = self.db_sizes.get(db_id, 0)
+        for upper, name, _ in self.SIZE_CLASSES:
+            if size < upper:
+                return name
+
+    def db_limit(self, db_id):
+        return self.per_db_limits.get(self.size_class(db_id))
+
+    def order(self, items):
+        # Reorder work for locality; stable within a database
+
+        if self.mode == "none":
+            return list(items)
+
+        groups = {}
+        for obj in items:
+            groups.setdefault(obj.dev_db_id, []).append(obj)
+
+        # db_id: databases in order of first appearance
+        db_order = list(groups)
+
+        # size_class: largest databases first, so the long ones aren't the tail of the run
+        if self.mode == "size_class":
+            rank = {name: i for i, (_, name, _) in enumerate(self.SIZE_CLASSES)}
+            db_order.sort(key=lambda db_id: (-rank[self.size_class(db_id)], db_id))
+
+        return [obj for db_id in db_order for obj in groups[db_id]]
+
+    @staticmethod
+    def restore_order(items):
+        # Original dev.json order for reporting
+        return sorted(items, key=lambda obj: obj.sort_id)
+
+    def run(self, items, fn, max_workers=1):
+        # Call fn(obj) for every item in scheduled order with at most max_workers at once and at most
+        #   db_limit(db_id) at once per database. Returns the items in sort_id order
+        #
+        # Items whose database is at its limit are skipped over ( not waited on ), so a busy large
+        #   database never idles workers that could serve other databases
+
+        ordered = self.order(items)
+
+        if max_workers <= 1:
+            for obj in ordered:
+                fn(obj)
+            return self.restore_order(ordered)
+
+        # Only this dispatcher thread touches these
+        running_per_db = {}
+        waiting = list(ordered)
+        in_flight = {}
+
+        # A shared pool is not ours to shut down; max_workers still caps what this call has in flight
+        with nullcontext(self.pool) if self.pool else ThreadPoolExecutor(max_workers=max_workers) as pool:
+            while waiting or in_flight:
+
+                # Fill free workers with the first items whose database still has room
+                i = 0
+                while i < len(waiting) and len(in_flight) < max_workers:
+                    obj = waiting[i]
+                    limit = self.db_limit(obj.dev_db_id)
+
+                    if limit is not None and running_per_db.get(obj.dev_db_id, 0) >= limit:
+                        i += 1
+                        continue
+                    running_per_db[obj.dev_db_id] = running_per_db.get(obj.dev_db_id, 0) + 1
+
+                    # Workers run in a copy of our context, so they charge the same UsageLedger
+                    in_flight[pool.submit(contextvars.copy_context().run, fn, obj)] = waiting.pop(i)
+
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    obj = in_flight.pop(future)
+                    running_per_db[obj.dev_db_id] -= 1
+
+                    # Surface the worker's exception like the sequential loop would
+                    future.result()
+
+        return self.restore_order(ordered)
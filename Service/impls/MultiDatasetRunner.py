@@ -0,0 +1,194 @@
+import contextvars
+import os
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from Model.RunOptions import RunOptions
+from Util.BudgetGovernor import BudgetGovernor
+from Util.ExecutionMemo import ExecutionMemo
+from Util.Log import Log
+from Util.UsageLedger import UsageLedger
+
+
+class _LedgerGroup:
+
+    # The totals BudgetGovernor reads, summed over every job's ledger, so one rate target covers all jobs
+
+    def __init__(self, ledgers):
+        self.ledgers = ledgers
+
+    def tokens(self):
+        return sum(ledger.tokens() for ledger in self.ledgers)
+
+    def cost(self):
+        return sum(ledger.cost() for ledger in self.ledgers)
+
+    def tokens_since(self, since):
+        return sum(ledger.tokens_since(since) for ledger in self.ledgers)
+
+
+class MultiDatasetRunner:
+
+    # Several (dataset, seed, items) evaluation runs at once in one process
+    #
+    # Each job is a normal BirdService / SpiderService run on its own thread, so total wall time is
+    #   about the longest job rather than the sum. What can be shared is built once:
+    #
+    #   LLM client        : CommonUtil's pooled HTTP session ( process-wide already )
+    #   RAG index         : one initialized UniversalRAG per dataset, however many seeds use it
+    #   execution memo    : one ExecutionMemo, so a query another job already ran is not run again
+    #   worker pool       : one ThreadPoolExecutor for every job's setup and evaluation workers
+    #   rate target       : with tokens_per_minute, one BudgetGovernor watching all jobs' ledgers
+    #
+    # Each job writes to <out_dir>/<dataset>-<seed>/: per-item results ( ShardResults, readable by
+    #   Cli.py merge ), its token / cost ledger, and a columnar results store
+    #
+    # Per-job budgets are not supported here: a job's own governor would replace the shared one
+
+    def __init__(self, api_key, jobs, out_dir, workers=4, pool_size=None, tokens_per_minute=None, run_options=None):
+        # jobs: (dataset_name, seed, num_items) tuples
+
+        self.api_key = api_key
+        self.jobs = [(dataset_name, str(seed), int(num_items)) for dataset_name, seed, num_items in jobs]
+
+        names = [MultiDatasetRunner.job_name(dataset_name, seed) for dataset_name, seed, _ in self.jobs]
+        duplicates = sorted({name for name in names if names.count(name) > 1})
+        if duplicates:
+            raise ValueError(f"Jobs would share an output directory: {duplicates}. Use distinct seeds")
+        self.out_dir = out_dir
+        self.workers = workers
+        self.pool_size = pool_size or max(1, workers * len(self.jobs))
+        self.tokens_per_minute = tokens_per_minute
+        self.run_options = run_options or {}
+
+        self.ledgers = {}
+
+        # KEY dataset name, VALUE initialized UniversalRAG
+        self._rags = {}
+        self._rag_locks = {name: threading.Lock() for name, _, _ in self.jobs}
+
+    @staticmethod
+    def job_name(dataset_name, seed):
+        return f"{dataset_name}-{re.sub(r'[^A-Za-z0-9_.-]+', '_', seed)}"
+
+    def get_rag(self, dataset_name):
+        # Built by the first job that needs it; the others wait for that one instead of building their own
+        with self._rag_locks[dataset_name]:
+            if dataset_name not in self._rags:
+                from Service.impls.GetRag import GetRag
+                build_options = self.run_options.get("rag_build")
+                self._rags[dataset_name] = (
+                    GetRag.get_bird_rag(build_options) if dataset_name == "bird" else GetRag.get_spider_rag(build_options)
+                )
+
+            return self._rags[dataset_name]
+
+    def _run_job(self, job, options):
+        dataset_name, seed, num_items = job
+        name = MultiDatasetRunner.job_name(dataset_name, seed)
+
+        start = time.perf_counter()
+        with Log.context(job=name):
+            Log.info("Job started", items=num_items)
+
+            options.rag = self.get_rag(dataset_name)
+            if dataset_name == "bird":
+                from Service.bird.BirdService import BirdService
+                BirdService.test_algo_on_bird_dataset(self.api_key, num_items, seed, options)
+            else:
+                from Service.spider.SpiderService import SpiderService
+                SpiderService.test_algo_on_spider_dataset(self.api_key, num_items, seed, options)
+
+            elapsed = time.perf_counter() - start
+            Log.info("Job finished", seconds=round(elapsed, 1))
+
+        return elapsed
+
+    def run(self):
+        # Runs every job; returns the report. A failing job is reported, the others still finish
+
+        persist = self.run_options.get("persist_exec_memo")
+        exec_memo = ExecutionMemo(persist_path=ExecutionMemo.default_persist_path() if persist else None)
+
+        governor = None
+        if self.tokens_per_minute:
+            governor = BudgetGovernor(tokens_per_minute=self.tokens_per_minute)
+            governor.ledger = _LedgerGroup([])
+
+        results = {}
+        start = time.perf_counter()
+
+        with ThreadPoolExecutor(max_workers=self.pool_size, thread_name_prefix="job-worker") as worker_pool, \
+                ThreadPoolExecutor(max_workers=len(self.jobs), thread_name_prefix="job") as job_pool:
+
+            futures = {}
+            for job in self.jobs:
+                dataset_name, seed, _ = job
+                name = MultiDatasetRunner.job_name(dataset_name, seed)
+                job_dir = os.path.join(self.out_dir, name)
+
+                ledger = UsageLedger(name, governor=governor)
+                self.ledgers[name] = ledger
+                if governor is not None:
+                    governor.ledger.ledgers.append(ledger)
+
+                options = RunOptions(
+                    exec_memo=exec_memo,
+                    ledger=ledger,
+                    workers=self.workers,
+                    worker_pool=worker_pool,
+                    shard_dir=job_dir,
+                    ledger_path=os.path.join(job_dir, "ledger.json"),
+                    results_path=os.path.join(job_dir, "results"),
+                    **self.run_options,
+                )
+
+                # Each job thread starts from a copy of this context; its ledger and log fields stay its own
+                futures[name] = job_pool.submit(contextvars.copy_context().run, self._run_job, job, options)
+
+            for name, future in futures.items():
+                try:
+                    results[name] = ("ok", future.result())
+                except Exception as e:
+                    Log.error("Job failed", job=name, error=repr(e))
+                    results[name] = ("failed", None)
+
+        wall = time.perf_counter() - start
+        Log.flush()
+
+        report = self.report(results, wall, exec_memo, governor)
+        exec_memo.close()
+
+        return report
+
+    def report(self, results, wall, exec_memo, governor=None):
+        lines = [
+            f"\n-----MULTI-DATASET RUN ( {len(self.jobs)} jobs, {self.workers} workers each, pool {self.pool_size} )-----",
+            f"{'job':<48} {'items':>6} {'status':>7} {'seconds':>9} {'LLM calls':>10} {'tokens':>10} {'cost $':>9}",
+        ]
+
+        for dataset_name, seed, num_items in self.jobs:
+            name = MultiDatasetRunner.job_name(dataset_name, seed)
+            status, seconds = results.get(name, ("failed", None))
+            ledger = self.ledgers[name]
+            lines.append(
+                f"{name[:48]:<48} {num_items:>6} {status:>7} {'-' if seconds is None else f'{seconds:.1f}':>9} "
+                f"{ledger.total['calls']:>10} {ledger.tokens():>10} {ledger.cost():>9.4f}"
+            )
+
+        job_seconds = [seconds for _, seconds in results.values() if seconds is not None]
+        lines += [
+            "",
+            f"wall {wall:.1f} s; longest job {max(job_seconds, default=0.0):.1f} s, sum of jobs {sum(job_seconds):.1f} s",
+            f"results under {self.out_dir}",
+            f"Execution memo ( shared ): {exec_memo.stats()}",
+        ]
+        if governor is not None:
+            lines.append(f"Rate target ( shared ): {governor.summary()}")
+
+        report = "\n".join(lines)
+        print(report)
+
+        return report
@@ -1,8 +1,12 @@
 import json
 import os
+import itertools
+import threading
 from typing import List
 from typing import List, Callable, Any
 from Util.SchemaUtil import SchemaUtil
+from Util.UsageLedger import UsageLedger
+from Util.Log import Log
 
 
 class SetupDataObjsForLLM:
@@ -16,31 +20,74 @@ class SetupDataObjsForLLM:
         db_map,
         extract_schema_fn,
         schema_linking_fn,
-        top_k
+        top_k,
+        semantic_cache=None,
+        scheduler=None,
+        workers=1
     ):
+        # scheduler ( LocalityScheduler ) groups items by database and caps per-database concurrency
+        #   when workers > 1; without it items run sequentially in the given order
+
+        # Schema string per db_path; items on the same database extract it once
+        #
+        # One lock per db_path, so workers on different databases extract at the same time
+        schema_cache = {}
+        schema_locks = {}
+        schema_locks_guard = threading.Lock()
+
+        def get_schema(db_path):
+            with schema_locks_guard:
+                lock = schema_locks.setdefault(db_path, threading.Lock())
+
+            with lock:
+                if db_path not in schema_cache:
+                    schema_cache[db_path] = extract_schema_fn(db_path)
+                return schema_cache[db_path]
+
         def process_item(obj):
             
-            print(f"Processing item {obj.sort_id} - DB ID: {obj.dev_db_id}")
+            Log.info("Processing item", item=obj.sort_id, db_id=obj.dev_db_id)
 
             # Normalize path
             obj.dev_db_path = obj.dev_db_path if obj.dev_db_path.startswith("Dataset") \
                 else "Dataset/bird/dev_databases/" + obj.dev_db_path
 
-            # RAG
-            obj.rag_examples = rag_instance.run_rag(obj.dev_question, top_k)
+            # RAG; only the training partitions whose schemas overlap this item's database are scored
+            obj.rag_examples = rag_instance.run_rag(obj.dev_question, top_k, obj.dev_db_id)
 
             # Schema extraction
-            obj.schema_string = extract_schema_fn(db_map[obj.dev_db_id])
+            obj.schema_string = get_schema(db_map[obj.dev_db_id])
+
+            # Schema linking; a near-duplicate question on the same database skips the LLM call
+            cached_tables = semantic_cache.lookup_schema_linking(obj) if semantic_cache else None
 
-            # Schema linking (LLM)
-            obj.schema_linking_tables = schema_linking_fn(LLM_API_KEY, obj.schema_string, obj.dev_question)
+            if cached_tables is not None:
+                Log.info("[Schema Linking] Reusing linked schema of a near-duplicate question", item=obj.sort_id)
+                obj.schema_linking_tables = cached_tables
+            else:
+                # Schema linking (LLM)
+                with UsageLedger.scope(stage="schema_linking", item=obj.sort_id):
+                    obj.schema_linking_tables = schema_linking_fn(LLM_API_KEY, obj.schema_string, obj.dev_question)
+
+            if semantic_cache:
+                semantic_cache.store(obj)
 
             return obj
 
+        if scheduler is not None:
+            completed = itertools.count(1)
+
+            def process_and_count(obj):
+                process_item(obj)
+                Log.info("Schema setup progress", completed=next(completed), total=len(data_list))
+
+            scheduler.run(data_list, process_and_count, workers)
+            return data_list
+
         # Sequential execution
         counter = 1
         for item in data_list:
             process_item(item)
-            print(f"Completed {counter} out of {len(data_list)} items.\n\n")
+            Log.info("Schema setup progress", completed=counter, total=len(data_list))
             counter += 1
         return data_list
\ No newline at end of file
@@ -0,0 +1,158 @@
+import glob
+import json
+import os
+
+from Model.DatasetTestObj import DatasetTestObj
+from Util.EvaluationUtil import EvaluationUtil
+
+
+class ShardResults:
+
+    # Per-item results of one shard, and the merge across shards
+    #
+    # A shard file is JSON lines: one header line describing the run, then one line per item
+    #
+    #   {"dataset": "bird", "seed": "...", "num_items": 9000, "shard_index": 3, "num_shards": 16, ...}
+    #   {"sort_id": 17, "db_id": "...", "em": 0.0, "ex": 1.0, "partial_correctness": 1.0, ...}
+    #
+    # A shard always writes its file, even with no items. Items of its share that never completed
+    #   ( a budget ran out ) are listed in the header as "dropped" sort_ids
+    #
+    # merge() checks that every shard of the same run is there exactly once and that completed plus
+    #   dropped items cover the sample, then feeds the items in sort_id order to
+    #   EvaluationUtil.print_avg_metrics, the same order an unsharded run reports in, so the averages
+    #   come out identical
+
+    # Fields written per item; execution results are left out ( bytes, and can be huge )
+    ITEM_FIELDS = {
+        "sort_id": "sort_id",
+        "db_id": "dev_db_id",
+        "question": "dev_question",
+        "gold_sql": "dev_gold_sql",
+        "llm_sql": "llm_returned_sql",
+        "em": "em",
+        "ex": "ex",
+        "partial_correctness": "partial_correctness",
+        "difficulty": "difficulty",
+        "outcome": "outcome",
+    }
+
+    @staticmethod
+    def shard_path(shard_dir, dataset_name, shard_index, num_shards):
+        return os.path.join(shard_dir, f"{dataset_name}-shard-{shard_index:03d}-of-{num_shards:03d}.jsonl")
+
+    @staticmethod
+    def write_shard(shard_dir, dataset_name, seed, num_items, shard_index, num_shards, obj_list, dropped=()):
+        # dropped: sort_ids of this shard's items that did not complete
+        os.makedirs(shard_dir, exist_ok=True)
+        path = ShardResults.shard_path(shard_dir, dataset_name, shard_index, num_shards)
+
+        header = {
+            "dataset": dataset_name,
+            "seed": seed,
+            "num_items": num_items,
+            "shard_index": shard_index,
+            "num_shards": num_shards,
+            "item_count": len(obj_list),
+            "dropped": sorted(dropped),
+        }
+
+        # Write then rename, so a crashed shard never leaves a half file the merge would accept
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(json.dumps(header) + "\n")
+            for obj in obj_list:
+                record = {key: getattr(obj, attr) for key, attr in ShardResults.ITEM_FIELDS.items()}
+                f.write(json.dumps(record) + "\n")
+        os.replace(tmp_path, path)
+
+        print(f"Wrote {len(obj_list)} items to {path}" + (f" ( {len(header['dropped'])} dropped )" if dropped else ""))
+        return path
+
+    @staticmethod
+    def read_shard(path):
+        with open(path, "r", encoding="utf-8") as f:
+            header = json.loads(f.readline())
+            items = [json.loads(line) for line in f if line.strip()]
+
+        if len(items) != header["item_count"]:
+            raise ValueError(f"{path}: header says {header['item_count']} items, found {len(items)}")
+
+        return header, items
+
+    @staticmethod
+    def merge(paths, bootstrap_replicates=0):
+        # Merge shard files ( or directories of them ) of one run and print the aggregate metrics
+        #
+        # Returns the merged DatasetTestObj list in sort_id order
+
+        files = []
+        for path in paths:
+            if os.path.isdir(path):
+                files.extend(sorted(glob.glob(os.path.join(path, "*-shard-*-of-*.jsonl"))))
+            else:
+                files.append(path)
+
+        if not files:
+            raise ValueError("No shard files to merge")
+
+        run_keys = ("dataset", "seed", "num_items", "num_shards")
+        run = None
+        seen_shards = set()
+        items = {}
+        dropped = set()
+
+        for path in files:
+            header, records = ShardResults.read_shard(path)
+
+            # Every shard must come from the same run
+            key = tuple(header[k] for k in run_keys)
+            if run is None:
+                run = key
+            elif key != run:
+                raise ValueError(f"{path} is from a different run: {dict(zip(run_keys, key))}")
+
+            if header["shard_index"] in seen_shards:
+                raise ValueError(f"{path}: shard {header['shard_index']} given twice")
+            seen_shards.add(header["shard_index"])
+
+            for record in records:
+                if record["sort_id"] in items:
+                    raise ValueError(f"{path}: item {record['sort_id']} is in more than one shard")
+                items[record["sort_id"]] = record
+
+            # Shards written before drops were recorded have no "dropped"
+            for sort_id in header.get("dropped", []):
+                if sort_id in items or sort_id in dropped:
+                    raise ValueError(f"{path}: dropped item {sort_id} is also in another shard")
+                dropped.add(sort_id)
+
+        both = sorted(dropped & set(items))
+        if both:
+            raise ValueError(f"Items {both} are both completed and dropped")
+
+        run = dict(zip(run_keys, run))
+
+        missing = sorted(set(range(run["num_shards"])) - seen_shards)
+        if missing:
+            raise ValueError(f"Missing shards {missing} of {run['num_shards']}")
+
+        if len(items) + len(dropped) != run["num_items"]:
+            raise ValueError(
+                f"Shards hold {len(items)} items and {len(dropped)} dropped, the run sampled {run['num_items']}"
+            )
+
+        if dropped:
+            print(f"[WARN] Partial run: {len(dropped)} of {run['num_items']} items were dropped; "
+                  f"metrics cover the {len(items)} that completed")
+
+        obj_list = []
+        for sort_id in sorted(items):
+            record = items[sort_id]
+            # Fields added after a shard was written keep their defaults
+            obj_list.append(DatasetTestObj(**{attr: record[key] for key, attr in ShardResults.ITEM_FIELDS.items() if key in record}))
+
+        print(f"Merged {len(files)} shards of {run['dataset']} ( seed '{run['seed']}', {len(obj_list)} items )")
+        EvaluationUtil.print_avg_metrics(obj_list, bootstrap_replicates)
+
+        return obj_list
@@ -0,0 +1,325 @@
+import asyncio
+import itertools
+import json
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from Model.DatasetTestObj import DatasetTestObj
+from Service.impls.GetRag import GetRag
+
+from Util.CommonUtil import CommonUtil
+from Util.SchemaUtil import SchemaUtil
+from Util.SqlLiteUtil import SqlLiteUtil
+from Util.EvaluationUtil import EvaluationUtil
+from Util.ExecutionMemo import ExecutionMemo
+from Util.UsageLedger import UsageLedger
+
+
+class DatasetContext:
+
+    # Everything Main.py rebuilds on every run, built once per dataset and kept warm
+    #
+    # RAG index, db_id -> db_path map, and a schema string cache per database
+
+    def __init__(self, dataset_name):
+        self.dataset_name = dataset_name
+
+        # Same objects the Spider/Bird services build at the start of a run
+        self.db_map = SqlLiteUtil.load_sqlite_databases(dataset_name, base_path="Dataset")
+        self.rag = GetRag.get_bird_rag() if dataset_name == "bird" else GetRag.get_spider_rag()
+
+        # KEY db_id, VALUE schema string from SchemaUtil.extract_schema_from_sqlite
+        self.schema_cache = {}
+        self._schema_lock = threading.Lock()
+
+    def get_schema(self, db_id):
+        # Extract the schema once per database; later requests on the same db are a dict lookup
+
+        schema = self.schema_cache.get(db_id)
+        if schema is not None:
+            return schema
+
+        with self._schema_lock:
+            if db_id not in self.schema_cache:
+                self.schema_cache[db_id] = SchemaUtil.extract_schema_from_sqlite(self.db_map[db_id])
+
+            return self.schema_cache[db_id]
+
+
+class TextToSqlServer:
+
+    # Long-lived local HTTP service for question -> SQL and question -> evaluation
+    #
+    # Every Main.py run pays for importing sklearn, building the TF-IDF index, discovering the
+    #   databases and extracting schemas before the first question. Here we pay it once per dataset
+    #   and then only pay for the per-question work
+    #
+    # Plain asyncio so there is nothing new to install; the pipeline itself is blocking (LLM calls,
+    #   sqlite), so it runs on a bounded thread pool and the event loop only does I/O
+    #
+    # Endpoints ( JSON in, JSON out ):
+    #
+    #   POST /sql       {"dataset": "bird", "db_id": "...", "question": "..."}
+    #   POST /evaluate  same as /sql plus "gold_sql"
+    #   GET  /metrics   per-route latency percentiles, in-flight and rejected counts
+    #   GET  /health
+
+    DATASETS = {"bird", "spider-1.0"}
+
+    def __init__(self, api_key, host="127.0.0.1", port=8765, max_concurrency=4, max_queue=64, top_k=5):
+        self.api_key = api_key
+        self.host = host
+        self.port = port
+        self.top_k = top_k
+
+        # At most max_concurrency requests run the pipeline; up to max_queue more wait; rest get 503
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self._semaphore = None
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrency)
+
+        # Warm state per dataset; built on first use or by warm()
+        self.contexts = {}
+        self._context_lock = threading.Lock()
+
+        # Execution results stay warm too ( memory only; the server is the long-lived cache )
+        self.exec_memo = ExecutionMemo()
+
+        # Tokens and cost of every LLM call the server makes, per stage
+        self.ledger = UsageLedger("server")
+
+        # Metrics
+        self.in_flight = 0
+        self.waiting = 0
+        self.rejected = 0
+        self._request_ids = itertools.count(1)
+        self.latencies = {}
+
+    def get_context(self, dataset_name):
+        # Build the dataset's warm context once; concurrent first requests wait for the same build
+
+        dataset_name = dataset_name.lower().strip()
+        if dataset_name not in self.DATASETS:
+            raise ValueError(f"Unknown dataset '{dataset_name}'. Expected 'bird' or 'spider-1.0'")
+
+        context = self.contexts.get(dataset_name)
+        if context is not None:
+            return context
+
+        with self._context_lock:
+            if dataset_name not in self.contexts:
+                print(f"[Server] Warming up {dataset_name}...")
+                self.contexts[dataset_name] = DatasetContext(dataset_name)
+
+            return self.contexts[dataset_name]
+
+    def warm(self, dataset_names):
+        for dataset_name in dataset_names:
+            self.get_context(dataset_name)
+
+    def _record_latency(self, route, seconds, window=1000):
+        self.latencies.setdefault(route, deque(maxlen=window)).append(seconds)
+
+    def metrics(self):
+        routes = {}
+        for route, values in self.latencies.items():
+            values = list(values)
+            routes[route] = {
+                "count": len(values),
+                "mean_ms": round(1000 * sum(values) / len(values), 2),
+                "p50_ms": round(1000 * CommonUtil.percentile(values, 50), 2),
+                "p95_ms": round(1000 * CommonUtil.percentile(values, 95), 2),
+                "p99_ms": round(1000 * CommonUtil.percentile(values, 99), 2),
+            }
+
+        return {
+            "routes": routes,
+            "in_flight": self.in_flight,
+            "waiting": self.waiting,
+            "rejected": self.rejected,
+            "max_concurrency": self.max_concurrency,
+            "warm_datasets": sorted(self.contexts),
+            "execution_memo": self.exec_memo.stats(),
+            "llm_usage": {"total": self.ledger.total, "by_stage": self.ledger.by_stage},
+        }
+
+    def answer(self, payload, evaluate=False):
+        # Blocking pipeline for one question; same steps as the dataset services, timed per stage
+
+        timings = {}
+
+        def timed(stage, fn, *args):
+            start = time.perf_counter()
+            value = fn(*args)
+            timings[stage] = round(1000 * (time.perf_counter() - start), 2)
+            return value
+
+        context = self.get_context(payload.get("dataset", ""))
+
+        db_id = payload.get("db_id", "")
+        if db_id not in context.db_map:
+            raise ValueError(f"Unknown db_id '{db_id}' for dataset '{context.dataset_name}'")
+
+        obj = DatasetTestObj(
+            sort_id=next(self._request_ids),
+            dev_db_id=db_id,
+            dev_db_path=context.db_map[db_id],
+            dev_question=payload.get("question", ""),
+            dev_gold_sql=payload.get("gold_sql", ""),
+        )
+
+        obj.rag_examples = timed("rag", context.rag.run_rag, obj.dev_question, self.top_k, db_id)
+        obj.schema_string = timed("schema", context.get_schema, db_id)
+        with self.ledger.activate(), UsageLedger.scope(item=obj.sort_id):
+            with UsageLedger.scope(stage="schema_linking"):
+                obj.schema_linking_tables = timed(
+                    "schema_linking", SchemaUtil.schema_linking, self.api_key, obj.schema_string, obj.dev_question
+                )
+            timed("sql_generation", SqlLiteUtil.generate_sql_for_obj, obj, self.api_key, obj.dev_db_path)
+
+        response = {
+            "db_id": db_id,
+            "question": obj.dev_question,
+            "sql": obj.llm_returned_sql,
+            "schema_linking": obj.schema_linking_tables,
+        }
+
+        if evaluate:
+            obj.dev_gold_sql_output, obj.llm_sql_output = timed(
+                "execution", SqlLiteUtil.run_gold_and_pred, obj.dev_gold_sql, obj.llm_returned_sql, obj.dev_db_path, self.exec_memo
+            )
+            response.update(EvaluationUtil.evaluate_all(obj))
+
+        response["stage_ms"] = timings
+        return response
+
+    async def _run_bounded(self, fn, *args):
+        # Bounded request concurrency; a full queue fails fast instead of piling up
+
+        if self.waiting >= self.max_queue:
+            self.rejected += 1
+            return 503, {"error": "server busy, try again later"}
+
+        self.waiting += 1
+        try:
+            await self._semaphore.acquire()
+        finally:
+            self.waiting -= 1
+
+        self.in_flight += 1
+        try:
+            loop = asyncio.get_running_loop()
+            return 200, await loop.run_in_executor(self._executor, fn, *args)
+        finally:
+            self.in_flight -= 1
+            self._semaphore.release()
+
+    async def _route(self, method, path, body):
+        if method == "GET" and path == "/health":
+            return 200, {"status": "ok"}
+
+        if method == "GET" and path == "/metrics":
+            return 200, self.metrics()
+
+        if method == "POST" and path in ("/sql", "/evaluate"):
+            try:
+                payload = json.loads(body or b"{}")
+            except ValueError:
+                return 400, {"error": "body must be JSON"}
+            if not isinstance(payload, dict):
+                return 400, {"error": "body must be a JSON object"}
+
+            return await self._run_bounded(self.answer, payload, path == "/evaluate")
+
+        return 404, {"error": f"no route for {method} {path}"}
+
+    async def _handle_connection(self, reader, writer):
+        # Minimal HTTP/1.1: one request per connection, JSON bodies only
+
+        start = time.perf_counter()
+        route = "?"
+
+        try:
+            request_line = await reader.readline()
+            parts = request_line.decode("latin-1").split()
+            if len(parts) < 2:
+                return
+
+            method, path = parts[0].upper(), parts[1].split("?")[0]
+            route = f"{method} {path}"
+
+            # Headers until the blank line; a bad Content-Length is answered 400 without reading a body
+            content_length = 0
+            header_error = None
+            while True:
+                line = await reader.readline()
+                if line in (b"\r\n", b"\n", b""):
+                    break
+
+                name, _, value = line.decode("latin-1").partition(":")
+                if name.strip().lower() == "content-length":
+                    try:
+                        content_length = int(value.strip())
+                        if content_length < 0:
+                            raise ValueError
+                    except ValueError:
+                        content_length = 0
+                        header_error = f"bad Content-Length: {value.strip()!r}"
+
+            body = await reader.readexactly(content_length) if content_length else b""
+
+            if header_error:
+                status, response = 400, {"error": header_error}
+            else:
+                try:
+                    status, response = await self._route(method, path, body)
+                except ValueError as e:
+                    status, response = 400, {"error": str(e)}
+                except Exception as e:
+                    print(f"[ERROR] Server request {route} failed: {e}")
+                    status, response = 500, {"error": str(e)}
+
+            self._record_latency(route, time.perf_counter() - start)
+            if isinstance(response, dict):
+                response.setdefault("latency_ms", round(1000 * (time.perf_counter() - start), 2))
+
+            payload = json.dumps(response, default=str).encode("utf-8")
+            reason = {200: "OK", 400: "Bad Request", 404: "Not Found", 500: "Internal Server Error",
+                      503: "Service Unavailable"}.get(status, "OK")
+
+            writer.write(
+                f"HTTP/1.1 {status} {reason}\r\n"
+                f"Content-Type: application/json\r\n"
+                f"Content-Length: {len(payload)}\r\n"
+                f"Connection: close\r\n\r\n".encode("latin-1") + payload
+            )
+            await writer.drain()
+
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+
+        finally:
+            writer.close()
+
+    async def serve_forever(self, warm_datasets=()):
+        self._semaphore = asyncio.Semaphore(self.max_concurrency)
+
+        # Warm up before accepting requests so the first caller doesn't pay for it
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(self._executor, self.warm, list(warm_datasets))
+
+        server = await asyncio.start_server(self._handle_connection, self.host, self.port)
+        print(f"[Server] Listening on http://{self.host}:{self.port}")
+
+        async with server:
+            await server.serve_forever()
+
+    def run(self, warm_datasets=()):
+        try:
+            asyncio.run(self.serve_forever(warm_datasets))
+        except KeyboardInterrupt:
+            print("[Server] Stopped.")
+        finally:
+            self._executor.shutdown(wait=False)
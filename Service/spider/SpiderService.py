@@ -1,74 +1,312 @@
 from Service.impls.GetRag import GetRag
 from Service.impls.LoadDevJson import LoadDevJson
 from Service.impls.SetupDataObjsForLLM import SetupDataObjsForLLM
-from Model.DatasetTestObj import deterministic_random_sample
+from Service.impls.LocalityScheduler import LocalityScheduler
+from Service.impls.IndexAdvisor import IndexAdvisor
+from Service.impls.ShardResults import ShardResults
+from Service.SemanticCache import SemanticCache
+from Model.DatasetTestObj import select_shard
+from Model.RunOptions import RunOptions
 
 from Util.CommonUtil import CommonUtil
 from Util.SchemaUtil import SchemaUtil
 from Util.SqlLiteUtil import SqlLiteUtil
 from Util.EvaluationUtil import EvaluationUtil
+from Util.Log import Log
+from Util.ExecutionMemo import ExecutionMemo
+from Util.UsageLedger import UsageLedger
+from Util.BudgetGovernor import BudgetGovernor, BudgetExhausted
+from Util.ModelRouter import ModelRouter
+from Util.RateLimiter import RateLimiter
+from Util.MemoryDbCache import MemoryDbCache
+from Util.QueryCapture import QueryCapture
 
 import time
+from functools import partial
 
 
 class SpiderService:
     
     @staticmethod
-    def test_algo_on_spider_dataset(LLM_API_KEY, NUM_ITEMS_TO_TEST, SEED):
-
-        # Hashmap where key is db_id and value is db_path
-        spider_db_map = SqlLiteUtil.load_sqlite_databases("spider-1.0", base_path="Dataset")
-        
-        # Get the one RAG instance that will be ran for all items
-        rag = GetRag.get_spider_rag()
-        
-        # Load all items from dev.json into a list of DatasetTestObj objects
-        data_list = LoadDevJson.load_spider_dev_json()
-
-        # Deterministically select NUM_ITEMS_TO_TEST items using a SEED string
-        sampled_list = deterministic_random_sample(data_list, SEED, NUM_ITEMS_TO_TEST)
-        
-        # Init certain fields within each item for their llm call
-        updated_list = SetupDataObjsForLLM.setup_data_objs_for_llm(
-            sampled_list,
-            LLM_API_KEY,
-            rag,
-            spider_db_map,
-            SchemaUtil.extract_schema_from_sqlite,
-            SchemaUtil.schema_linking,
-            5
-        )
-        print(f"---------- Sleep 5 seconds to let llm API rate limit cool down\n\n")
-        time.sleep(5)
-
-        # Make sure necessary fields set before proceeding
-        for obj in updated_list:
-            fields_set_flag = CommonUtil.verify_dataset_test_obj_fields(obj)
-
-            if not fields_set_flag:
-                print(f"[ERROR] Item {obj.sort_id} - DB ID: {obj.dev_db_id} - Fields not set\n\nProcessing stopped...")
-                return
-
-        # Generate LLM SQL for each object
-        SqlLiteUtil.generate_sql_for_objs(updated_list, LLM_API_KEY)
-
-        
-        print(f"Completed processing {len(updated_list)} items sequentially.\n\n\n\n")
-        for obj in updated_list:
-
-            # Run SQL queries
-            obj.llm_sql_output = SqlLiteUtil.run_sql_query(obj.llm_returned_sql, spider_db_map[obj.dev_db_id])
-            obj.dev_gold_sql_output = SqlLiteUtil.run_sql_query(obj.dev_gold_sql, spider_db_map[obj.dev_db_id])
-
-            eval_obj = EvaluationUtil.evaluate_all(obj)
-            obj.em = eval_obj["em"]
-            obj.ex = eval_obj["ex"]
-            obj.partial_correctness = eval_obj["partial_correctness"]
-        
-
-        EvaluationUtil.print_avg_metrics(updated_list)
-        
-        
-
-        print(f"\n\n\n\n$$$$$$$$$$$$$$$$$$$$$$$$$$$$Completed processing {len(updated_list)} items sequentially.")
+    def test_algo_on_spider_dataset(LLM_API_KEY, NUM_ITEMS_TO_TEST, SEED, options=None):
 
+        # Returns the completed ( scored ) items in sort_id order; None when processing stopped early
+
+        # Optional knobs; defaults are the original behaviour
+        options = options or RunOptions()
+
+        # RSS and Python allocations at each stage boundary; None records nothing
+        profiler = options.memory_profiler
+
+        def checkpoint(stage):
+            if profiler:
+                profiler.checkpoint(stage)
+
+        checkpoint("start")
+
+        # Memo of execution results; in memory unless persist_exec_memo, pass your own to share or size it
+        exec_memo = options.exec_memo
+        owns_memo = exec_memo is None
+        if owns_memo:
+            exec_memo = ExecutionMemo(
+                persist_path=ExecutionMemo.default_persist_path() if options.persist_exec_memo else None
+            )
+
+        # Everything opened from here on is closed in the finally below, however the run ends
+        db_cache = capture = results_store = None
+        try:
+            # Hashmap where key is db_id and value is db_path
+            spider_db_map = SqlLiteUtil.load_sqlite_databases("spider-1.0", base_path="Dataset")
+            checkpoint("databases")
+
+            # Get the one RAG instance that will be ran for all items
+            rag = options.rag or GetRag.get_spider_rag(options.rag_build)
+            checkpoint("rag index")
+
+            # Near-duplicate question cache on top of the RAG vectors; off unless a threshold is set
+            semantic_cache = None
+            if options.semantic_cache_threshold is not None:
+                semantic_cache = SemanticCache(
+                    rag, threshold=options.semantic_cache_threshold, reuse_sql=options.semantic_cache_reuse_sql
+                )
+
+            # Deterministically select NUM_ITEMS_TO_TEST items using a SEED string
+            #
+            # Streams dev.json and only builds objects for the chosen items; "compat" picks the same
+            #   items as deterministic_random_sample() over the fully loaded list
+            sampled_list = LoadDevJson.sample_spider_dev_json(SEED, NUM_ITEMS_TO_TEST, mode=options.sample_mode)
+            checkpoint("sample")
+
+            # Sharded run: keep only this shard's items; every shard draws the same sample first
+            if options.num_shards > 1:
+                sampled_list = select_shard(sampled_list, SEED, options.shard_index, options.num_shards)
+                print(f"Shard {options.shard_index}/{options.num_shards}: {len(sampled_list)} of {NUM_ITEMS_TO_TEST} items")
+
+                # Small runs can leave a shard empty; it still writes its file so the merge sees it
+                if not sampled_list:
+                    if options.shard_dir:
+                        ShardResults.write_shard(
+                            options.shard_dir, "spider-1.0", SEED, NUM_ITEMS_TO_TEST,
+                            options.shard_index, options.num_shards, []
+                        )
+                    return []
+
+            # Group the work by database so schema, connection and page caches stay warm; results are
+            #   still reported in sort_id order
+            scheduler = LocalityScheduler.from_manifest(
+                SqlLiteUtil.load_sqlite_manifest("spider-1.0", base_path="Dataset"), mode=options.schedule, pool=options.worker_pool
+            )
+
+            # Tokens and cost of every LLM call in this run, per stage and per item
+            ledger = options.ledger or UsageLedger(f"spider-1.0 {SEED}")
+
+            # With a budget or a rate target, the governor runs the items in batches sized by what a
+            #   completed item has cost so far, and stops before the budget runs out
+            governor = None
+            if options.budget_usd is not None or options.budget_tokens is not None or options.tokens_per_minute is not None:
+                governor = BudgetGovernor(
+                    max_cost=options.budget_usd,
+                    max_tokens=options.budget_tokens,
+                    tokens_per_minute=options.tokens_per_minute,
+                    max_workers=options.workers,
+                ).attach(ledger)
+
+            # Per-stage models with cheap-first escalation; None keeps one model for every call
+            router = ModelRouter(options.model_routes) if options.model_routes else None
+
+            # Hot databases copied into memory for evaluation queries; None reads every query from the file
+            db_cache = MemoryDbCache(options.memory_db_budget) if options.memory_db_budget else None
+
+            # Evaluation runs on the index advisor's scratch copies when asked; Dataset/ files stay as they are
+            eval_db_map = IndexAdvisor.evaluation_db_map("spider-1.0", spider_db_map) if options.indexed_eval else spider_db_map
+
+            # Plan, time, rows and VM steps of every evaluated statement; None captures nothing
+            capture = QueryCapture(f"spider-1.0 {SEED}") if options.capture_path else None
+
+            # Both need numpy; imported here so importing the service stays light
+            from Util.EvaluationEngine import EvaluationEngine
+            from Util.ResultsStore import ResultsStore
+
+            # Metrics as items are scored, grouped by db_id, difficulty and outcome
+            engine = EvaluationEngine()
+
+            # Every field of every scored item, appended to a columnar store for later analysis
+            results_store = None
+            if options.results_path:
+                run_id = f"spider-1.0:{SEED}:shard-{options.shard_index}-of-{options.num_shards}:{time.strftime('%Y%m%dT%H%M%S')}"
+                results_store = ResultsStore(options.results_path, run_id=run_id)
+
+            def evaluate_item(obj):
+
+                # Run SQL queries; memoized, and EM-equal predictions reuse the gold result
+                with QueryCapture.scope(capture, db_id=obj.dev_db_id, sort_id=obj.sort_id):
+                    obj.dev_gold_sql_output, obj.llm_sql_output = SqlLiteUtil.run_gold_and_pred(
+                        obj.dev_gold_sql, obj.llm_returned_sql, eval_db_map[obj.dev_db_id], exec_memo, db_cache
+                    )
+
+                eval_obj = EvaluationUtil.evaluate_all(obj)
+                obj.em = eval_obj["em"]
+                obj.ex = eval_obj["ex"]
+                obj.partial_correctness = eval_obj["partial_correctness"]
+                obj.outcome = EvaluationEngine.outcome(obj)
+                engine.add(obj)
+                if results_store:
+                    results_store.append(obj)
+
+            # The cooldown is paid once per run, not once per governor batch
+            cooldown_pending = options.cooldown_seconds > 0
+
+            def run_batch(batch, workers):
+                # Setup, SQL generation and evaluation for some items; None if setup left fields unset
+                nonlocal cooldown_pending
+
+                # Init certain fields within each item for their llm call
+                updated_list = SetupDataObjsForLLM.setup_data_objs_for_llm(
+                    scheduler.order(batch),
+                    LLM_API_KEY,
+                    rag,
+                    spider_db_map,
+                    SchemaUtil.extract_schema_from_sqlite,
+                    partial(SchemaUtil.schema_linking, stream=options.stream_llm, router=router),
+                    5,
+                    semantic_cache,
+                    scheduler,
+                    workers
+                )
+                checkpoint("schema setup")
+                if cooldown_pending:
+                    cooldown_pending = False
+                    print(f"---------- Sleep {options.cooldown_seconds} seconds to let llm API rate limit cool down\n\n")
+                    time.sleep(options.cooldown_seconds)
+
+                # Make sure necessary fields set before proceeding
+                for obj in updated_list:
+                    fields_set_flag = CommonUtil.verify_dataset_test_obj_fields(obj)
+
+                    if not fields_set_flag:
+                        print(f"[ERROR] Item {obj.sort_id} - DB ID: {obj.dev_db_id} - Fields not set\n\nProcessing stopped...")
+                        return None
+
+                # Generate LLM SQL for each object
+                SqlLiteUtil.generate_sql_for_objs(
+                    updated_list,
+                    LLM_API_KEY,
+                    spider_db_map,
+                    num_candidates=options.sql_candidates,
+                    hedge=options.hedge,
+                    stream=options.stream_llm,
+                    semantic_cache=semantic_cache,
+                    router=router,
+                )
+
+                # Budget ran out mid-batch: items that never got SQL ( or only gave up ) are not results
+                if governor is not None and governor.exhausted:
+                    updated_list = [
+                        obj for obj in updated_list
+                        if obj.llm_returned_sql and not obj.llm_returned_sql.startswith("-- ERROR")
+                    ]
+
+                print(f"Completed processing {len(updated_list)} items sequentially.\n\n\n\n")
+                checkpoint("sql generation")
+
+                # Same per-database caps as setup; comes back in sort_id order
+                evaluated = scheduler.run(updated_list, evaluate_item, workers)
+                checkpoint("evaluation")
+
+                return evaluated
+
+            with ledger.activate():
+                if governor is None:
+                    updated_list = run_batch(sampled_list, options.workers)
+                    if updated_list is None:
+                        return
+
+                else:
+                    updated_list = []
+                    remaining = list(sampled_list)
+
+                    while remaining:
+                        batch_size = governor.next_batch_size(len(remaining))
+                        if batch_size == 0:
+                            break
+                        batch, remaining = remaining[:batch_size], remaining[batch_size:]
+
+                        try:
+                            completed = run_batch(batch, governor.workers())
+                        except BudgetExhausted as e:
+                            print(f"[WARN] {e}; the unfinished batch is dropped")
+                            break
+
+                        if completed is None:
+                            return
+
+                        updated_list.extend(completed)
+                        governor.batch_done(len(completed))
+
+                    updated_list = LocalityScheduler.restore_order(updated_list)
+                    print(f"Governor: {len(updated_list)} of {len(sampled_list)} items completed within budget; {governor.summary()}")
+
+            # Reports below are printed; let the queued pipeline log lines go first
+            Log.flush()
+
+            ledger.report(completed_items=len(updated_list))
+            if router:
+                router.report(ledger)
+            if RateLimiter.get():
+                print(f"Rate limiter ( shared by local processes ): {RateLimiter.get().stats()}")
+            if options.ledger_path:
+                ledger.write(options.ledger_path)
+
+            if results_store:
+                results_store.flush()
+                print(f"Results: {results_store.path} ( run {results_store.run_id}, {results_store.manifest['format']} )")
+
+            if capture:
+                capture.summary()
+
+            if db_cache:
+                print(f"Memory DB cache: {db_cache.stats()}")
+
+            # Result sets first: the items hold them, and each byte is charged to one structure only
+            if profiler:
+                profiler.attribute("rag index", rag)
+                profiler.attribute("result sets", [(obj.dev_gold_sql_output, obj.llm_sql_output) for obj in updated_list])
+                profiler.attribute("item store", updated_list)
+                profiler.attribute("execution memo", exec_memo)
+                profiler.report()
+
+            # Per-item results for ShardResults.merge(); written even when nothing completed, with the items
+            #   the budget dropped, so the merge can tell a partial shard from a missing one
+            if options.shard_dir:
+                completed_ids = {obj.sort_id for obj in updated_list}
+                ShardResults.write_shard(
+                    options.shard_dir, "spider-1.0", SEED, NUM_ITEMS_TO_TEST,
+                    options.shard_index, options.num_shards, updated_list,
+                    dropped=[obj.sort_id for obj in sampled_list if obj.sort_id not in completed_ids],
+                )
+
+            if not updated_list:
+                print("[WARN] No items completed; nothing to evaluate")
+                return updated_list
+
+            engine.report(bootstrap=options.bootstrap_replicates > 0, replicates=options.bootstrap_replicates)
+
+            if semantic_cache:
+                semantic_cache.evaluate_reuse(updated_list, eval_db_map, exec_memo)
+                semantic_cache.report()
+
+            print(f"Execution memo: {exec_memo.stats()}")
+
+            print(f"\n\n\n\n$$$$$$$$$$$$$$$$$$$$$$$$$$$$Completed processing {len(updated_list)} items sequentially.")
+
+            return updated_list
+
+        finally:
+            if results_store:
+                results_store.close()
+            if capture:
+                capture.write(options.capture_path)
+            if db_cache:
+                db_cache.close()
+            if owns_memo:
+                exec_memo.close()
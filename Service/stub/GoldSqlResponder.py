@@ -0,0 +1,128 @@
+import hashlib
+import json
+import os
+import re
+import threading
+
+from Service.impls.LoadDevJson import LoadDevJson
+
+
+class GoldSqlResponder:
+
+    # Templated completions for LLMStubServer built from the datasets' gold SQL
+    #
+    # Both prompts carry the dev question, so we look it up and answer like a decent model would:
+    #
+    #   schema linking : the schema lines whose table and column both appear in the gold SQL
+    #   SQL generation : the gold SQL in a ```sql fence, followed by chatter
+    #
+    # Noise, drawn from the rng the stub hands us ( deterministic per prompt ):
+    #
+    #   wrong_rate     : SQL that runs but answers something else ( EX drops, parsing is fine )
+    #   malformed_rate : output with no list / no SQL in it, to drive the retry paths
+    #
+    # replay_path is a JSON lines file of recorded completions, {"prompt_sha256": ..., "content": ...};
+    #   a recorded prompt is answered verbatim, everything else falls back to the templates
+
+    QUESTION_PATTERN = re.compile(r"\(\s*Question below\s*\)\n(.*?)\n\s*\n", re.DOTALL)
+
+    def __init__(self, dataset_names=("bird", "spider-1.0"), wrong_rate=0.0, malformed_rate=0.0, replay_path=None):
+        self.wrong_rate = wrong_rate
+        self.malformed_rate = malformed_rate
+
+        # KEY question, VALUE gold SQL
+        self.gold_sql = {}
+        for dataset_name in dataset_names:
+            path = LoadDevJson.BIRD_DEV_PATH if dataset_name == "bird" else LoadDevJson.SPIDER_DEV_PATH
+            sql_key = "SQL" if dataset_name == "bird" else "query"
+
+            if not os.path.exists(path):
+                continue
+
+            for item in LoadDevJson.iter_json_array(path):
+                self.gold_sql.setdefault(item.get("question", "").strip(), item.get(sql_key, ""))
+
+        # KEY sha256 of the prompt, VALUE recorded completion
+        self.replay = {}
+        if replay_path:
+            with open(replay_path, "r", encoding="utf-8") as f:
+                for line in f:
+                    if line.strip():
+                        record = json.loads(line)
+                        self.replay[record["prompt_sha256"]] = record["content"]
+
+        self.replayed = 0
+        self.malformed_sent = 0
+        self.wrong_sent = 0
+        self.unknown_questions = 0
+        self._lock = threading.Lock()
+
+    def _count(self, name):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def __call__(self, prompt, rng):
+        recorded = self.replay.get(hashlib.sha256(prompt.encode("utf-8")).hexdigest())
+        if recorded is not None:
+            self._count("replayed")
+            return recorded
+
+        match = GoldSqlResponder.QUESTION_PATTERN.search(prompt)
+        gold = self.gold_sql.get(match.group(1).strip()) if match else None
+        if gold is None:
+            self._count("unknown_questions")
+            gold = "SELECT 1"
+
+        malformed = rng.random() < self.malformed_rate
+        if malformed:
+            self._count("malformed_sent")
+
+        if "performing Schema Linking" in prompt:
+            if malformed:
+                return "Sure! The relevant schema items are the ones mentioned in the question."
+            return json.dumps(GoldSqlResponder.link_schema(prompt, gold))
+
+        if malformed:
+            return "I could not find enough information in the schema to write this query."
+
+        sql = gold.strip().rstrip(";")
+        if rng.random() < self.wrong_rate:
+            self._count("wrong_sent")
+            sql = GoldSqlResponder.perturb(sql, rng)
+
+        return f"```sql\n{sql};\n```\nThis query answers the question using the linked tables."
+
+    @staticmethod
+    def link_schema(prompt, gold):
+        # " - table.column" schema lines whose table and column are both named in the gold SQL
+
+        words = set(re.findall(r"[a-z_][a-z0-9_]*", gold.lower()))
+
+        linked = []
+        for line in prompt.splitlines():
+            line = line.strip()
+            if not line.startswith("- ") or "." not in line:
+                continue
+
+            table, column = line[2:].split(".", 1)
+            if table.lower() in words and column.lower() in words:
+                linked.append(f"{table}.{column}")
+
+        return linked or ["*"]
+
+    @staticmethod
+    def perturb(sql, rng):
+        # Still valid SQL, different result
+        choices = [f"SELECT * FROM ({sql}) LIMIT 0"]
+        if re.search(r"\bWHERE\b", sql, flags=re.IGNORECASE):
+            choices.append(re.sub(r"\bWHERE\b", "WHERE NOT", sql, count=1, flags=re.IGNORECASE))
+
+        return rng.choice(choices)
+
+    def stats(self):
+        return {
+            "replayed": self.replayed,
+            "malformed_sent": self.malformed_sent,
+            "wrong_sent": self.wrong_sent,
+            "unknown_questions": self.unknown_questions,
+        }
@@ -0,0 +1,231 @@
+import hashlib
+import json
+import math
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class LLMStubServer:
+
+    # Local stand-in for the OpenRouter chat completions endpoint
+    #
+    # Answers POST /api/v1/chat/completions with a completion from responder(prompt, rng), either as
+    #   one JSON body or, when the request has "stream": true, as server-sent events split into small
+    #   chunks. That is enough to exercise callLLM(stream=True) and its early-exit parsers offline:
+    #
+    #   stub = LLMStubServer().start()
+    #   os.environ["OPENROUTER_API_URL"] = stub.url
+    #
+    # For load tests it can also misbehave like the real thing:
+    #
+    #   latency   : "fixed:0.2", "uniform:0.1,0.6" or "lognormal:0.8,0.5" ( median, sigma ) seconds
+    #               before the first byte
+    #   rate_429  : share of requests answered 429 with a Retry-After
+    #   rate_5xx  : share of requests answered 503
+    #
+    # Every random choice comes from rng, seeded by (seed, prompt, how often we saw the prompt), so
+    #   the same run against the same stub gets the same answers whatever the thread timing
+    #
+    # streams_closed_early counts streams the client hung up on before [DONE]
+
+    PATH = "/api/v1/chat/completions"
+
+    def __init__(self, responder=None, host="127.0.0.1", port=0, chunk_size=8, chunk_delay=0.01,
+                 latency=None, rate_429=0.0, rate_5xx=0.0, seed="stub"):
+        self.responder = responder or LLMStubServer.default_responder
+        self.chunk_size = chunk_size
+        self.chunk_delay = chunk_delay
+
+        self.latency = LLMStubServer.parse_latency(latency)
+        self.rate_429 = rate_429
+        self.rate_5xx = rate_5xx
+        self.seed = seed
+
+        # KEY prompt hash, VALUE times seen; retries of one prompt get fresh draws
+        self._prompt_counts = {}
+
+        self.requests_served = 0
+        self.chunks_sent = 0
+        self.streams_closed_early = 0
+        self.injected_429 = 0
+        self.injected_5xx = 0
+        self._stats_lock = threading.Lock()
+
+        self._httpd = ThreadingHTTPServer((host, port), self._make_handler())
+        self._httpd.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}{self.PATH}"
+
+    @staticmethod
+    def parse_latency(spec):
+        # Latency spec -> function(rng) returning seconds
+
+        if not spec or spec == "none":
+            return lambda rng: 0.0
+
+        kind, _, params = spec.partition(":")
+        values = [float(v) for v in params.split(",") if v]
+
+        if kind == "fixed" and len(values) == 1:
+            return lambda rng: values[0]
+        if kind == "uniform" and len(values) == 2:
+            return lambda rng: rng.uniform(values[0], values[1])
+        if kind == "lognormal" and len(values) == 2:
+            return lambda rng: values[0] * math.exp(values[1] * rng.gauss(0.0, 1.0))
+
+        raise ValueError(f"Bad latency spec '{spec}'. Expected fixed:S, uniform:LO,HI or lognormal:MEDIAN,SIGMA")
+
+    def rng_for(self, prompt):
+        digest = hashlib.sha256(prompt.encode("utf-8")).hexdigest()
+
+        with self._stats_lock:
+            seen = self._prompt_counts.get(digest, 0)
+            self._prompt_counts[digest] = seen + 1
+
+        return random.Random(f"{self.seed}:{digest}:{seen}")
+
+    @staticmethod
+    def default_responder(prompt, rng=None):
+        # Chatty but well-formed answers, so early exit has something to skip
+
+        if "performing Schema Linking" in prompt:
+            return '["table.column"]\n\nI selected these because they are the only relevant columns.'
+
+        return "```sql\nSELECT 1;\n```\nThis query returns one row. Let me know if you need anything else!"
+
+    def _count(self, name, amount=1):
+        with self._stats_lock:
+            setattr(self, name, getattr(self, name) + amount)
+
+    def _make_handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+
+            # Keep the console quiet; the pipeline prints enough already
+            def log_message(self, format, *args):
+                pass
+
+            def _send_json(self, status, body, headers=None):
+                payload = json.dumps(body).encode("utf-8")
+                self.send_response(status)
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def do_POST(self):
+                if self.path.split("?")[0] != stub.PATH:
+                    self._send_json(404, {"error": {"message": f"no route {self.path}"}})
+                    return
+
+                body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+                prompt = body["messages"][-1]["content"]
+
+                stub._count("requests_served")
+                rng = stub.rng_for(prompt)
+
+                # Faults first, the way a provider fails before doing any work
+                fault = rng.random()
+                if fault < stub.rate_429:
+                    stub._count("injected_429")
+                    self._send_json(429, {"error": {"message": "rate limited", "code": 429}}, {"Retry-After": "0.1"})
+                    return
+                if fault < stub.rate_429 + stub.rate_5xx:
+                    stub._count("injected_5xx")
+                    self._send_json(503, {"error": {"message": "upstream unavailable", "code": 503}})
+                    return
+
+                time.sleep(stub.latency(rng))
+                stub.handle_completion(self, body, prompt, rng)
+
+        return Handler
+
+    def handle_completion(self, handler, body, prompt, rng):
+        # One completion; separate from the handler so a richer stub can override it
+
+        content = self.responder(prompt, rng)
+        model = body.get("model", "stub")
+        usage = self.usage(prompt, content)
+
+        if not body.get("stream"):
+            handler._send_json(200, {
+                "model": model,
+                "choices": [{"message": {"role": "assistant", "content": content}}],
+                "usage": usage,
+            })
+            return
+
+        self.stream_content(handler, model, content, usage)
+
+    @staticmethod
+    def usage(prompt, content):
+        # Same shape as OpenRouter's usage block; ~4 characters per token, no cost
+        prompt_tokens = max(1, len(prompt) // 4)
+        completion_tokens = max(1, len(content) // 4)
+
+        return {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens}
+
+    def stream_content(self, handler, model, content, usage=None):
+        handler.send_response(200)
+        handler.send_header("Content-Type", "text/event-stream")
+        handler.send_header("Cache-Control", "no-cache")
+        handler.end_headers()
+
+        try:
+            handler.wfile.write(b": OPENROUTER PROCESSING\n\n")
+
+            for i in range(0, len(content), self.chunk_size):
+                chunk = {"model": model, "choices": [{"delta": {"content": content[i:i + self.chunk_size]}}]}
+                handler.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+                handler.wfile.flush()
+                self._count("chunks_sent")
+
+                if self.chunk_delay:
+                    time.sleep(self.chunk_delay)
+
+            # OpenRouter sends usage with a final, empty chunk
+            if usage is not None:
+                chunk = {"model": model, "choices": [{"delta": {"content": ""}}], "usage": usage}
+                handler.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+
+            handler.wfile.write(b"data: [DONE]\n\n")
+            handler.wfile.flush()
+
+        except (BrokenPipeError, ConnectionResetError):
+            # Client got what it needed and closed the stream
+            self._count("streams_closed_early")
+
+    def start(self):
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def stats(self):
+        return {
+            "requests_served": self.requests_served,
+            "chunks_sent": self.chunks_sent,
+            "streams_closed_early": self.streams_closed_early,
+            "injected_429": self.injected_429,
+            "injected_5xx": self.injected_5xx,
+        }
+
+    def serve_forever(self):
+        print(f"[Stub] OpenRouter-compatible stub listening on {self.url}")
+        try:
+            self._httpd.serve_forever()
+        except KeyboardInterrupt:
+            print("[Stub] Stopped.")
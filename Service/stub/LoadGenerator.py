@@ -0,0 +1,107 @@
+import os
+import time
+
+from Model.RunOptions import RunOptions
+from Service.stub.GoldSqlResponder import GoldSqlResponder
+from Service.stub.LLMStubServer import LLMStubServer
+from Util.CommonUtil import CommonUtil
+from Util.UsageLedger import UsageLedger
+
+
+class LoadGenerator:
+
+    # Drives the full Spider / Bird pipeline against LLMStubServer and reports throughput
+    #
+    # Nothing is mocked below callLLM(): prompts, HTTP, SSE, retries, parsing, compile checks and
+    #   evaluation all run for real, only the model is the stub. Reports items per second and LLM
+    #   call latency percentiles per stage, plus what the stub injected
+    #
+    #   LoadGenerator("spider-1.0", 200, workers=8, stub_options={"latency": "lognormal:0.8,0.5",
+    #                 "rate_429": 0.05}).run()
+
+    def __init__(self, dataset_name, num_items, seed="load-test", url=None, stub_options=None,
+                 responder_options=None, run_options=None):
+        self.dataset_name = dataset_name
+        self.num_items = num_items
+        self.seed = seed
+
+        # url: an already running stub ( or endpoint ); None starts one in-process
+        self.url = url
+        self.stub_options = stub_options or {}
+        self.responder_options = responder_options or {}
+
+        # No cooldown by default; the stub has no rate limit to cool down from
+        self.run_options = run_options or {}
+        self.run_options.setdefault("cooldown_seconds", 0.0)
+
+    def run(self):
+        stub = responder = None
+        if self.url is None:
+            responder = GoldSqlResponder(dataset_names=(self.dataset_name,), **self.responder_options)
+            stub = LLMStubServer(responder=responder, **self.stub_options).start()
+            self.url = stub.url
+
+        previous_url = os.environ.get("OPENROUTER_API_URL")
+        os.environ["OPENROUTER_API_URL"] = self.url
+
+        ledger = UsageLedger(f"load test {self.dataset_name}")
+        options = RunOptions(ledger=ledger, **self.run_options)
+        retries_before = CommonUtil.llm_http_retries
+
+        completed = None
+        start = time.perf_counter()
+        try:
+            if self.dataset_name == "bird":
+                from Service.bird.BirdService import BirdService
+                completed = BirdService.test_algo_on_bird_dataset("stub-key", self.num_items, self.seed, options)
+            else:
+                from Service.spider.SpiderService import SpiderService
+                completed = SpiderService.test_algo_on_spider_dataset("stub-key", self.num_items, self.seed, options)
+        finally:
+            elapsed = time.perf_counter() - start
+
+            if previous_url is None:
+                os.environ.pop("OPENROUTER_API_URL", None)
+            else:
+                os.environ["OPENROUTER_API_URL"] = previous_url
+
+            if stub is not None:
+                stub.stop()
+
+        return self.report(ledger, elapsed, CommonUtil.llm_http_retries - retries_before, len(completed or []), stub, responder)
+
+    def report(self, ledger, elapsed, retries, items, stub=None, responder=None):
+        # items: completed items the run returned; semantic cache hits count, dropped items do not
+
+        lines = [
+            f"\n-----LOAD TEST ( {self.dataset_name}, {self.num_items} items, {self.run_options} )-----",
+            f"wall time: {elapsed:.2f}s",
+            f"items: {items} ( {items / elapsed if elapsed else 0.0:.2f} items/s )",
+            f"LLM calls: {ledger.total['calls']} ( {ledger.total['calls'] / elapsed if elapsed else 0.0:.2f} calls/s ), "
+            f"HTTP retries: {retries}",
+            "",
+            f"{'stage':<16} {'calls':>6} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'max ms':>9}",
+        ]
+
+        # Per-stage latency of successful calls, from the ledger
+        by_stage = {}
+        for entry in ledger.entries:
+            by_stage.setdefault(entry["stage"], []).append(entry["latency"])
+        by_stage["all"] = [entry["latency"] for entry in ledger.entries]
+
+        for stage, values in by_stage.items():
+            if values:
+                lines.append(
+                    f"{str(stage):<16} {len(values):>6} "
+                    + " ".join(f"{1000 * CommonUtil.percentile(values, p):>9.1f}" for p in (50, 95, 99, 100))
+                )
+
+        if stub is not None:
+            lines.append(f"\nstub: {stub.stats()}")
+        if responder is not None:
+            lines.append(f"responder: {responder.stats()}")
+
+        report = "\n".join(lines)
+        print(report)
+
+        return report
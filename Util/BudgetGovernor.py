@@ -0,0 +1,131 @@
+import threading
+import time
+
+
+class BudgetExhausted(RuntimeError):
+    # Raised by callLLM() once the run's budget is spent; the run stops starting new work
+    pass
+
+
+class BudgetGovernor:
+
+    # Spend control on top of a UsageLedger
+    #
+    # Holds a dollar and / or token budget and an optional tokens-per-minute target, and decides:
+    #
+    #   before_call()     : every LLM call; waits while over the TPM target, raises BudgetExhausted
+    #                       once the budget is gone
+    #   next_batch_size() : how many more items to start; a run goes in batches so each batch's
+    #                       measured cost per completed item sizes the next one, and we never start
+    #                       items the remaining budget cannot finish ( half-done items are waste )
+    #   workers()         : concurrency for the next batch; additive increase while under the TPM
+    #                       target, halved on a 429 or when over it
+    #
+    # Items per dollar is what we maximize: finishing fewer items completely beats starting them all
+
+    WINDOW_SECONDS = 60
+
+    def __init__(self, ledger=None, max_cost=None, max_tokens=None, tokens_per_minute=None,
+                 max_workers=1, first_batch=4, max_batch=64):
+        self.ledger = ledger
+        self.max_cost = max_cost
+        self.max_tokens = max_tokens
+        self.tokens_per_minute = tokens_per_minute
+
+        self.max_workers = max(1, max_workers)
+        self.first_batch = first_batch
+        self.max_batch = max_batch
+
+        # Start serial and earn concurrency
+        self._workers = 1
+
+        self.exhausted = False
+        self.throttled = 0
+        self.throttle_waits = 0.0
+        self.completed_items = 0
+        self._lock = threading.Lock()
+
+    def attach(self, ledger):
+        self.ledger = ledger
+        ledger.governor = self
+        return self
+
+    def _spent_fraction(self):
+        # How much of the tightest budget is used; 0.0 without a budget, and a budget of 0 is spent
+        fractions = [0.0]
+        if self.max_cost is not None:
+            fractions.append(self.ledger.cost() / self.max_cost if self.max_cost > 0 else 1.0)
+        if self.max_tokens is not None:
+            fractions.append(self.ledger.tokens() / self.max_tokens if self.max_tokens > 0 else 1.0)
+
+        return max(fractions)
+
+    def _observed_tpm(self):
+        return self.ledger.tokens_since(time.time() - self.WINDOW_SECONDS) * 60 / self.WINDOW_SECONDS
+
+    def before_call(self):
+        if self._spent_fraction() >= 1.0:
+            self.exhausted = True
+            raise BudgetExhausted(f"LLM budget spent ( cost ${self.ledger.cost():.4f}, {self.ledger.tokens()} tokens )")
+
+        # Rate target: wait for the window to drain below it
+        if self.tokens_per_minute:
+            while self._observed_tpm() >= self.tokens_per_minute:
+                time.sleep(0.25)
+                with self._lock:
+                    self.throttle_waits += 0.25
+
+    def on_throttled(self):
+        # Provider said 429; back off concurrency right away
+        with self._lock:
+            self.throttled += 1
+            self._workers = max(1, self._workers // 2)
+
+    def workers(self):
+        return self._workers
+
+    def batch_done(self, completed_items):
+        # Called after each batch with the number of items it finished
+
+        with self._lock:
+            self.completed_items += completed_items
+
+            if self.tokens_per_minute and self._observed_tpm() > self.tokens_per_minute:
+                self._workers = max(1, self._workers // 2)
+            else:
+                self._workers = min(self.max_workers, self._workers + 1)
+
+    def cost_per_item(self):
+        # Measured spend per completed item, as a fraction of the budget; None before the first batch
+        if not self.completed_items:
+            return None
+
+        return self._spent_fraction() / self.completed_items
+
+    def next_batch_size(self, remaining_items):
+        if self.exhausted or remaining_items <= 0 or self._spent_fraction() >= 1.0:
+            return 0
+
+        per_item = self.cost_per_item()
+        if per_item is None:
+            return min(remaining_items, self.first_batch)
+
+        if not per_item:
+            # No budget, only a rate target; spend doesn't limit the batch
+            return min(remaining_items, self.max_batch)
+
+        affordable = int((1.0 - self._spent_fraction()) / per_item)
+
+        return max(0, min(remaining_items, affordable, self.max_batch))
+
+    def summary(self):
+        return {
+            "spent_fraction": round(self._spent_fraction(), 4),
+            "cost": self.ledger.cost(),
+            "tokens": self.ledger.tokens(),
+            "completed_items": self.completed_items,
+            "exhausted": self.exhausted,
+            "throttled_429": self.throttled,
+            "throttle_wait_seconds": self.throttle_waits,
+            "workers": self._workers,
+        }
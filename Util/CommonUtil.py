@@ -1,8 +1,37 @@
 import os
 import json
-import requests
+import math
+import random
+import threading
+import time
+from collections import deque
+
+from Util.UsageLedger import UsageLedger
+from Util.RateLimiter import RateLimiter
+from Util.Log import Log
+
+# requests is imported inside callLLM(); paths that never call the LLM don't pay for it
 
 class CommonUtil:
+
+    # Model above from OpenRouter AI API was chosen for being cheap, performant, and non-reasoning
+    #
+    # Non-reasoning speeds things up a lot from my own testing; ModelRouter can pick others per stage
+    LLM_MODEL = "google/gemini-2.0-flash-001"
+
+    # Wall time of recent successful LLM calls, in seconds; drives the hedged-request threshold
+    _llm_latencies = deque(maxlen=500)
+
+    # Transient HTTP failures ( 429, 5xx, connection errors, timeouts ) retried inside one callLLM()
+    LLM_HTTP_RETRIES = 3
+    llm_http_retries = 0
+    _llm_retry_lock = threading.Lock()
+
+    # One pooled HTTP client for every LLM call in the process ( all workers, all concurrent runs ),
+    #   so connections are reused instead of opened per call
+    LLM_HTTP_POOL_SIZE = 64
+    _http_session = None
+    _http_session_lock = threading.Lock()
     
     @staticmethod
     def _get_api_key(config_path=None):
@@ -43,31 +72,234 @@ class CommonUtil:
         )
 
     @staticmethod
-    def callLLM(api_key, prompt):
+    def get_cache_dir(*parts):
+        # Project-local cache directory ( Cache/ next to Main.py ), created on first use
+        #
+        # Everything in here can be deleted; it is rebuilt on the next run
+
+        path = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "Cache", *parts))
+        os.makedirs(path, exist_ok=True)
+
+        return path
+
+    @staticmethod
+    def get_llm_url():
+        # OpenRouter chat completions URL; OPENROUTER_API_URL points the whole pipeline at a local stub
+
+        return os.environ.get("OPENROUTER_API_URL", "https://openrouter.ai/api/v1/chat/completions")
+
+    @staticmethod
+    def callLLM(api_key, prompt, stream=False, early_exit=None, model=None):
         # Wrapper function to call the LLM API
+        #
+        # stream=True reads the completion as server-sent events. After every chunk, early_exit(text)
+        #   is asked whether the text so far already holds the answer; when it returns a string we
+        #   close the stream and return that string, skipping the rest of a chatty completion
+        #
+        # Every call is charged to the active UsageLedger, under the current UsageLedger.scope();
+        #   its governor ( if any ) can hold the call back or stop it with BudgetExhausted
+        #
+        # 429s, 5xx and dropped connections are retried with backoff ( Retry-After when given );
+        #   anything else, and the last failure, is raised like before
+        #
+        # With a RateLimiter configured, every attempt first waits for its share of the request and
+        #   token rate that all local processes draw from. However the attempt ends, the reservation is
+        #   settled: the tokens the call reported are charged, and a call that failed first gives it all back
 
-        # Model to use
-        model="google/gemini-2.0-flash-001"
+        # Model to use; None is the default model
+        model = model or CommonUtil.LLM_MODEL
 
         # OpenRouter API URL
-        url = "https://openrouter.ai/api/v1/chat/completions"
+        url = CommonUtil.get_llm_url()
         
         # Headers with API key
         headers = {"Authorization": f"Bearer {api_key}"}
         
-        # Data with model and prompt
-        data = {"model": model, "messages": [{"role": "user", "content": prompt}]}
+        # Data with model and prompt; usage.include makes OpenRouter report tokens AND cost
+        data = {"model": model, "messages": [{"role": "user", "content": prompt}], "usage": {"include": True}}
 
-        # Model above from OpenRouter AI API was chosen for being cheap, performant, and non-reasoning
-        #
-        # Non-reasoning speeds things up a lot from my own testing
-        resp = requests.post(url, headers=headers, json=data, timeout=10)
+        import requests
+
+        ledger = UsageLedger.current()
+        limiter = RateLimiter.get()
+
+        for attempt in range(CommonUtil.LLM_HTTP_RETRIES + 1):
+            if ledger.governor is not None:
+                ledger.governor.before_call()
+
+            reserved = limiter.acquire(prompt) if limiter else 0
+
+            # Filled with the ledger entry once the call has been recorded
+            charged = {}
+
+            try:
+                try:
+                    if stream:
+                        return CommonUtil._call_llm_streaming(url, headers, data, early_exit, ledger, limiter, charged)
+
+                    return CommonUtil._call_llm_once(url, headers, data, ledger, limiter, charged)
+
+                finally:
+                    if limiter is not None:
+                        limiter.settle(reserved, charged.get("prompt_tokens"), charged.get("completion_tokens"))
+
+            except requests.RequestException as e:
+                delay = CommonUtil._retry_delay(e, attempt)
+                if delay is None or attempt == CommonUtil.LLM_HTTP_RETRIES:
+                    raise
+
+                with CommonUtil._llm_retry_lock:
+                    CommonUtil.llm_http_retries += 1
+
+                Log.warn("LLM call failed; retrying", error=str(e), delay=round(delay, 2), sample="llm_http_retry")
+                time.sleep(delay)
+
+    @staticmethod
+    def get_http_session():
+        if CommonUtil._http_session is None:
+            with CommonUtil._http_session_lock:
+                if CommonUtil._http_session is None:
+                    import requests
+                    from requests.adapters import HTTPAdapter
+
+                    session = requests.Session()
+                    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=CommonUtil.LLM_HTTP_POOL_SIZE)
+                    session.mount("http://", adapter)
+                    session.mount("https://", adapter)
+                    CommonUtil._http_session = session
+
+        return CommonUtil._http_session
+
+    @staticmethod
+    def _retry_delay(error, attempt):
+        # Seconds to wait before retrying, or None when the error is not worth retrying
+
+        import requests
+
+        response = getattr(error, "response", None)
+        if response is not None:
+            if response.status_code != 429 and response.status_code < 500:
+                return None
+
+            retry_after = response.headers.get("Retry-After")
+            if retry_after:
+                try:
+                    return float(retry_after)
+                except ValueError:
+                    pass
+
+        elif not isinstance(error, (requests.ConnectionError, requests.Timeout)):
+            return None
+
+        # Exponential backoff with jitter, so parallel workers don't retry in lockstep
+        return min(8.0, 0.5 * 2 ** attempt) * random.uniform(0.5, 1.0)
+
+    @staticmethod
+    def _call_llm_once(url, headers, data, ledger, limiter=None, charged=None):
+        model = data["model"]
+        prompt = data["messages"][-1]["content"]
+
+        start = time.perf_counter()
+        resp = CommonUtil.get_http_session().post(url, headers=headers, json=data, timeout=10)
         
         # Raise for status
-        resp.raise_for_status()
+        CommonUtil._raise_for_status(resp, ledger, limiter)
+
+        latency = time.perf_counter() - start
+
+        body = resp.json()
+        content = body["choices"][0]["message"]["content"]
+        CommonUtil._record_call(ledger, model, body.get("usage"), latency, prompt, content, charged)
         
         # Return content
-        return resp.json()["choices"][0]["message"]["content"]
+        return content
+
+    @staticmethod
+    def _record_call(ledger, model, usage, latency, prompt, completion, charged=None):
+        # A finished call: latency sample and ledger entry; charged gets the entry for callLLM() to
+        #   settle the rate limiter with
+        CommonUtil._llm_latencies.append(latency)
+        entry = ledger.record(model, usage, latency, prompt, completion)
+
+        if charged is not None:
+            charged.update(entry)
+
+    @staticmethod
+    def _raise_for_status(resp, ledger, limiter=None):
+        # A 429 tells the governor and the rate limiter to back off before the error propagates
+        if resp.status_code == 429:
+            if ledger.governor is not None:
+                ledger.governor.on_throttled()
+
+            if limiter is not None:
+                try:
+                    limiter.on_throttled(float(resp.headers.get("Retry-After") or 0))
+                except ValueError:
+                    limiter.on_throttled()
+
+        resp.raise_for_status()
+
+    @staticmethod
+    def _call_llm_streaming(url, headers, data, early_exit=None, ledger=None, limiter=None, charged=None):
+        # SSE version of callLLM; OpenRouter sends lines like
+        #
+        #   : OPENROUTER PROCESSING
+        #   data: {"choices": [{"delta": {"content": "SELECT"}}]}
+        #   data: {"choices": [...], "usage": {"prompt_tokens": 812, "completion_tokens": 40, "cost": ...}}
+        #   data: [DONE]
+        #
+        # usage only comes with the last chunk; a stream closed early is charged an estimate
+
+        ledger = ledger or UsageLedger.current()
+        model = data["model"]
+        prompt = data["messages"][-1]["content"]
+
+        start = time.perf_counter()
+        resp = CommonUtil.get_http_session().post(url, headers=headers, json=dict(data, stream=True), timeout=10, stream=True)
+
+        try:
+            # Raise for status
+            CommonUtil._raise_for_status(resp, ledger, limiter)
+
+            text = ""
+            usage = None
+            for line in resp.iter_lines(decode_unicode=True):
+
+                # Keep-alive comments and blank separators
+                if not line or not line.startswith("data:"):
+                    continue
+
+                payload = line[len("data:"):].strip()
+                if payload == "[DONE]":
+                    break
+
+                chunk = json.loads(payload)
+                usage = chunk.get("usage") or usage
+                choices = chunk.get("choices") or [{}]
+                text += (choices[0].get("delta") or {}).get("content") or ""
+
+                # Stop reading as soon as the answer is complete; closing the response drops the rest
+                if early_exit is not None:
+                    answer = early_exit(text)
+                    if answer is not None:
+                        CommonUtil._record_call(ledger, model, usage, time.perf_counter() - start, prompt, text, charged)
+                        return answer
+
+            CommonUtil._record_call(ledger, model, usage, time.perf_counter() - start, prompt, text, charged)
+            return text
+
+        finally:
+            resp.close()
+
+    @staticmethod
+    def llm_latency_percentile(p, default, min_samples=20):
+        # Percentile of recent LLM call latencies; default until we have seen enough calls
+
+        samples = list(CommonUtil._llm_latencies)
+        if len(samples) < min_samples:
+            return default
+
+        return CommonUtil.percentile(samples, p)
 
     @staticmethod
     def verify_dataset_test_obj_fields(obj):
@@ -111,3 +343,17 @@ class CommonUtil:
         
         # All fields are set
         return True
+
+    @staticmethod
+    def percentile(values, p):
+        # Nearest-rank percentile of a list of numbers, p between 0 and 100
+        #
+        # Small helper so latency reports don't need numpy
+
+        if not values:
+            return 0.0
+
+        ordered = sorted(values)
+        rank = max(1, math.ceil(p / 100.0 * len(ordered)))
+
+        return ordered[min(rank, len(ordered)) - 1]
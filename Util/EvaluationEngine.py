@@ -0,0 +1,246 @@
+import threading
+
+import numpy as np
+
+
+class EvaluationEngine:
+
+    # Per-item metrics in NumPy columns, with grouped means and confidence intervals
+    #
+    # Items are added as they are scored. Each one appends EM, EX and partial correctness to float
+    #   columns and its db_id, difficulty and outcome to integer code columns ( categories are
+    #   interned once ). Running count / sum / sum of squares per group are updated on the way in,
+    #   so means and normal-approximation CIs for any grouping cost O(groups), not a pass over items
+    #
+    # Bootstrap CIs resample the columns with Poisson(1) weights ( the streaming-friendly bootstrap ),
+    #   in blocks of replicates so memory stays bounded; every group of a dimension comes out of one
+    #   np.bincount per block
+    #
+    # outcome is where the item ended up:
+    #
+    #   gen_failed : no SQL came back ( empty, or the "-- ERROR" placeholder )
+    #   gold_error : the gold query failed to execute
+    #   pred_error : the predicted query failed to execute
+    #   wrong      : both ran, EX = 0
+    #   correct    : EX = 1
+
+    METRICS = ("em", "ex", "partial_correctness")
+    DIMENSIONS = ("db_id", "difficulty", "outcome")
+
+    def __init__(self, capacity=1024):
+        self._size = 0
+        self._values = np.zeros((len(EvaluationEngine.METRICS), capacity), dtype=np.float64)
+        self._codes = np.zeros((len(EvaluationEngine.DIMENSIONS), capacity), dtype=np.int32)
+
+        # Per dimension: KEY category, VALUE code, and the categories in code order
+        self._code_of = [{} for _ in EvaluationEngine.DIMENSIONS]
+        self._categories = [[] for _ in EvaluationEngine.DIMENSIONS]
+
+        # Per dimension: running (count, sum, sum of squares) per code; shape (groups,) and (metrics, groups)
+        self._counts = [np.zeros(0, dtype=np.int64) for _ in EvaluationEngine.DIMENSIONS]
+        self._sums = [np.zeros((len(EvaluationEngine.METRICS), 0)) for _ in EvaluationEngine.DIMENSIONS]
+        self._squares = [np.zeros((len(EvaluationEngine.METRICS), 0)) for _ in EvaluationEngine.DIMENSIONS]
+
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return self._size
+
+    @staticmethod
+    def outcome(obj):
+        sql = obj.llm_returned_sql or ""
+        if not sql.strip() or sql.startswith("-- ERROR"):
+            return "gen_failed"
+        if obj.dev_gold_sql_output is None:
+            return "gold_error"
+        if obj.llm_sql_output is None:
+            return "pred_error"
+        return "correct" if obj.ex else "wrong"
+
+    @staticmethod
+    def from_objs(obj_list):
+        return EvaluationEngine(capacity=max(1, len(obj_list))).extend(obj_list)
+
+    def _code(self, dimension, category):
+        code = self._code_of[dimension].get(category)
+        if code is None:
+            code = len(self._categories[dimension])
+            self._code_of[dimension][category] = code
+            self._categories[dimension].append(category)
+
+            self._counts[dimension] = np.append(self._counts[dimension], 0)
+            self._sums[dimension] = np.pad(self._sums[dimension], ((0, 0), (0, 1)))
+            self._squares[dimension] = np.pad(self._squares[dimension], ((0, 0), (0, 1)))
+
+        return code
+
+    def _reserve(self, extra):
+        capacity = self._values.shape[1]
+        if self._size + extra <= capacity:
+            return
+
+        capacity = max(self._size + extra, 2 * capacity)
+        self._values = np.pad(self._values, ((0, 0), (0, capacity - self._values.shape[1])))
+        self._codes = np.pad(self._codes, ((0, 0), (0, capacity - self._codes.shape[1])))
+
+    def extend(self, obj_list):
+        # Add scored items; outcome is taken from obj.outcome when set, else derived
+
+        obj_list = list(obj_list)
+        if not obj_list:
+            return self
+
+        values = np.array([[obj.em, obj.ex, obj.partial_correctness] for obj in obj_list], dtype=np.float64).T
+
+        with self._lock:
+            codes = np.array([
+                [
+                    self._code(0, obj.dev_db_id),
+                    self._code(1, getattr(obj, "difficulty", "") or "-"),
+                    self._code(2, getattr(obj, "outcome", "") or EvaluationEngine.outcome(obj)),
+                ]
+                for obj in obj_list
+            ], dtype=np.int32).T
+
+            self._reserve(len(obj_list))
+            start, end = self._size, self._size + len(obj_list)
+            self._values[:, start:end] = values
+            self._codes[:, start:end] = codes
+            self._size = end
+
+            # Running per-group totals
+            for dimension in range(len(EvaluationEngine.DIMENSIONS)):
+                groups = len(self._categories[dimension])
+                self._counts[dimension] += np.bincount(codes[dimension], minlength=groups)
+                for m in range(len(EvaluationEngine.METRICS)):
+                    self._sums[dimension][m] += np.bincount(codes[dimension], weights=values[m], minlength=groups)
+                    self._squares[dimension][m] += np.bincount(codes[dimension], weights=values[m] ** 2, minlength=groups)
+
+        return self
+
+    def add(self, obj):
+        return self.extend([obj])
+
+    def means(self):
+        # {metric: mean over every item}
+        with self._lock:
+            if not self._size:
+                return {metric: 0.0 for metric in EvaluationEngine.METRICS}
+
+            totals = self._sums[0].sum(axis=1)
+            return {metric: float(totals[m] / self._size) for m, metric in enumerate(EvaluationEngine.METRICS)}
+
+    def grouped(self, by, z=1.96):
+        # {category: {"count": n, metric: (mean, low, high)}} from the running totals
+        #
+        # low / high: normal approximation, mean +- z * sd / sqrt(n), clipped to [0, 1] like the metrics
+
+        dimension = EvaluationEngine.DIMENSIONS.index(by)
+
+        with self._lock:
+            counts = self._counts[dimension].astype(np.float64)
+            sums = self._sums[dimension].copy()
+            squares = self._squares[dimension].copy()
+            categories = list(self._categories[dimension])
+
+        safe = np.maximum(counts, 1)
+        means = sums / safe
+        variance = np.maximum(squares / safe - means ** 2, 0.0)
+        half = z * np.sqrt(variance / safe)
+
+        return {
+            category: {
+                "count": int(counts[g]),
+                **{metric: (float(means[m, g]), float(max(0.0, means[m, g] - half[m, g])), float(min(1.0, means[m, g] + half[m, g])))
+                   for m, metric in enumerate(EvaluationEngine.METRICS)},
+            }
+            for g, category in enumerate(categories)
+        }
+
+    def bootstrap(self, by=None, replicates=1000, alpha=0.05, seed=0, block_cells=4_000_000):
+        # Percentile bootstrap CIs: {category: {metric: (low, high)}}; by=None is one "all" group
+
+        with self._lock:
+            n = self._size
+            values = self._values[:, :n].copy()
+            if by is None:
+                codes, categories = np.zeros(n, dtype=np.int64), ["all"]
+            else:
+                dimension = EvaluationEngine.DIMENSIONS.index(by)
+                codes, categories = self._codes[dimension, :n].astype(np.int64), list(self._categories[dimension])
+
+        if not n:
+            return {}
+
+        groups = len(categories)
+        rng = np.random.default_rng(seed)
+        block = max(1, block_cells // n)
+
+        # (replicates, metrics, groups) means
+        estimates = np.empty((replicates, len(EvaluationEngine.METRICS), groups))
+
+        for start in range(0, replicates, block):
+            b = min(block, replicates - start)
+            weights = rng.poisson(1.0, size=(b, n)).astype(np.float64)
+
+            # Replicate r, group g lands in bin r * groups + g
+            bins = (np.arange(b)[:, None] * groups + codes[None, :]).ravel()
+            weight_totals = np.bincount(bins, weights=weights.ravel(), minlength=b * groups).reshape(b, groups)
+
+            for m in range(len(EvaluationEngine.METRICS)):
+                sums = np.bincount(bins, weights=(weights * values[m]).ravel(), minlength=b * groups).reshape(b, groups)
+                # A replicate that drew none of a group's items says nothing about it
+                with np.errstate(invalid="ignore", divide="ignore"):
+                    estimates[start:start + b, m] = np.where(weight_totals > 0, sums / weight_totals, np.nan)
+
+        low, high = np.nanquantile(estimates, [alpha / 2, 1 - alpha / 2], axis=0)
+
+        return {
+            category: {metric: (float(low[m, g]), float(high[m, g])) for m, metric in enumerate(EvaluationEngine.METRICS)}
+            for g, category in enumerate(categories)
+        }
+
+    def report(self, by=DIMENSIONS, bootstrap=False, replicates=1000, max_groups=30):
+        # The MEAN METRICS block print_avg_metrics() always printed, then CIs and breakdowns
+
+        means = self.means()
+        print(f"\n\n\n-----MEAN METRICS-----\n\n\nAverage EM: {means['em']}")
+        print(f"Average EX: {means['ex']}")
+        print(f"Average partial_correctness: {means['partial_correctness']}")
+
+        if not self._size:
+            return ""
+
+        method = f"bootstrap, {replicates} replicates" if bootstrap else "normal approximation"
+        lines = [f"\n{self._size} items, 95% CIs ( {method} )"]
+
+        overall = self.bootstrap(replicates=replicates)["all"] if bootstrap else None
+
+        for dimension in by:
+            groups = self.grouped(dimension)
+            intervals = self.bootstrap(by=dimension, replicates=replicates) if bootstrap else None
+
+            lines += ["", f"{dimension:<28} {'n':>6} " + " ".join(f"{metric[:7]:>21}" for metric in EvaluationEngine.METRICS)]
+
+            rows = sorted(groups.items(), key=lambda kv: -kv[1]["count"])
+            for category, stats in rows[:max_groups]:
+                cells = []
+                for metric in EvaluationEngine.METRICS:
+                    mean, low, high = stats[metric]
+                    if intervals is not None:
+                        low, high = intervals[category][metric]
+                    cells.append(f"{mean:>6.3f} [{low:>5.3f},{high:>5.3f}]")
+                lines.append(f"{str(category)[:28]:<28} {stats['count']:>6} " + " ".join(f"{c:>21}" for c in cells))
+
+            if len(rows) > max_groups:
+                lines.append(f"... {len(rows) - max_groups} more")
+
+        if overall is not None:
+            lines.insert(1, "overall: " + ", ".join(
+                f"{metric} [{low:.3f}, {high:.3f}]" for metric, (low, high) in overall.items()
+            ))
+
+        report = "\n".join(lines)
+        print(report)
+
+        return report
@@ -1,15 +1,27 @@
+import re
 from typing import List, Tuple
 from collections import Counter
 
 
 class EvaluationUtil:
 
+    # Quoted strings and identifiers, '' / "" escapes included
+    _quoted_re = re.compile(r"('(?:[^']|'')*'|\"(?:[^\"]|\"\")*\")")
+
     @staticmethod
-    def _normalize_sql(sql):
+    def _normalize_sql(sql, keep_case=False):
         # Check if sql
         if not sql:
             return ""
 
+        # keep_case is for execution memo keys: the SQL must still mean the same query, so quoted
+        #   literals stay exactly as written ( 'Alice' vs 'alice', 'a  b' vs 'a b' ) and only the
+        #   whitespace between them is collapsed
+        if keep_case:
+            parts = EvaluationUtil._quoted_re.split(sql.strip().rstrip(";"))
+            parts[::2] = [re.sub(r"\s+", " ", part) for part in parts[::2]]
+            return "".join(parts).strip()
+
         # Sanitize
         cleaned = sql.strip().rstrip(";")
         cleaned = " ".join(cleaned.split())
@@ -126,26 +138,15 @@ class EvaluationUtil:
         }
     
     @staticmethod
-    def print_avg_metrics(list_of_objs):
-        # Print average metrics for a list of objects
-
-        # Init sums
-        em_sum = 0
-        ex_sum = 0
-        partial_correctness_sum = 0
-
-        # Loop through each object, add to sums
-        for obj in list_of_objs:
-            em_sum += obj.em
-            ex_sum += obj.ex
-            partial_correctness_sum += obj.partial_correctness
-
-        # Calculate averages
-        avg_em = em_sum / len(list_of_objs)
-        avg_ex = ex_sum / len(list_of_objs)
-        avg_partial_correctness = partial_correctness_sum / len(list_of_objs)
-
-        # Print averages
-        print(f"\n\n\n-----MEAN METRICS-----\n\n\nAverage EM: {avg_em}")
-        print(f"Average EX: {avg_ex}")
-        print(f"Average partial_correctness: {avg_partial_correctness}")
+    def print_avg_metrics(list_of_objs, bootstrap_replicates=0):
+        # Print average metrics for a list of objects, then the per db_id / difficulty / outcome
+        #   breakdown; runs that score items as they go feed an EvaluationEngine directly instead
+        #
+        # Imported here: EvaluationEngine needs numpy, and most importers of this module never print
+        from Util.EvaluationEngine import EvaluationEngine
+
+        engine = EvaluationEngine.from_objs(list_of_objs)
+
+        if bootstrap_replicates:
+            return engine.report(bootstrap=True, replicates=bootstrap_replicates)
+        return engine.report()
@@ -0,0 +1,166 @@
+import hashlib
+import marshal
+import os
+import sqlite3
+import threading
+from collections import OrderedDict
+
+from Util.CommonUtil import CommonUtil
+from Util.EvaluationUtil import EvaluationUtil
+
+
+class ExecutionMemo:
+
+    # Memo of SQL execution results keyed by (database file hash, normalized SQL)
+    #
+    # The same gold query runs for every model, prompt variant and repeated run, and a lot of
+    #   predicted queries repeat too. Re-running them on SQLite is pure waste as long as the database
+    #   file is the same, so the key uses the file's content hash, not its path
+    #
+    # Results live in memory under a byte budget ( LRU ), and optionally in a small SQLite file so the
+    #   next run starts warm. Failed queries ( run_sql_query returns None ) are memoized in memory
+    #   only: the failure may be transient ( "database is locked" ) and must not outlive the run
+    #
+    # Results are serialized with marshal: rows are tuples of int/float/str/bytes/None, which it
+    #   handles natively and fast
+
+    def __init__(self, max_bytes=256 * 1024 * 1024, persist_path=None):
+        self.max_bytes = max_bytes
+        self.bytes_used = 0
+
+        # KEY memo key, VALUE (result, size in bytes); most recently used at the end
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+        # KEY (path, size, mtime_ns), VALUE content hash
+        self._fingerprints = {}
+
+        self.hits = 0
+        self.misses = 0
+        self.short_circuits = 0
+
+        self._conn = None
+        if persist_path:
+            self._conn = sqlite3.connect(persist_path, check_same_thread=False)
+            self._conn.execute("CREATE TABLE IF NOT EXISTS memo (key TEXT PRIMARY KEY, result BLOB)")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS fingerprint "
+                "(path TEXT, size INTEGER, mtime_ns INTEGER, digest TEXT, PRIMARY KEY (path, size, mtime_ns))"
+            )
+            self._conn.commit()
+
+    @staticmethod
+    def default_persist_path():
+        return os.path.join(CommonUtil.get_cache_dir(), "exec_memo.sqlite")
+
+    def db_fingerprint(self, db_path):
+        # SHA-256 of the database file, computed once per (path, size, mtime)
+
+        stat = os.stat(db_path)
+        stat_key = (os.path.abspath(db_path), stat.st_size, stat.st_mtime_ns)
+
+        digest = self._fingerprints.get(stat_key)
+        if digest is not None:
+            return digest
+
+        if self._conn is not None:
+            with self._lock:
+                row = self._conn.execute(
+                    "SELECT digest FROM fingerprint WHERE path = ? AND size = ? AND mtime_ns = ?", stat_key
+                ).fetchone()
+            if row:
+                self._fingerprints[stat_key] = row[0]
+                return row[0]
+
+        sha = hashlib.sha256()
+        with open(db_path, "rb") as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                sha.update(chunk)
+        digest = sha.hexdigest()
+
+        self._fingerprints[stat_key] = digest
+        if self._conn is not None:
+            with self._lock:
+                self._conn.execute("INSERT OR REPLACE INTO fingerprint VALUES (?, ?, ?, ?)", stat_key + (digest,))
+                self._conn.commit()
+
+        return digest
+
+    def key(self, sql, db_path):
+        # Case is kept: string literals are case-sensitive in SQLite
+        return f"{self.db_fingerprint(db_path)}:{EvaluationUtil._normalize_sql(sql, keep_case=True)}"
+
+    def get(self, key):
+        # Returns (found, result)
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return True, entry[0]
+
+            row = None
+            if self._conn is not None:
+                row = self._conn.execute("SELECT result FROM memo WHERE key = ?", (key,)).fetchone()
+
+            # Memo files written before failures stopped being persisted may still hold some
+            if row is not None and marshal.loads(row[0]) is None:
+                self._conn.execute("DELETE FROM memo WHERE key = ?", (key,))
+                self._conn.commit()
+                row = None
+
+            if row is None:
+                self.misses += 1
+                return False, None
+
+            self.hits += 1
+
+        # Promote the persisted result into memory
+        result = marshal.loads(row[0])
+        self._remember(key, result, len(row[0]))
+        return True, result
+
+    def put(self, key, result):
+        blob = marshal.dumps(result)
+        self._remember(key, result, len(blob))
+
+        if self._conn is not None and result is not None:
+            with self._lock:
+                self._conn.execute("INSERT OR REPLACE INTO memo VALUES (?, ?)", (key, blob))
+                self._conn.commit()
+
+    def _remember(self, key, result, nbytes):
+        # Results bigger than the whole budget are never kept in memory
+        if nbytes > self.max_bytes:
+            return
+
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.bytes_used -= old[1]
+
+            self._entries[key] = (result, nbytes)
+            self.bytes_used += nbytes
+
+            # Evict least recently used until we are back under budget
+            while self.bytes_used > self.max_bytes:
+                _, (_, evicted_bytes) = self._entries.popitem(last=False)
+                self.bytes_used -= evicted_bytes
+
+    def stats(self):
+        lookups = self.hits + self.misses
+
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+            "short_circuits": self.short_circuits,
+            "entries": len(self._entries),
+            "bytes_used": self.bytes_used,
+        }
+
+    def close(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
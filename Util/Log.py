@@ -0,0 +1,170 @@
+import atexit
+import json
+import logging
+import os
+import queue
+import sys
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from logging.handlers import QueueHandler, QueueListener
+
+from Util.UsageLedger import UsageLedger
+
+
+# Extra fields for every log line of the running code ( db_id, shard, ... )
+_log_context = ContextVar("log_context", default={})
+
+
+class _TextFormatter(logging.Formatter):
+
+    # The lines print() used to write: "[WARN] ..." / "[ERROR] ..." prefixes, plain INFO; fields at the end
+
+    PREFIX = {logging.DEBUG: "[DEBUG] ", logging.WARNING: "[WARN] ", logging.ERROR: "[ERROR] ", logging.CRITICAL: "[ERROR] "}
+
+    def format(self, record):
+        fields = getattr(record, "fields", None)
+        suffix = "  | " + " ".join(f"{k}={v}" for k, v in fields.items()) if fields else ""
+
+        return f"{_TextFormatter.PREFIX.get(record.levelno, '')}{record.getMessage()}{suffix}"
+
+
+class _JsonFormatter(logging.Formatter):
+
+    def format(self, record):
+        return json.dumps({
+            "ts": round(record.created, 6),
+            "level": record.levelname.lower(),
+            "msg": record.getMessage(),
+            "thread": record.threadName,
+            **getattr(record, "fields", {}),
+        }, default=str)
+
+
+class Log:
+
+    # Structured logging with a background writer
+    #
+    # Log.info("Processing item", db_id=...) puts a record on a queue and returns; one listener thread
+    #   formats and writes, so workers never wait on stdout and lines never interleave mid-line
+    #
+    # Every line carries the caller's context: stage and item from UsageLedger.scope(), plus anything
+    #   set with Log.context(). Output is the familiar text ( "[WARN] ..." ) or JSON lines
+    #
+    # Hot retry paths pass sample="key": the first SAMPLE_FIRST lines of that key are written, then
+    #   one in SAMPLE_EVERY, each with seen=<count so far>
+    #
+    # Configured from Cli.py ( --log-level, --log-json, --log-file ) or LOG_LEVEL / LOG_FORMAT=json;
+    #   the first log call configures the defaults ( INFO, text, stdout ) when nothing else did
+
+    SAMPLE_FIRST = 5
+    SAMPLE_EVERY = 100
+
+    _logger = logging.getLogger("text_to_sql")
+    _queue = None
+    _listener = None
+    _lock = threading.Lock()
+    _init_lock = threading.Lock()
+
+    # KEY sample key, VALUE lines seen
+    _sampled = {}
+
+    @staticmethod
+    def configure(level=None, json_lines=None, path=None, stream=None):
+        level = (level or os.environ.get("LOG_LEVEL") or "info").upper()
+        if json_lines is None:
+            json_lines = os.environ.get("LOG_FORMAT", "").lower() == "json"
+
+        handler = logging.FileHandler(path, encoding="utf-8") if path else logging.StreamHandler(stream or sys.stdout)
+        handler.setFormatter(_JsonFormatter() if json_lines else _TextFormatter())
+
+        with Log._lock:
+            Log._stop_locked()
+
+            Log._queue = queue.Queue()
+            Log._listener = QueueListener(Log._queue, handler)
+            Log._listener.start()
+
+            Log._logger.handlers = [QueueHandler(Log._queue)]
+            Log._logger.setLevel(level)
+            Log._logger.propagate = False
+
+    @staticmethod
+    def _stop_locked():
+        if Log._listener is not None:
+            Log._listener.stop()
+            Log._listener = None
+
+    @staticmethod
+    def flush():
+        # Wait until everything logged so far is written
+        if Log._queue is not None:
+            Log._queue.join()
+
+    @staticmethod
+    def shutdown():
+        with Log._lock:
+            Log._stop_locked()
+
+    @staticmethod
+    @contextmanager
+    def context(**fields):
+        token = _log_context.set({**_log_context.get(), **fields})
+        try:
+            yield
+        finally:
+            _log_context.reset(token)
+
+    @staticmethod
+    def _sample(key):
+        # (write this line?, lines seen for this key)
+        with Log._lock:
+            seen = Log._sampled.get(key, 0) + 1
+            Log._sampled[key] = seen
+
+        return seen <= Log.SAMPLE_FIRST or seen % Log.SAMPLE_EVERY == 0, seen
+
+    @staticmethod
+    def log(level, msg, sample=None, **fields):
+        if Log._listener is None:
+            with Log._init_lock:
+                if Log._listener is None:
+                    Log.configure()
+
+        if not Log._logger.isEnabledFor(level):
+            return
+
+        if sample is not None:
+            write, seen = Log._sample(sample)
+            if not write:
+                return
+            fields["seen"] = seen
+
+        stage, item = UsageLedger.current_scope()
+        context = {}
+        if stage is not None:
+            context["stage"] = stage
+        if item is not None:
+            context["item"] = item
+
+        Log._logger.log(level, msg, extra={"fields": {**context, **_log_context.get(), **fields}})
+
+    @staticmethod
+    def debug(msg, sample=None, **fields):
+        Log.log(logging.DEBUG, msg, sample, **fields)
+
+    @staticmethod
+    def info(msg, sample=None, **fields):
+        Log.log(logging.INFO, msg, sample, **fields)
+
+    @staticmethod
+    def warn(msg, sample=None, **fields):
+        Log.log(logging.WARNING, msg, sample, **fields)
+
+    @staticmethod
+    def error(msg, sample=None, **fields):
+        Log.log(logging.ERROR, msg, sample, **fields)
+
+
+# Write out what is still queued when the process exits
+atexit.register(Log.shutdown)
@@ -0,0 +1,282 @@
+import os
+import random
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from Util.Log import Log
+
+
+class MemoryDbCache:
+
+    # Hot evaluation databases copied into :memory: with the SQLite backup API
+    #
+    # Every evaluation query opens the database file and reads its pages through the filesystem.
+    #   Once a database has been queried min_accesses times we copy the whole file into an
+    #   in-memory connection and serve its queries from there, read-only ( PRAGMA query_only )
+    #
+    # The copies live under a total byte budget. When a new database does not fit, we evict:
+    #
+    #   lru        : least recently used first
+    #   size_aware : lowest accesses per byte first, and only databases worth less than the new one,
+    #                so one huge database cannot flush many small hot ones
+    #
+    # One in-memory connection serves one query at a time, so a hot database keeps a small pool of
+    #   copies ( up to connections_per_db ). A query takes an idle copy; when every copy is busy another
+    #   one is made if the budget has room for it, otherwise the query reads the file instead of
+    #   queueing. Every copy is charged to the budget
+    #
+    # Time saved is measured, not guessed: shadow_rate of the memory hits are run again, plainly, on
+    #   the copy and on the file, and both timings are kept. The real query's timing is not used; with
+    #   QueryCapture on it includes EXPLAIN and the progress handler, which the file side would not
+
+    POLICIES = {"lru", "size_aware"}
+
+    def __init__(self, max_bytes=1024 * 1024 * 1024, min_accesses=2, policy="size_aware", shadow_rate=0.05,
+                 connections_per_db=4):
+        if policy not in self.POLICIES:
+            raise ValueError(f"Unknown eviction policy '{policy}'. Expected one of {sorted(self.POLICIES)}")
+
+        self.max_bytes = max_bytes
+        self.min_accesses = min_accesses
+        self.policy = policy
+        self.shadow_rate = shadow_rate
+        self.connections_per_db = max(1, connections_per_db)
+        self.bytes_used = 0
+
+        # KEY db_path, VALUE entry dict {"idle", "open", "size", "bytes", "closed", "lock"}; most recently
+        #   used at the end. "size" is the file's, "bytes" what its open copies are charged
+        self._entries = OrderedDict()
+        self._accesses = {}
+        self._loading = set()
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.loads = 0
+        self.evictions = 0
+        self.busy = 0
+        self.load_seconds = 0.0
+
+        # (memory seconds, file seconds) of shadowed hits
+        self.shadow_samples = []
+
+    def _score(self, db_path, size):
+        return self._accesses.get(db_path, 0) / max(1, size)
+
+    def _make_room(self, db_path, size):
+        # Evict until size fits; returns False ( and evicts nothing ) when it cannot
+        # Caller holds self._lock
+
+        if self.policy == "lru":
+            victims = list(self._entries)
+        else:
+            new_score = self._score(db_path, size)
+            victims = sorted(
+                (path for path in self._entries if self._score(path, self._entries[path]["size"]) < new_score),
+                key=lambda path: self._score(path, self._entries[path]["size"]),
+            )
+
+        freed, chosen = 0, []
+        for victim in victims:
+            if self.bytes_used - freed + size <= self.max_bytes:
+                break
+            chosen.append(victim)
+            freed += self._entries[victim]["bytes"]
+
+        if self.bytes_used - freed + size > self.max_bytes:
+            return False
+
+        for victim in chosen:
+            entry = self._entries.pop(victim)
+            self.bytes_used -= entry["bytes"]
+            self.evictions += 1
+            MemoryDbCache._close_entry(entry)
+
+        return True
+
+    @staticmethod
+    def _close_entry(entry):
+        # Idle copies close now; copies in use close when their query hands them back
+        with entry["lock"]:
+            entry["closed"] = True
+            for conn in entry["idle"]:
+                conn.close()
+            entry["idle"] = []
+
+    def _copy(self, db_path):
+        # A fresh read-only :memory: copy of the file; returns (conn, seconds)
+        start = time.perf_counter()
+
+        source = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+        try:
+            conn = sqlite3.connect(":memory:", check_same_thread=False)
+            source.backup(conn)
+        finally:
+            source.close()
+
+        conn.execute("PRAGMA query_only = ON")
+        return conn, time.perf_counter() - start
+
+    def _load(self, db_path, size):
+        conn, elapsed = self._copy(db_path)
+
+        with self._lock:
+            self._loading.discard(db_path)
+            self.load_seconds += elapsed
+
+            if not self._make_room(db_path, size):
+                conn.close()
+                return None
+
+            entry = {"idle": [conn], "open": 1, "size": size, "bytes": size, "closed": False, "lock": threading.Lock()}
+            self._entries[db_path] = entry
+            self.bytes_used += size
+            self.loads += 1
+
+        Log.info("[MemoryDbCache] Loaded database", db=os.path.basename(db_path), mb=round(size / 1e6, 1),
+                 seconds=round(elapsed, 2))
+        return entry
+
+    def _checkout(self, entry, db_path):
+        # An idle copy, a new copy when the pool and budget allow, or None ( read the file this time )
+
+        with entry["lock"]:
+            if entry["closed"]:
+                return None
+            if entry["idle"]:
+                return entry["idle"].pop()
+            if entry["open"] >= self.connections_per_db:
+                return None
+            entry["open"] += 1
+
+        # Another copy only fits the budget as it is; it never evicts
+        with self._lock:
+            fits = self.bytes_used + entry["size"] <= self.max_bytes
+            if fits:
+                self.bytes_used += entry["size"]
+                entry["bytes"] += entry["size"]
+
+        if fits:
+            conn, elapsed = self._copy(db_path)
+            with self._lock:
+                self.load_seconds += elapsed
+            return conn
+
+        with entry["lock"]:
+            entry["open"] -= 1
+        return None
+
+    @staticmethod
+    def _checkin(entry, conn):
+        with entry["lock"]:
+            if entry["closed"]:
+                conn.close()
+            else:
+                entry["idle"].append(conn)
+
+    def _entry_for(self, db_path):
+        # Cached entry, freshly loaded entry, or None ( serve from the file this time )
+
+        with self._lock:
+            self._accesses[db_path] = self._accesses.get(db_path, 0) + 1
+
+            entry = self._entries.get(db_path)
+            if entry is not None:
+                self._entries.move_to_end(db_path)
+                return entry
+
+            if self._accesses[db_path] < self.min_accesses or db_path in self._loading:
+                return None
+
+            size = os.path.getsize(db_path)
+            if size > self.max_bytes:
+                return None
+
+            # Only load when eviction could make room; checked again after the copy
+            if self.bytes_used + size > self.max_bytes and self.policy == "size_aware":
+                new_score = self._score(db_path, size)
+                evictable = sum(e["bytes"] for p, e in self._entries.items() if self._score(p, e["size"]) < new_score)
+                if self.bytes_used - evictable + size > self.max_bytes:
+                    return None
+
+            self._loading.add(db_path)
+
+        return self._load(db_path, size)
+
+    def execute(self, query, db_path, run=None):
+        # Rows from the in-memory copy, or None when the database is not cached ( caller reads the file )
+        #
+        # run(conn, query) -> rows replaces the plain fetchall ( QueryCapture ); SQL errors raise like
+        #   they would on the file
+
+        entry = self._entry_for(db_path)
+        conn = self._checkout(entry, db_path) if entry is not None else None
+
+        if conn is None:
+            with self._lock:
+                self.misses += 1
+                if entry is not None:
+                    self.busy += 1
+            return None
+
+        shadow = random.random() < self.shadow_rate
+        try:
+            rows = run(conn, query) if run else conn.execute(query).fetchall()
+
+            if shadow:
+                start = time.perf_counter()
+                conn.execute(query).fetchall()
+                memory_seconds = time.perf_counter() - start
+        finally:
+            MemoryDbCache._checkin(entry, conn)
+
+        with self._lock:
+            self.hits += 1
+
+        if shadow:
+            self._shadow(query, db_path, memory_seconds)
+
+        return rows
+
+    def _shadow(self, query, db_path, memory_seconds):
+        conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+        try:
+            start = time.perf_counter()
+            conn.execute(query).fetchall()
+            file_seconds = time.perf_counter() - start
+        finally:
+            conn.close()
+
+        with self._lock:
+            self.shadow_samples.append((memory_seconds, file_seconds))
+
+    def stats(self):
+        lookups = self.hits + self.misses
+
+        saved_per_hit = None
+        if self.shadow_samples:
+            saved_per_hit = sum(f - m for m, f in self.shadow_samples) / len(self.shadow_samples)
+
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+            "entries": len(self._entries),
+            "connections": sum(entry["open"] for entry in self._entries.values()),
+            "busy_fallbacks": self.busy,
+            "bytes_used": self.bytes_used,
+            "loads": self.loads,
+            "load_seconds": round(self.load_seconds, 3),
+            "evictions": self.evictions,
+            "shadow_samples": len(self.shadow_samples),
+            "est_seconds_saved": round(saved_per_hit * self.hits - self.load_seconds, 3) if saved_per_hit is not None else None,
+        }
+
+    def close(self):
+        with self._lock:
+            for entry in self._entries.values():
+                MemoryDbCache._close_entry(entry)
+            self._entries.clear()
+            self.bytes_used = 0
@@ -0,0 +1,195 @@
+import os
+import sys
+import threading
+import tracemalloc
+import types
+
+import numpy as np
+
+# Peak RSS comes from getrusage, which Windows does not have
+try:
+    import resource
+except ImportError:
+    resource = None
+
+
+class MemoryProfiler:
+
+    # Where a run's memory goes, stage by stage
+    #
+    # checkpoint(stage) at each stage boundary records:
+    #
+    #   rss / peak_rss   : process resident set now and at its highest so far ( what the OOM killer sees )
+    #   traced / peak    : Python allocations live now, and the highest they reached during the stage
+    #   top              : the source lines that allocated the most since the previous checkpoint
+    #
+    # attribute(name, obj) adds the deep size of one structure ( RAG index, item store, result sets ).
+    #   Attributions share one "already counted" set, so something reachable from two of them is
+    #   charged to the first only: attribute result sets before the items that hold them
+    #
+    # tracemalloc slows allocation-heavy code by a few times; trace=False keeps RSS and attributions only
+
+    # Shared by everything; never charged to a structure that merely refers to them
+    _NOT_OWNED = (type, types.ModuleType, types.FunctionType, types.BuiltinFunctionType, types.MethodType)
+
+    def __init__(self, trace=True, top=5):
+        self.trace = trace
+        self.top = top
+
+        self.checkpoints = []
+        self.attributions = {}
+        self._counted = set()
+        self._snapshot = None
+        self._lock = threading.Lock()
+
+        self._started_tracing = False
+        if trace and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started_tracing = True
+
+        if trace:
+            self._snapshot = tracemalloc.take_snapshot()
+
+    def __repr__(self):
+        return f"MemoryProfiler(trace={self.trace}, checkpoints={len(self.checkpoints)})"
+
+    @staticmethod
+    def rss_bytes():
+        # Current resident set; /proc on Linux, else the peak is the best we have
+        try:
+            with open("/proc/self/statm", "r") as f:
+                return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+        except (OSError, ValueError, AttributeError):
+            return MemoryProfiler.peak_rss_bytes()
+
+    @staticmethod
+    def peak_rss_bytes():
+        if resource is None:
+            return 0
+
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+        # Kilobytes on Linux, bytes on macOS
+        return peak if sys.platform == "darwin" else peak * 1024
+
+    def checkpoint(self, stage):
+        entry = {"stage": stage, "rss": MemoryProfiler.rss_bytes(), "peak_rss": MemoryProfiler.peak_rss_bytes()}
+
+        with self._lock:
+            if self.trace and tracemalloc.is_tracing():
+                entry["traced"], entry["traced_peak"] = tracemalloc.get_traced_memory()
+                tracemalloc.reset_peak()
+
+                snapshot = tracemalloc.take_snapshot().filter_traces((
+                    tracemalloc.Filter(False, tracemalloc.__file__),
+                    tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+                ))
+                entry["top"] = [
+                    (f"{stat.traceback[0].filename}:{stat.traceback[0].lineno}", stat.size_diff, stat.size)
+                    for stat in snapshot.compare_to(self._snapshot, "lineno")[: self.top]
+                    if stat.size_diff > 0
+                ]
+                self._snapshot = snapshot
+
+            self.checkpoints.append(entry)
+
+        return entry
+
+    @staticmethod
+    def deep_size(obj, counted=None):
+        # Bytes reachable from obj: containers, instance attributes, NumPy buffers, sparse matrices
+        #
+        # counted holds ids already charged; they are skipped and the new ones added
+
+        counted = set() if counted is None else counted
+        total = 0
+        stack = [obj]
+
+        while stack:
+            current = stack.pop()
+            if id(current) in counted or isinstance(current, MemoryProfiler._NOT_OWNED):
+                continue
+            counted.add(id(current))
+
+            if isinstance(current, np.ndarray):
+                total += current.nbytes if current.base is None else sys.getsizeof(current)
+                if current.base is not None:
+                    stack.append(current.base)
+                continue
+
+            total += sys.getsizeof(current)
+
+            if isinstance(current, (str, bytes, bytearray, int, float, bool, type(None))):
+                continue
+
+            if isinstance(current, dict):
+                stack.extend(current.keys())
+                stack.extend(current.values())
+            elif isinstance(current, (list, tuple, set, frozenset)):
+                stack.extend(current)
+            elif hasattr(current, "__dict__"):
+                stack.append(vars(current))
+            elif hasattr(current, "__slots__"):
+                stack.extend(getattr(current, slot) for slot in current.__slots__ if hasattr(current, slot))
+
+        return total
+
+    def attribute(self, name, obj):
+        with self._lock:
+            size = MemoryProfiler.deep_size(obj, self._counted)
+            self.attributions[name] = self.attributions.get(name, 0) + size
+
+        return size
+
+    def close(self):
+        if self._started_tracing:
+            tracemalloc.stop()
+            self._started_tracing = False
+
+    @staticmethod
+    def short_location(location):
+        # Project files relative to the working directory; library files as package/module.py
+        path, _, line = location.rpartition(":")
+        if not os.path.isabs(path):
+            return location
+        if path.startswith(os.getcwd() + os.sep):
+            return f"{os.path.relpath(path)}:{line}"
+        return f"{os.sep.join(path.split(os.sep)[-2:])}:{line}"
+
+    def summary(self):
+        # Numbers a benchmark can compare run to run
+
+        return {
+            "peak_rss": max((c["peak_rss"] for c in self.checkpoints), default=0),
+            "traced_peak": max((c.get("traced_peak", 0) for c in self.checkpoints), default=0),
+            "attributions": dict(self.attributions),
+            "stages": {c["stage"]: c["rss"] for c in self.checkpoints},
+        }
+
+    def report(self):
+        mb = 1024 * 1024
+        lines = [
+            "\n-----MEMORY-----",
+            f"{'stage':<20} {'rss MB':>9} {'delta MB':>9} {'peak rss MB':>12} {'traced MB':>10} {'stage peak MB':>14}",
+        ]
+
+        previous = None
+        for c in self.checkpoints:
+            delta = (c["rss"] - previous) / mb if previous is not None else 0.0
+            previous = c["rss"]
+
+            traced = f"{c['traced'] / mb:>10.1f} {c['traced_peak'] / mb:>14.1f}" if "traced" in c else f"{'-':>10} {'-':>14}"
+            lines.append(f"{c['stage']:<20} {c['rss'] / mb:>9.1f} {delta:>+9.1f} {c['peak_rss'] / mb:>12.1f} {traced}")
+
+            for location, size_diff, _ in c.get("top", []):
+                lines.append(f"{'':<22}+{size_diff / mb:>7.2f} MB  {MemoryProfiler.short_location(location)}")
+
+        if self.attributions:
+            lines += ["", f"{'structure':<20} {'MB':>9}"]
+            for name, size in self.attributions.items():
+                lines.append(f"{name:<20} {size / mb:>9.2f}")
+
+        report = "\n".join(lines)
+        print(report)
+
+        return report
@@ -0,0 +1,100 @@
+import threading
+
+from Util.CommonUtil import CommonUtil
+
+
+class ModelRouter:
+
+    # Which model each LLM stage calls, cheapest first
+    #
+    # Every stage has an escalation chain. Attempts start on the first model and move one model up
+    #   the chain after attempts_per_model failed outputs ( nothing parseable, or SQL that does not
+    #   compile ), so only the hard items pay for the stronger model:
+    #
+    #   schema_linking : flash-lite -> flash
+    #   sql_generation : flash-lite -> flash
+    #   sql_repair     : flash
+    #
+    # Stages without a route use CommonUtil.LLM_MODEL, which is what every call used before
+
+    CHEAP_FIRST = {
+        "schema_linking": ["google/gemini-2.0-flash-lite-001", "google/gemini-2.0-flash-001"],
+        "sql_generation": ["google/gemini-2.0-flash-lite-001", "google/gemini-2.0-flash-001"],
+        "sql_repair": ["google/gemini-2.0-flash-001"],
+    }
+
+    STAGES = ("schema_linking", "sql_generation", "sql_repair")
+
+    def __init__(self, routes=None, attempts_per_model=1):
+        routes = ModelRouter.CHEAP_FIRST if routes is None else routes
+
+        unknown = set(routes) - set(ModelRouter.STAGES)
+        if unknown:
+            raise ValueError(f"Unknown stages {sorted(unknown)}. Expected some of {list(ModelRouter.STAGES)}")
+
+        # KEY stage, VALUE escalation chain of model names
+        self.routes = {stage: list(models) for stage, models in routes.items() if models}
+        self.attempts_per_model = max(1, attempts_per_model)
+
+        # KEY (stage, model), VALUE {"accepted": n, "rejected": n}
+        self.outcomes = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def parse(specs):
+        # ["cheap-first"] or ["schema_linking=model-a,model-b", "sql_generation=model-b"] -> routes
+
+        routes = {}
+        for spec in specs:
+            if spec == "cheap-first":
+                routes.update(ModelRouter.CHEAP_FIRST)
+                continue
+
+            stage, _, models = spec.partition("=")
+            if not models:
+                raise ValueError(f"Bad route '{spec}'. Expected STAGE=MODEL[,MODEL...] or cheap-first")
+            routes[stage.strip()] = [model.strip() for model in models.split(",") if model.strip()]
+
+        return routes
+
+    def chain(self, stage):
+        return self.routes.get(stage) or [CommonUtil.LLM_MODEL]
+
+    def model_for(self, stage, failures):
+        # Model for the next attempt after 'failures' rejected outputs in this stage
+        chain = self.chain(stage)
+
+        return chain[min(failures // self.attempts_per_model, len(chain) - 1)]
+
+    def record(self, stage, model, accepted):
+        with self._lock:
+            outcome = self.outcomes.setdefault((stage, model), {"accepted": 0, "rejected": 0})
+            outcome["accepted" if accepted else "rejected"] += 1
+
+    def report(self, ledger):
+        # Per route ( stage, model ): calls, accept rate, latency and cost from the ledger
+
+        routes = {}
+        for entry in ledger.entries:
+            routes.setdefault((entry["stage"], entry["model"]), []).append(entry)
+
+        lines = [
+            "\n-----MODEL ROUTES-----",
+            f"{'stage':<16} {'model':<36} {'calls':>6} {'accept':>7} {'p50 ms':>8} {'p95 ms':>8} {'cost':>10}",
+        ]
+
+        for (stage, model), entries in sorted(routes.items(), key=lambda kv: (str(kv[0][0]), kv[0][1])):
+            latencies = [entry["latency"] for entry in entries]
+            outcome = self.outcomes.get((stage, model))
+            accept = f"{outcome['accepted'] / max(1, sum(outcome.values())):.0%}" if outcome else "-"
+
+            lines.append(
+                f"{str(stage):<16} {model:<36} {len(entries):>6} {accept:>7} "
+                f"{1000 * CommonUtil.percentile(latencies, 50):>8.1f} {1000 * CommonUtil.percentile(latencies, 95):>8.1f} "
+                f"${sum(entry['cost'] for entry in entries):>9.4f}"
+            )
+
+        report = "\n".join(lines)
+        print(report)
+
+        return report
@@ -0,0 +1,180 @@
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+
+# Capture the running code records into, and the tags ( db_id, sort_id, role ) it records with
+#
+# Same scheme as UsageLedger: a context variable, so scheduler workers started through
+#   contextvars.copy_context().run record into the run's capture with their own item's tags
+_active_capture = ContextVar("query_capture", default=(None, {}))
+
+
+class QueryCapture:
+
+    # Plan and runtime of every SQL statement evaluation executes
+    #
+    # Inside a scope with a capture, run_sql_query() runs each statement through execute(), which
+    #   records:
+    #
+    #   db_id, sort_id, role     : which item and whether it was the gold or the predicted query
+    #   plan                     : EXPLAIN QUERY PLAN detail lines
+    #   wall_ms, rows, bytes     : time to fetch everything, rows returned, bytes of the values
+    #   vm_steps                 : SQLite VM instructions, counted by a progress handler every
+    #                              step_interval instructions ( so rounded down to that; a smaller
+    #                              interval is more exact and costs a Python call per tick )
+    #
+    # Only statements that reach SQLite are recorded; ExecutionMemo hits and EM-equal predictions
+    #   that reuse the gold result never execute
+    #
+    # write() stores one array per field ( columnar JSON ); summary() lists the slowest statements
+    #   and how much time went to each plan pattern
+
+    FIELDS = ("db_id", "sort_id", "role", "wall_ms", "rows", "bytes", "vm_steps", "error", "sql", "plan")
+
+    def __init__(self, name="run", step_interval=1000):
+        self.name = name
+        self.step_interval = step_interval
+        self.records = []
+        self._lock = threading.Lock()
+
+    @staticmethod
+    @contextmanager
+    def scope(capture=None, **tags):
+        # Record into 'capture' ( or the outer scope's ) with these tags on top of the outer ones
+
+        outer_capture, outer_tags = _active_capture.get()
+        token = _active_capture.set((capture or outer_capture, {**outer_tags, **tags}))
+        try:
+            yield
+        finally:
+            _active_capture.reset(token)
+
+    @staticmethod
+    def current():
+        # (capture, tags); capture is None outside any capturing scope
+        return _active_capture.get()
+
+    @staticmethod
+    def value_bytes(value):
+        if value is None:
+            return 0
+        if isinstance(value, (int, float)):
+            return 8
+        if isinstance(value, str):
+            return len(value.encode("utf-8"))
+        return len(value)
+
+    def execute(self, conn, query, tags):
+        # Run one statement on conn and record it; returns the rows, raises what SQLite raises
+
+        try:
+            plan = [row[3] for row in conn.execute("EXPLAIN QUERY PLAN " + query)]
+        except Exception:
+            plan = []
+
+        steps = [0]
+
+        def count_steps():
+            steps[0] += self.step_interval
+            return 0
+
+        record = {"sql": query, "plan": plan, "rows": 0, "bytes": 0, "error": None, **tags}
+
+        conn.set_progress_handler(count_steps, self.step_interval)
+        start = time.perf_counter()
+        try:
+            rows = conn.execute(query).fetchall()
+            record["rows"] = len(rows)
+            record["bytes"] = sum(QueryCapture.value_bytes(value) for row in rows for value in row)
+            return rows
+
+        except Exception as e:
+            record["error"] = str(e)
+            raise
+
+        finally:
+            record["wall_ms"] = 1000 * (time.perf_counter() - start)
+            conn.set_progress_handler(None, 0)
+            record["vm_steps"] = steps[0]
+
+            with self._lock:
+                self.records.append(record)
+
+    @staticmethod
+    def plan_patterns(plan):
+        # Patterns worth a look in one plan
+
+        full_scans = [line for line in plan if line.startswith("SCAN ") and " USING " not in line]
+
+        patterns = set()
+        if full_scans:
+            patterns.add("full scan")
+        if len(full_scans) > 1:
+            # A nested loop whose inner table is scanned whole: a cartesian product or a join
+            #   without a usable constraint
+            patterns.add("nested full scans ( cartesian / unindexed join )")
+        if any("TEMP B-TREE" in line for line in plan):
+            patterns.add("temp b-tree")
+        if any("AUTOMATIC" in line for line in plan):
+            patterns.add("automatic index")
+
+        return patterns
+
+    def summary(self, top=10):
+        with self._lock:
+            records = list(self.records)
+
+        lines = [f"\n-----QUERY CAPTURE ( {self.name} )-----"]
+        if not records:
+            lines.append("no statements captured")
+            print("\n".join(lines))
+            return "\n".join(lines)
+
+        total_ms = sum(r["wall_ms"] for r in records)
+        lines.append(
+            f"{len(records)} statements, {total_ms:.1f} ms, {sum(r['vm_steps'] for r in records)} VM steps, "
+            f"{sum(r['bytes'] for r in records) / 1e6:.2f} MB materialized, "
+            f"{sum(1 for r in records if r['error'])} errors"
+        )
+
+        lines += ["", f"{'pattern':<48} {'stmts':>6} {'ms':>10} {'share':>6}"]
+        by_pattern = {}
+        for r in records:
+            for pattern in QueryCapture.plan_patterns(r["plan"]):
+                by_pattern.setdefault(pattern, []).append(r["wall_ms"])
+
+        for pattern, times in sorted(by_pattern.items(), key=lambda kv: -sum(kv[1])):
+            lines.append(f"{pattern:<48} {len(times):>6} {sum(times):>10.1f} {sum(times) / total_ms if total_ms else 0.0:>6.0%}")
+
+        lines += ["", f"{'db_id':<24} {'sort_id':>7} {'role':<5} {'ms':>9} {'steps':>10} {'rows':>7}  sql"]
+        for r in sorted(records, key=lambda r: -r["wall_ms"])[:top]:
+            lines.append(
+                f"{str(r.get('db_id')):<24} {str(r.get('sort_id')):>7} {str(r.get('role')):<5} {r['wall_ms']:>9.2f} "
+                f"{r['vm_steps']:>10} {r['rows']:>7}  {' '.join(r['sql'].split())[:70]}"
+            )
+            lines += [f"{'':<58}{line}" for line in r["plan"]]
+
+        report = "\n".join(lines)
+        print(report)
+
+        return report
+
+    def write(self, path):
+        # {"name": ..., "count": n, "columns": {field: [value per statement]}}; plan is a list per statement
+
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+
+        with self._lock:
+            columns = {field: [r.get(field) for r in self.records] for field in QueryCapture.FIELDS}
+            payload = {"name": self.name, "count": len(self.records), "columns": columns}
+
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(payload, f)
+        os.replace(tmp_path, path)
+
+        return path
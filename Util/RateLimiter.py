@@ -0,0 +1,239 @@
+import hashlib
+import os
+import struct
+import threading
+import time
+
+# The bucket file is locked with flock on POSIX and msvcrt.locking on Windows
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+    import msvcrt
+
+
+class RateLimiter:
+
+    # Token buckets for LLM calls, shared by every process on the machine
+    #
+    # Two buckets, requests per minute and tokens per minute, live in one small file. Every process
+    #   that points at the same file ( same LLM URL and the default path ) draws from the same buckets,
+    #   so shards and concurrent runs together stay at the limit instead of each pacing itself
+    #
+    #   acquire(prompt)  : before every call; waits until both buckets hold enough, then takes one
+    #                      request and the estimated tokens ( prompt + expected completion )
+    #   settle(...)      : after the call; charges the difference between the estimate and what
+    #                      the provider reported. Buckets may go negative, which later calls repay
+    #   on_throttled(s)  : a 429 pauses every process for Retry-After ( or PAUSE_SECONDS )
+    #
+    # Buckets hold at most burst_seconds worth of their rate, so an idle limiter does not allow
+    #   a minute's worth of calls at once
+    #
+    # A limiter only draws from the buckets it has a rate for; a tokens-only limiter leaves the
+    #   request bucket alone
+    #
+    # File layout: six little-endian doubles ( request level, token level, last refill time,
+    #   paused until, requests per minute, tokens per minute; 0 for no limit ), read and written under
+    #   an exclusive lock. The limits are those of the last writer: a limiter configured differently
+    #   does not inherit debt it never agreed to. A bucket the writer did not limit starts full, one
+    #   it limited at another rate is clamped to [0, capacity]
+
+    STATE = struct.Struct("<dddddd")
+    PAUSE_SECONDS = 2.0
+
+    _shared = None
+    _shared_lock = threading.Lock()
+
+    def __init__(self, requests_per_minute=None, tokens_per_minute=None, path=None, burst_seconds=10.0,
+                 completion_tokens=256):
+        if not requests_per_minute and not tokens_per_minute:
+            raise ValueError("RateLimiter needs requests_per_minute and / or tokens_per_minute")
+
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self.path = path or RateLimiter.default_path()
+
+        self.request_capacity = max(1.0, (requests_per_minute or 0) * burst_seconds / 60)
+        self.token_capacity = max(1.0, (tokens_per_minute or 0) * burst_seconds / 60)
+
+        # Expected completion tokens per call; running mean of what calls actually returned
+        self.completion_tokens = completion_tokens
+
+        self.waits = 0
+        self.wait_seconds = 0.0
+        self.throttled = 0
+
+        # flock excludes other processes; threads of this one share the descriptor, so they take this first
+        self._lock = threading.Lock()
+
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self._fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+
+    @staticmethod
+    def default_path(url=None):
+        # One bucket file per LLM endpoint under Cache/rate_limiter/
+        from Util.CommonUtil import CommonUtil
+
+        url = url or CommonUtil.get_llm_url()
+        name = hashlib.sha256(url.encode("utf-8")).hexdigest()[:16]
+
+        return os.path.join(CommonUtil.get_cache_dir("rate_limiter"), f"{name}.bucket")
+
+    @staticmethod
+    def configure(requests_per_minute=None, tokens_per_minute=None, path=None):
+        # Process-wide limiter that callLLM() consults; no limits turns it off
+        with RateLimiter._shared_lock:
+            if RateLimiter._shared is not None:
+                RateLimiter._shared.close()
+
+            RateLimiter._shared = None
+            if requests_per_minute or tokens_per_minute:
+                RateLimiter._shared = RateLimiter(requests_per_minute, tokens_per_minute, path)
+
+        return RateLimiter._shared
+
+    @staticmethod
+    def get():
+        # The process-wide limiter; LLM_REQUESTS_PER_MINUTE / LLM_TOKENS_PER_MINUTE configure it when
+        #   configure() was never called. None when no limit is set
+
+        if RateLimiter._shared is None:
+            requests_per_minute = int(os.environ.get("LLM_REQUESTS_PER_MINUTE") or 0)
+            tokens_per_minute = int(os.environ.get("LLM_TOKENS_PER_MINUTE") or 0)
+            if requests_per_minute or tokens_per_minute:
+                with RateLimiter._shared_lock:
+                    if RateLimiter._shared is None:
+                        RateLimiter._shared = RateLimiter(requests_per_minute, tokens_per_minute)
+
+        return RateLimiter._shared
+
+    def _lock_file(self):
+        os.lseek(self._fd, 0, os.SEEK_SET)
+        if fcntl is not None:
+            fcntl.flock(self._fd, fcntl.LOCK_EX)
+        else:
+            msvcrt.locking(self._fd, msvcrt.LK_LOCK, 1)
+
+    def _unlock_file(self):
+        if fcntl is not None:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+        else:
+            os.lseek(self._fd, 0, os.SEEK_SET)
+            msvcrt.locking(self._fd, msvcrt.LK_UNLCK, 1)
+
+    def _read(self, now):
+        # (requests, tokens, paused_until) refilled up to now; a new file starts full
+        os.lseek(self._fd, 0, os.SEEK_SET)
+        raw = os.read(self._fd, RateLimiter.STATE.size)
+        if len(raw) < RateLimiter.STATE.size:
+            return self.request_capacity, self.token_capacity, 0.0
+
+        requests, tokens, last, paused_until, rpm, tpm = RateLimiter.STATE.unpack(raw)
+        elapsed = max(0.0, now - last)
+
+        if rpm != (self.requests_per_minute or 0):
+            requests = self.request_capacity if not rpm else min(max(requests, 0.0), self.request_capacity)
+        if tpm != (self.tokens_per_minute or 0):
+            tokens = self.token_capacity if not tpm else min(max(tokens, 0.0), self.token_capacity)
+
+        if self.requests_per_minute:
+            requests = min(self.request_capacity, requests + elapsed * self.requests_per_minute / 60)
+        if self.tokens_per_minute:
+            tokens = min(self.token_capacity, tokens + elapsed * self.tokens_per_minute / 60)
+
+        return requests, tokens, paused_until
+
+    def _write(self, requests, tokens, now, paused_until):
+        os.lseek(self._fd, 0, os.SEEK_SET)
+        os.write(self._fd, RateLimiter.STATE.pack(
+            requests, tokens, now, paused_until, self.requests_per_minute or 0, self.tokens_per_minute or 0
+        ))
+
+    def _update(self, fn):
+        # fn(requests, tokens, paused_until, now) -> (requests, tokens, paused_until, result)
+        with self._lock:
+            self._lock_file()
+            try:
+                now = time.time()
+                requests, tokens, paused_until = self._read(now)
+                requests, tokens, paused_until, result = fn(requests, tokens, paused_until, now)
+                self._write(requests, tokens, now, paused_until)
+            finally:
+                self._unlock_file()
+
+        return result
+
+    def estimate(self, prompt):
+        from Util.UsageLedger import UsageLedger
+
+        return UsageLedger.estimate_tokens(prompt) + int(self.completion_tokens)
+
+    def acquire(self, prompt=""):
+        # Wait for one request and the prompt's estimated tokens; returns the tokens taken ( 0 without
+        #   a token limit )
+
+        # A single call bigger than the bucket could never fit; it waits for a full bucket instead
+        needed = min(self.estimate(prompt), self.token_capacity) if self.tokens_per_minute else 0
+
+        def take(requests, tokens, paused_until, now):
+            wait = paused_until - now
+            if self.requests_per_minute and requests < 1:
+                wait = max(wait, (1 - requests) * 60 / self.requests_per_minute)
+            if self.tokens_per_minute and tokens < needed:
+                wait = max(wait, (needed - tokens) * 60 / self.tokens_per_minute)
+
+            if wait > 0:
+                return requests, tokens, paused_until, wait
+
+            if self.requests_per_minute:
+                requests -= 1
+
+            return requests, tokens - needed, paused_until, 0.0
+
+        while True:
+            wait = self._update(take)
+            if wait <= 0:
+                return needed
+
+            # Others may take what refills meanwhile; sleep in short steps and ask again
+            self.waits += 1
+            self.wait_seconds += min(wait, 1.0)
+            time.sleep(min(wait, 1.0))
+
+    def settle(self, reserved, prompt_tokens=None, completion_tokens=None):
+        # Charge what the call really used against what acquire() took for it; None ( the call failed
+        #   before reporting usage ) charges nothing and gives the whole reservation back
+
+        if completion_tokens is not None:
+            self.completion_tokens = 0.9 * self.completion_tokens + 0.1 * completion_tokens
+        extra = (prompt_tokens or 0) + (completion_tokens or 0) - reserved
+
+        if self.tokens_per_minute and extra:
+            self._update(lambda requests, tokens, paused_until, now: (requests, tokens - extra, paused_until, None))
+
+    def on_throttled(self, retry_after=None):
+        # The provider answered 429 anyway: every process sharing the bucket pauses
+        self.throttled += 1
+        pause = retry_after if retry_after else RateLimiter.PAUSE_SECONDS
+
+        self._update(lambda requests, tokens, paused_until, now: (
+            min(requests, 0.0) if self.requests_per_minute else requests,
+            min(tokens, 0.0) if self.tokens_per_minute else tokens,
+            max(paused_until, now + pause),
+            None,
+        ))
+
+    def stats(self):
+        return {
+            "requests_per_minute": self.requests_per_minute,
+            "tokens_per_minute": self.tokens_per_minute,
+            "waits": self.waits,
+            "wait_seconds": round(self.wait_seconds, 2),
+            "throttled_429": self.throttled,
+            "path": self.path,
+        }
+
+    def close(self):
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
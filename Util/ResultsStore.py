@@ -0,0 +1,268 @@
+import json
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+import numpy as np
+
+# The manifest is updated under a lock file: flock on POSIX, msvcrt.locking on Windows
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+    import msvcrt
+
+# Parquet when pyarrow is installed; the NPY layout below needs nothing beyond NumPy
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = pq = None
+
+
+class ResultsStore:
+
+    # Append-only columnar store of per-item run results
+    #
+    # Everything a run knows about an item ( question, prompt, linked schema, RAG examples, SQL,
+    #   execution results, metrics ) is buffered and written batch_size items at a time as one
+    #   immutable part:
+    #
+    #   <store>/manifest.json          : format, columns, parts in write order
+    #   <store>/part-<id>.parquet      : format "parquet" ( pyarrow installed )
+    #   <store>/part-<id>/<column>.npy : format "npy"; strings as one uint8 buffer of UTF-8 bytes
+    #                                    plus int64 offsets ( <column>.offsets.npy ), no pickle
+    #
+    # A part is complete before the manifest names it, so a reader never sees half a batch and a
+    #   crashed run loses at most its unflushed buffer. Later runs append parts to the same store;
+    #   run_id tells them apart
+    #
+    # Several writers may share a store ( shards, concurrent jobs, repeated runs ). Part ids are
+    #   random, so two writers never pick the same name, and each append re-reads the manifest under
+    #   <store>/manifest.lock and adds its part to what is there now
+    #
+    # load() reads only the columns asked for: numbers come back as NumPy arrays ( memory-mapped for
+    #   npy ), strings as lists
+
+    # KEY column, VALUE (kind, value of a DatasetTestObj); kind "f8" / "i8" numbers, "str" text,
+    #   "json" anything else serialised to text
+    COLUMNS = {
+        "run_id": ("str", None),
+        "sort_id": ("i8", lambda obj: obj.sort_id),
+        "db_id": ("str", lambda obj: obj.dev_db_id),
+        "difficulty": ("str", lambda obj: obj.difficulty),
+        "question": ("str", lambda obj: obj.dev_question),
+        "gold_sql": ("str", lambda obj: obj.dev_gold_sql),
+        "llm_sql": ("str", lambda obj: obj.llm_returned_sql),
+        "llm_prompt": ("str", lambda obj: obj.llm_prompt),
+        "schema_linking_tables": ("json", lambda obj: obj.schema_linking_tables),
+        "rag_examples": ("json", lambda obj: obj.rag_examples),
+        "gold_result": ("json", lambda obj: obj.dev_gold_sql_output),
+        "pred_result": ("json", lambda obj: obj.llm_sql_output),
+        "em": ("f8", lambda obj: obj.em),
+        "ex": ("f8", lambda obj: obj.ex),
+        "partial_correctness": ("f8", lambda obj: obj.partial_correctness),
+        "outcome": ("str", lambda obj: obj.outcome),
+    }
+
+    def __init__(self, path, run_id=None, batch_size=1000, fmt=None):
+        self.path = path
+        self.run_id = run_id or time.strftime("%Y%m%dT%H%M%S")
+        self.batch_size = batch_size
+
+        os.makedirs(path, exist_ok=True)
+
+        # An existing store keeps its format; a new one is Parquet when it can be. Decided under the
+        #   lock so two writers creating the store at once agree on it
+        with self._manifest_lock():
+            self.manifest = ResultsStore.read_manifest(path)
+
+            fmt = self.manifest.get("format") or fmt or ("parquet" if pq is not None else "npy")
+            if fmt == "parquet" and pq is None:
+                raise RuntimeError(f"{path} is a Parquet store and pyarrow is not installed")
+            if fmt not in {"parquet", "npy"}:
+                raise ValueError(f"Unknown format '{fmt}'. Expected 'parquet' or 'npy'")
+
+            if not self.manifest:
+                self.manifest = {
+                    "format": fmt,
+                    "columns": {column: kind for column, (kind, _) in ResultsStore.COLUMNS.items()},
+                    "parts": [],
+                }
+                self._write_manifest()
+
+        self._buffer = {column: [] for column in ResultsStore.COLUMNS}
+        self._buffered = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def read_manifest(path):
+        manifest_path = os.path.join(path, "manifest.json")
+        if not os.path.exists(manifest_path):
+            return {}
+
+        with open(manifest_path, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    @contextmanager
+    def _manifest_lock(self):
+        fd = os.open(os.path.join(self.path, "manifest.lock"), os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            if fcntl is not None:
+                fcntl.flock(fd, fcntl.LOCK_EX)
+            else:
+                msvcrt.locking(fd, msvcrt.LK_LOCK, 1)
+
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(fd, fcntl.LOCK_UN)
+            else:
+                os.lseek(fd, 0, os.SEEK_SET)
+                msvcrt.locking(fd, msvcrt.LK_UNLCK, 1)
+            os.close(fd)
+
+    def _write_manifest(self):
+        manifest_path = os.path.join(self.path, "manifest.json")
+        tmp_path = manifest_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.manifest, f, indent=1)
+        os.replace(tmp_path, manifest_path)
+
+    @staticmethod
+    def _to_json(value):
+        return json.dumps(value, default=str)
+
+    def append(self, obj):
+        # Buffer one item; a full buffer is written as a part
+
+        with self._lock:
+            for column, (kind, get) in ResultsStore.COLUMNS.items():
+                value = self.run_id if get is None else get(obj)
+                self._buffer[column].append(ResultsStore._to_json(value) if kind == "json" else value)
+
+            self._buffered += 1
+            if self._buffered >= self.batch_size:
+                self._flush_locked()
+
+    def extend(self, obj_list):
+        for obj in obj_list:
+            self.append(obj)
+
+    def flush(self):
+        with self._lock:
+            self._flush_locked()
+
+    def close(self):
+        self.flush()
+
+    def _flush_locked(self):
+        if not self._buffered:
+            return
+
+        # The part is written outside the manifest lock; its name is ours alone
+        name = f"part-{uuid.uuid4().hex}"
+        if self.manifest["format"] == "parquet":
+            name += ".parquet"
+            self._write_parquet(os.path.join(self.path, name))
+        else:
+            self._write_npy(os.path.join(self.path, name))
+
+        # Other writers may have added parts since we last looked; add ours to theirs
+        with self._manifest_lock():
+            self.manifest = ResultsStore.read_manifest(self.path)
+            self.manifest["parts"].append({"name": name, "rows": self._buffered, "run_id": self.run_id})
+            self._write_manifest()
+
+        self._buffer = {column: [] for column in ResultsStore.COLUMNS}
+        self._buffered = 0
+
+    def _write_parquet(self, part_path):
+        arrays = {}
+        for column, (kind, _) in ResultsStore.COLUMNS.items():
+            values = self._buffer[column]
+            if kind == "f8":
+                arrays[column] = pa.array(values, type=pa.float64())
+            elif kind == "i8":
+                arrays[column] = pa.array(values, type=pa.int64())
+            else:
+                arrays[column] = pa.array([None if v is None else str(v) for v in values], type=pa.string())
+
+        tmp_path = part_path + ".tmp"
+        pq.write_table(pa.table(arrays), tmp_path, compression="zstd")
+        os.replace(tmp_path, part_path)
+
+    def _write_npy(self, part_dir):
+        tmp_dir = part_dir + ".tmp"
+        os.makedirs(tmp_dir, exist_ok=True)
+
+        for column, (kind, _) in ResultsStore.COLUMNS.items():
+            values = self._buffer[column]
+            if kind in {"f8", "i8"}:
+                np.save(os.path.join(tmp_dir, f"{column}.npy"), np.asarray(values, dtype=kind))
+                continue
+
+            encoded = [("" if v is None else str(v)).encode("utf-8") for v in values]
+            offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+            np.cumsum([len(b) for b in encoded], out=offsets[1:])
+
+            np.save(os.path.join(tmp_dir, f"{column}.npy"), np.frombuffer(b"".join(encoded), dtype=np.uint8))
+            np.save(os.path.join(tmp_dir, f"{column}.offsets.npy"), offsets)
+
+        os.replace(tmp_dir, part_dir)
+
+    @staticmethod
+    def _load_npy_column(part_dir, column, kind):
+        data = np.load(os.path.join(part_dir, f"{column}.npy"), mmap_mode="r")
+        if kind in {"f8", "i8"}:
+            return data
+
+        offsets = np.load(os.path.join(part_dir, f"{column}.offsets.npy"))
+        raw = data.tobytes()
+        return [raw[offsets[i]:offsets[i + 1]].decode("utf-8") for i in range(len(offsets) - 1)]
+
+    @staticmethod
+    def load(path, columns=None, run_id=None):
+        # {column: values} over every part ( or one run's parts ); numbers as NumPy arrays, text as lists
+        #
+        # "json" columns stay text; json.loads only the ones you need
+
+        manifest = ResultsStore.read_manifest(path)
+        if not manifest:
+            raise FileNotFoundError(f"No results store at {path}")
+
+        kinds = manifest["columns"]
+        columns = list(columns or kinds)
+        unknown = [column for column in columns if column not in kinds]
+        if unknown:
+            raise ValueError(f"Unknown columns {unknown}. Expected some of {list(kinds)}")
+
+        parts = [part for part in manifest["parts"] if run_id is None or part["run_id"] == run_id]
+        pieces = {column: [] for column in columns}
+
+        for part in parts:
+            part_path = os.path.join(path, part["name"])
+
+            if manifest["format"] == "parquet":
+                if pq is None:
+                    raise RuntimeError(f"{path} is a Parquet store and pyarrow is not installed")
+                table = pq.read_table(part_path, columns=columns)
+                for column in columns:
+                    if kinds[column] in {"f8", "i8"}:
+                        pieces[column].append(table.column(column).to_numpy())
+                    else:
+                        pieces[column].append(table.column(column).to_pylist())
+            else:
+                for column in columns:
+                    pieces[column].append(ResultsStore._load_npy_column(part_path, column, kinds[column]))
+
+        result = {}
+        for column in columns:
+            if kinds[column] in {"f8", "i8"}:
+                result[column] = np.concatenate(pieces[column]) if pieces[column] else np.zeros(0, dtype=kinds[column])
+            else:
+                result[column] = [value for piece in pieces[column] for value in piece]
+
+        return result
@@ -5,6 +5,8 @@ import time
 import re
 from typing import Any
 from Util.CommonUtil import CommonUtil
+from Util.RateLimiter import RateLimiter
+from Util.Log import Log
 
 class SchemaUtil:
     
@@ -199,29 +201,83 @@ Return the list now:
         return None
 
     @staticmethod
-    def schema_linking(api_key, schema_text, dev_question):
+    def find_complete_list(text):
+        # Incremental parser for streamed schema linking output
+        #
+        # Returns the first closed, balanced [...] in text ( brackets inside quotes don't count ),
+        #   or None while the list is still open
+        #
+        #   'Sure! ["a.x", "b.y"'          -> None
+        #   'Sure! ["a.x", "b[1]"] More..' -> '["a.x", "b[1]"]'
+
+        start = text.find("[")
+        if start == -1:
+            return None
+
+        depth = 0
+        quote = None
+        escaped = False
+
+        for i in range(start, len(text)):
+            ch = text[i]
+
+            if quote:
+                if escaped:
+                    escaped = False
+                elif ch == "\\":
+                    escaped = True
+                elif ch == quote:
+                    quote = None
+
+            elif ch in "\"'":
+                quote = ch
+
+            elif ch == "[":
+                depth += 1
+
+            elif ch == "]":
+                depth -= 1
+                if depth == 0:
+                    return text[start:i + 1]
+
+        return None
+
+    @staticmethod
+    def schema_linking(api_key, schema_text, dev_question, stream=False, router=None):
+        # router ( Util.ModelRouter ) picks the model per attempt, escalating after each failed parse
         
         # Get prompt
         prompt = SchemaUtil.get_schema_linking_prompt(dev_question, schema_text)
 
+        # Streaming stops reading as soon as the first list is closed
+        early_exit = SchemaUtil.find_complete_list if stream else None
+
         # Try multiple times, needed since LLM is not always consistent
         attempts = 25
 
         # Loop
         for i in range(attempts):
 
-            print(f"[Schema Linking] Attempt {i+1} of {attempts}...")
+            Log.debug("[Schema Linking] Attempt", attempt=i + 1, attempts=attempts)
 
             # Call LLM
-            raw = CommonUtil.callLLM(api_key, prompt)
+            model = router.model_for("schema_linking", i) if router else None
+            raw = CommonUtil.callLLM(api_key, prompt, stream=stream, early_exit=early_exit, model=model)
             parsed = SchemaUtil.try_parse_schema_linking_output(raw)
 
+            if router:
+                router.record("schema_linking", model, isinstance(parsed, list))
+
             # Check type
             if isinstance(parsed, list):
                 return [str(x).strip() for x in parsed]
 
-            # Wait 0.5 seconds for LLM rate limit
-            time.sleep(0.5)
+            Log.warn("[Schema Linking] No list in the output; trying again", attempt=i + 1, attempts=attempts,
+                     sample="schema_linking_retry")
+
+            # Wait 0.5 seconds for LLM rate limit; a shared RateLimiter already paces every call
+            if RateLimiter.get() is None:
+                time.sleep(0.5)
 
         raise RuntimeError(
             # Found error
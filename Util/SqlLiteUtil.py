@@ -1,19 +1,80 @@
 from datetime import time
 import os
+import json
 import time
 import sqlite3
 import re
+import threading
+import contextvars
+from contextlib import contextmanager
+from functools import partial
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 
 from Util.CommonUtil import CommonUtil
+from Util.EvaluationUtil import EvaluationUtil
+from Util.UsageLedger import UsageLedger
+from Util.RateLimiter import RateLimiter
+from Util.QueryCapture import QueryCapture
+from Util.Log import Log
 
 class SqlLiteUtil:
     
+    # Every valid SQLite file starts with this 16 byte string
+    SQLITE_HEADER_MAGIC = b"SQLite format 3\x00"
+
     @staticmethod
     def load_sqlite_databases(dataset_name, base_path = "Dataset"):
         
         # Sanitize dataset name
         dataset_name = dataset_name.lower().strip()
 
+        # Manifest of every .sqlite file; KEY path, VALUE header info, sizes and table count
+        manifest = SqlLiteUtil.load_sqlite_manifest(dataset_name, base_path)
+
+        # Hashmap: KEY db_id, VALUE  db_path
+        db_map = {}
+
+        # Loop through manifest entries in path order so duplicates resolve the same way every run
+        for db_path in sorted(manifest):
+            entry = manifest[db_path]
+
+            if not entry["valid"]:
+                # There was an error with the .sqlite file
+                #
+                # Continue and count this in eval metrics
+
+                # Warn then continue
+                Log.warn("Failed to open database", db_id=entry["db_id"], path=db_path, error=entry["error"])
+                continue
+
+            # Add to map
+            db_map[entry["db_id"]] = db_path
+
+        # If no databases found, raise error
+        if len(db_map) == 0:
+            raise RuntimeError(f"No .sqlite databases found for dataset '{dataset_name}'")
+        
+        # Return map from earlier
+        return db_map
+
+    @staticmethod
+    def load_sqlite_manifest(dataset_name, base_path = "Dataset", max_workers = 8):
+        # Discover and validate every .sqlite file of a dataset, reusing the cached manifest
+        #
+        # Opening a real sqlite3 connection per file on every run (and in every worker) is wasted
+        #   work; the files almost never change. Instead:
+        #
+        #   1. stat every .sqlite file ( cheap )
+        #   2. entries whose size and mtime match the cached manifest are reused as-is
+        #   3. new or changed files are validated by their header ( magic + page size ) in parallel
+        #   4. the manifest is written back for the next run / worker
+        #
+        # Entries also carry file size, page count and table count so schedulers can plan around
+        #   the big databases
+
+        # Sanitize dataset name
+        dataset_name = dataset_name.lower().strip()
+
         # Choose only from allowable datasets
         if dataset_name not in {"bird", "spider-1.0"}:
             raise ValueError(f"Unknown dataset '{dataset_name}'. Expected 'bird' or 'spider-1.0'")
@@ -23,56 +84,132 @@ class SqlLiteUtil:
         if not os.path.exists(dev_db_root):
             raise FileNotFoundError(f"dev_databases folder not found at: {dev_db_root}")
 
-        # Hashmap: KEY db_id, VALUE  db_path
-        db_map = {}
-        
+        manifest_path = os.path.join(CommonUtil.get_cache_dir("db_manifest"), f"{dataset_name}.json")
+        cached = {}
+        if os.path.exists(manifest_path):
+            try:
+                with open(manifest_path, "r", encoding="utf-8") as f:
+                    cached = json.load(f)
+            except ValueError:
+                # Half-written or corrupted manifest; just rebuild it
+                cached = {}
+
+        manifest = {}
+        to_validate = []
+
         # Walk through folder to find all .sqlite files
         for root, dirs, files in os.walk(dev_db_root):
-            
-            # Loop through files
             for file in files:
-                
-                # If sqlite file, add to map
-                if file.endswith(".sqlite"):
-                    
-                    # Get db_id and path
-                    db_id = os.path.basename(root)
-
-                    # Full path
-                    db_path = os.path.join(root, file)
-                    
-                    # Verify database file is readable
-                    try:
-                        # Check file before adding to map then close
-                        conn = sqlite3.connect(db_path)
-                        conn.close()
-
-                    except Exception as e:
-                        # There was an error opening the .sqlite file
-                        #
-                        # Continue and count this in eval metrics
-                        
-                        # Warn then continue
-                        print(f"[WARN] Failed to open {db_id} at {db_path}: {e}")
-                        continue
-                    
-                    # Add to map
-                    db_map[db_id] = db_path
+                if not file.endswith(".sqlite"):
+                    continue
+
+                db_path = os.path.join(root, file)
+                stat = os.stat(db_path)
+
+                entry = cached.get(db_path)
+                if entry and entry["size"] == stat.st_size and entry["mtime_ns"] == stat.st_mtime_ns:
+                    manifest[db_path] = entry
+                else:
+                    to_validate.append((db_path, os.path.basename(root), stat))
+
+        # Validate new or changed files in parallel; header reads are I/O bound
+        if to_validate:
+            with ThreadPoolExecutor(max_workers=max_workers) as pool:
+                for entry in pool.map(lambda args: SqlLiteUtil._validate_sqlite_file(*args), to_validate):
+                    manifest[entry["path"]] = entry
+
+        # Write back only when something changed; write-then-rename so parallel workers never read
+        #   a half-written file
+        if manifest != cached:
+            tmp_path = f"{manifest_path}.{os.getpid()}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(manifest, f, indent=1, sort_keys=True)
+            os.replace(tmp_path, manifest_path)
+
+        return manifest
 
-        # If no databases found, raise error
-        if len(db_map) == 0:
-            raise RuntimeError(f"No .sqlite databases found for dataset '{dataset_name}'")
-        
-        # Return map from earlier
-        return db_map
+    @staticmethod
+    def read_sqlite_header(db_path):
+        # Read page size and page count from the 100 byte SQLite header without opening a connection
+        #
+        # Raises ValueError when the file is not a SQLite database, e.g. a git-lfs pointer file
+
+        with open(db_path, "rb") as f:
+            header = f.read(100)
+
+        if len(header) < 100 or not header.startswith(SqlLiteUtil.SQLITE_HEADER_MAGIC):
+            raise ValueError("not a SQLite database (bad header magic)")
+
+        # Big-endian page size at offset 16; the value 1 means 65536
+        page_size = int.from_bytes(header[16:18], "big")
+        if page_size == 1:
+            page_size = 65536
+
+        if page_size < 512 or page_size > 65536 or page_size & (page_size - 1):
+            raise ValueError(f"invalid page size {page_size}")
+
+        # In-header page count at offset 28
+        page_count = int.from_bytes(header[28:32], "big")
+
+        return {"page_size": page_size, "page_count": page_count}
 
     @staticmethod
-    def run_sql_query(query, db_path):
+    def _validate_sqlite_file(db_path, db_id, stat):
+        # Build one manifest entry
+
+        entry = {
+            "path": db_path,
+            "db_id": db_id,
+            "size": stat.st_size,
+            "mtime_ns": stat.st_mtime_ns,
+            "valid": False,
+            "error": "",
+            "page_size": 0,
+            "page_count": 0,
+            "table_count": 0,
+        }
+
+        try:
+            entry.update(SqlLiteUtil.read_sqlite_header(db_path))
+
+            # Table count needs the schema; read-only, and only for new or changed files
+            conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+            try:
+                entry["table_count"] = conn.execute(
+                    "SELECT COUNT(*) FROM sqlite_master WHERE type='table' AND name NOT LIKE 'sqlite_%'"
+                ).fetchone()[0]
+            finally:
+                conn.close()
+
+            entry["valid"] = True
+
+        except Exception as e:
+            entry["error"] = str(e)
+
+        return entry
+
+    @staticmethod
+    def run_sql_query(query, db_path, db_cache=None):
         # Run SQL query on a given .sqlite file
 
         # Strip query   
         query = query.strip()
 
+        # Inside a capturing scope every statement goes through QueryCapture.execute() ( plan, time, steps )
+        capture, tags = QueryCapture.current()
+        run = partial(capture.execute, tags=tags) if capture is not None else None
+
+        # Hot databases are served from an in-memory copy ( Util.MemoryDbCache ); None means read the file
+        if db_cache is not None:
+            try:
+                result = db_cache.execute(query, db_path, run)
+            except Exception as e:
+                Log.error("SQL failed", db_path=db_path, error=str(e), sample="sql_execution_error")
+                return None
+
+            if result is not None:
+                return result
+
         # Connect to .sqlite file
         conn = sqlite3.connect(db_path)
         conn.row_factory = sqlite3.Row
@@ -80,11 +217,12 @@ class SqlLiteUtil:
 
         # Try to execute query
         try:
-            # Execute query
-            cur.execute(query)
-
-            # Fetch all rows    
-            rows = cur.fetchall()
+            # Execute query and fetch all rows
+            if run is not None:
+                rows = run(conn, query)
+            else:
+                cur.execute(query)
+                rows = cur.fetchall()
 
             # Convert rows to list of tuples
             result = [tuple(row) for row in rows]
@@ -95,14 +233,52 @@ class SqlLiteUtil:
         except Exception as e:
             # Error here
             
-            # Print and return
-            print(f"[ERROR] SQL failed on DB '{db_path}': {e}")
+            # Log and return; predicted SQL fails often enough on a full run to need sampling
+            Log.error("SQL failed", db_path=db_path, error=str(e), sample="sql_execution_error")
             return None
 
         finally:
             # Close connection; finish with the current .sqllite file at the moment
             conn.close()
 
+    @staticmethod
+    def run_sql_query_memo(query, db_path, memo=None, db_cache=None):
+        # run_sql_query() behind an ExecutionMemo; no memo means plain execution
+
+        if memo is None:
+            return SqlLiteUtil.run_sql_query(query, db_path, db_cache)
+
+        key = memo.key(query, db_path)
+        found, result = memo.get(key)
+        if found:
+            return result
+
+        result = SqlLiteUtil.run_sql_query(query, db_path, db_cache)
+        memo.put(key, result)
+
+        return result
+
+    @staticmethod
+    def run_gold_and_pred(gold_sql, pred_sql, db_path, memo=None, db_cache=None):
+        # Execute the gold and predicted SQL for one item; returns (gold_result, pred_result)
+        #
+        # When the predicted query is the gold query up to whitespace and a trailing ';' there is
+        #   nothing to learn from running it again; reuse the gold result
+        #
+        # Case is NOT folded here ( unlike EM ), WHERE name = 'Alice' and = 'alice' can return
+        #   different rows
+
+        with QueryCapture.scope(role="gold"):
+            gold_result = SqlLiteUtil.run_sql_query_memo(gold_sql, db_path, memo, db_cache)
+
+        if EvaluationUtil._normalize_sql(pred_sql, keep_case=True) == EvaluationUtil._normalize_sql(gold_sql, keep_case=True):
+            if memo is not None:
+                memo.short_circuits += 1
+            return gold_result, gold_result
+
+        with QueryCapture.scope(role="pred"):
+            return gold_result, SqlLiteUtil.run_sql_query_memo(pred_sql, db_path, memo, db_cache)
+
     @staticmethod
     def getPrompt(obj, few_shot_block, linked_schema_str):
         #Builds the SQL generation LLM prompt from object fields, few-shot string, and linked schema string
@@ -139,23 +315,13 @@ NOW RETURN ONLY THE SQL QUERY:
 """
 
     @staticmethod
-    def generate_sql_for_obj(
-        obj,
-        api_key
-    ):
-        # Creates an SQL query for one dataset object
-        #
-        # Uses RAG examples, schema linking, and an LLM
-        #
-        # Retries a few times if the model gives bad output
+    def build_sql_prompt(obj):
+        # Build the SQL generation prompt for one dataset object and store it on obj.llm_prompt
         #
         # Build few-shot examples in a readable block
 
         # Init variable
         few_shot_block = ""
-        
-        # Set max retries
-        max_retries = 25
 
         # If there are rag examples, add
         if obj.rag_examples:
@@ -188,20 +354,62 @@ NOW RETURN ONLY THE SQL QUERY:
         prompt = SqlLiteUtil.getPrompt(obj, few_shot_block, linked_schema_str)
         obj.llm_prompt = prompt.strip()
 
+        return obj.llm_prompt
+
+    @staticmethod
+    def generate_sql_for_obj(
+        obj,
+        api_key,
+        db_path=None,
+        stream=False,
+        router=None
+    ):
+        # Creates an SQL query for one dataset object
+        #
+        # Uses RAG examples, schema linking, and an LLM
+        #
+        # Retries a few times if the model gives bad output
+        #
+        # With db_path, parsed SQL must also compile against the database ( EXPLAIN, nothing runs );
+        #   the SQLite error goes back to the model on the next attempt
+        #
+        # router ( Util.ModelRouter ) picks the model per attempt; each rejected output moves that
+        #   stage one model up its escalation chain
+        
+        # Set max retries
+        max_retries = 25
+
+        SqlLiteUtil.build_sql_prompt(obj)
+
+        # Prompt for the next attempt; becomes a repair prompt after a compile failure
+        prompt = obj.llm_prompt
+
         # Init raw output of llm variable for later
         last_raw = None
 
+        # Rejected outputs per stage, for escalation
+        failures = {"sql_generation": 0, "sql_repair": 0}
+
         # Try calling the LLM a few times in case the first output is messy
         for attempt in range(1, max_retries + 1):
-            # Print attempt number and object id
-            print(f"[SQL Generation] Attempt {attempt}/{max_retries} for Obj {obj.sort_id}...")
+            # Log attempt number and object id
+            Log.debug("[SQL Generation] Attempt", attempt=attempt, attempts=max_retries, item=obj.sort_id)
 
-            # Call LLM
-            raw = CommonUtil.callLLM(api_key, obj.llm_prompt)
+            # Call LLM; streaming stops reading once the statement is terminated
+            stage = "sql_generation" if prompt == obj.llm_prompt else "sql_repair"
+            model = router.model_for(stage, failures[stage]) if router else None
 
-            # If no raw, print warning and continue
+            with UsageLedger.scope(stage=stage, item=obj.sort_id):
+                raw = CommonUtil.callLLM(
+                    api_key, prompt, stream=stream, early_exit=SqlLiteUtil.find_terminated_sql, model=model
+                )
+
+            # If no raw, warn and continue
             if not raw:
-                print("[WARN] LLM returned nothing. Trying again...")
+                Log.warn("[SQL Generation] LLM returned nothing; trying again", item=obj.sort_id, sample="sql_generation_retry")
+                failures[stage] += 1
+                if router:
+                    router.record(stage, model, False)
                 continue
 
             # Sanitize
@@ -210,17 +418,32 @@ NOW RETURN ONLY THE SQL QUERY:
             # Use our extractor to pull out a real SQL query from messy text
             cleaned_sql = SqlLiteUtil.parse_sql_string(last_raw)
 
+            # Compile check before accepting it
+            compile_error = SqlLiteUtil.compile_sql(cleaned_sql, db_path) if cleaned_sql and db_path else None
+
+            accepted = bool(cleaned_sql) and not compile_error
+            if router:
+                router.record(stage, model, accepted)
+
             # If the cleaning worked, done
-            if cleaned_sql:
+            if accepted:
                 obj.llm_returned_sql = cleaned_sql
 
                 # Return
                 return cleaned_sql
 
-            print("[WARN] Bad SQL from LLM. Trying again...")
+            failures[stage] += 1
+
+            if compile_error:
+                Log.warn("[SQL Generation] SQL does not compile; trying again with the error", item=obj.sort_id,
+                         error=compile_error, sample="sql_repair")
+                prompt = SqlLiteUtil.get_repair_prompt(obj.llm_prompt, cleaned_sql, compile_error)
+            else:
+                Log.warn("[SQL Generation] Bad SQL from LLM; trying again", item=obj.sort_id, sample="sql_generation_retry")
 
-            # Temporarily sleep to for LLM API rate limit 
-            time.sleep(0.4)
+            # Temporarily sleep to for LLM API rate limit; a shared RateLimiter already paces every call
+            if RateLimiter.get() is None:
+                time.sleep(0.4)
 
         # If all retries fail, return an error message
         fail_msg = f"-- ERROR: invalid SQL generated\n-- Last output:\n{last_raw}"
@@ -229,14 +452,253 @@ NOW RETURN ONLY THE SQL QUERY:
         # Return
         return fail_msg
 
+    # Idle read-only connections per db_path; KEY db_path, VALUE list used as a stack
+    _ro_connections = {}
+    _ro_connections_lock = threading.Lock()
+
+    @staticmethod
+    @contextmanager
+    def read_only_connection(db_path, max_idle=4):
+        # Borrow a pooled read-only connection; opening one per check costs more than the check
+        #
+        # mode=ro so nothing we prepare can ever write to a dataset file
+
+        with SqlLiteUtil._ro_connections_lock:
+            idle = SqlLiteUtil._ro_connections.setdefault(db_path, [])
+            conn = idle.pop() if idle else None
+
+        if conn is None:
+            conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True, check_same_thread=False)
+
+        try:
+            yield conn
+        finally:
+            with SqlLiteUtil._ro_connections_lock:
+                idle = SqlLiteUtil._ro_connections.setdefault(db_path, [])
+                if len(idle) < max_idle:
+                    idle.append(conn)
+                    conn = None
+
+            if conn is not None:
+                conn.close()
+
+    @staticmethod
+    def compile_sql(sql, db_path):
+        # Check that SQL compiles against a database without running it
+        #
+        # EXPLAIN makes SQLite prepare the statement ( resolve tables/columns, check syntax ) and
+        #   return the bytecode instead of executing the query
+        #
+        # Returns None when it compiles, otherwise the SQLite error message
+
+        try:
+            with SqlLiteUtil.read_only_connection(db_path) as conn:
+                conn.execute(f"EXPLAIN {sql.strip().rstrip(';')}")
+            return None
+
+        except Exception as e:
+            return str(e)
+
+    @staticmethod
+    def get_repair_prompt(base_prompt, bad_sql, error):
+        # Feed the SQLite error back to the model while the item's context is still in the prompt
+
+        return f"""{base_prompt}
+
+Your previous SQL query was:
+{bad_sql}
+
+SQLite rejected it with this error:
+{error}
+
+Fix the query using ONLY tables/columns that exist in the schema.
+NOW RETURN ONLY THE CORRECTED SQL QUERY:"""
+
+    # Shared by every speculative generation; created on first use
+    _speculative_pool = None
+    _speculative_pool_lock = threading.Lock()
+
+    @staticmethod
+    def _get_speculative_pool(max_workers=16):
+        with SqlLiteUtil._speculative_pool_lock:
+            if SqlLiteUtil._speculative_pool is None:
+                SqlLiteUtil._speculative_pool = ThreadPoolExecutor(
+                    max_workers=max_workers, thread_name_prefix="sql-candidate"
+                )
+
+            return SqlLiteUtil._speculative_pool
+
+    @staticmethod
+    def _generate_sql_candidate(api_key, prompt, db_path, stream=False, stage="sql_generation", model=None):
+        # One candidate: LLM call, parse, compile check. Returns (sql or None, raw, error)
+        #
+        # sql is also returned when it parsed but failed to compile, so the error can be fed back
+
+        try:
+            with UsageLedger.scope(stage=stage):
+                raw = CommonUtil.callLLM(
+                    api_key, prompt, stream=stream, early_exit=SqlLiteUtil.find_terminated_sql, model=model
+                )
+        except Exception as e:
+            return None, None, f"LLM call failed: {e}"
+
+        if not raw:
+            return None, raw, "LLM returned nothing"
+
+        cleaned_sql = SqlLiteUtil.parse_sql_string(raw.strip())
+        if not cleaned_sql:
+            return None, raw.strip(), "no SQL statement found"
+
+        if db_path:
+            error = SqlLiteUtil.compile_sql(cleaned_sql, db_path)
+            if error:
+                return cleaned_sql, raw.strip(), error
+
+        return cleaned_sql, raw.strip(), None
+
+    @staticmethod
+    def generate_sql_for_obj_speculative(
+        obj,
+        api_key,
+        db_path,
+        num_candidates=3,
+        hedge=False,
+        hedge_percentile=95,
+        max_attempts=25,
+        stream=False,
+        router=None,
+    ):
+        # Speculative version of generate_sql_for_obj(): first valid candidate wins
+        #
+        # Retrying in sequence means a bad item waits a full LLM round trip (plus a sleep) per attempt;
+        #   tail latency can reach minutes. Instead we fire num_candidates generations at once and take
+        #   the first one that parses AND compiles against the target database; the others are
+        #   cancelled ( not-yet-started ones never run, in-flight ones are ignored ). With db_path None
+        #   there is nothing to compile against and the first candidate that parses wins
+        #
+        # hedge=True spends less: start ONE request, and only launch a backup (up to num_candidates in
+        #   flight) when it has been running longer than the p95 of recent LLM latencies
+        #
+        # max_attempts caps the total number of LLM calls for the item, same as max_retries today
+        #
+        # router ( Util.ModelRouter ) picks each candidate's model from the rejected candidates so far
+
+        SqlLiteUtil.build_sql_prompt(obj)
+        pool = SqlLiteUtil._get_speculative_pool()
+
+        # Hedging needs room for at least one backup
+        if hedge:
+            num_candidates = max(num_candidates, 2)
+
+        attempts = 0
+        pending = set()
+        last_raw = None
+        last_error = None
+
+        # Each new wave carries the last compile error back to the model
+        prompt = obj.llm_prompt
+
+        # Rejected candidates per stage; the router escalates to a stronger model as these grow
+        failures = {"sql_generation": 0, "sql_repair": 0}
+
+        # Stage and model each candidate was launched with; KEY future, VALUE (stage, model)
+        routes = {}
+
+        def launch():
+            nonlocal attempts
+            attempts += 1
+
+            stage = "sql_generation" if prompt == obj.llm_prompt else "sql_repair"
+            model = router.model_for(stage, failures[stage]) if router else None
+
+            # Copied context: the pool thread charges the same ledger, stage and item
+            with UsageLedger.scope(item=obj.sort_id):
+                context = contextvars.copy_context()
+            future = pool.submit(
+                context.run, SqlLiteUtil._generate_sql_candidate, api_key, prompt, db_path, stream, stage, model
+            )
+            routes[future] = (stage, model)
+            pending.add(future)
+
+        while pending or attempts < max_attempts:
+
+            # Start a new wave when nothing is in flight
+            if not pending:
+                wave = 1 if hedge else num_candidates
+                for _ in range(min(wave, max_attempts - attempts)):
+                    launch()
+
+                Log.debug("[SQL Generation] Candidates in flight", item=obj.sort_id, in_flight=len(pending),
+                          attempts=attempts, max_attempts=max_attempts)
+
+            # Hedged: wait only until the latency threshold, then add a backup request
+            timeout = None
+            if hedge and len(pending) < num_candidates and attempts < max_attempts:
+                timeout = CommonUtil.llm_latency_percentile(hedge_percentile, default=5.0)
+
+            done, pending = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+
+            if not done:
+                Log.info(f"[SQL Generation] Slower than p{hedge_percentile}; hedging", item=obj.sort_id,
+                         timeout=round(timeout, 2), sample="sql_hedge")
+                launch()
+                continue
+
+            for future in done:
+                cleaned_sql, raw, error = future.result()
+
+                stage, model = routes.pop(future)
+                if router:
+                    router.record(stage, model, bool(cleaned_sql) and not error)
+
+                if cleaned_sql and not error:
+                    # Winner; drop the rest
+                    for other in pending:
+                        other.cancel()
+
+                    obj.llm_returned_sql = cleaned_sql
+                    return cleaned_sql
+
+                last_raw = raw if raw is not None else last_raw
+                last_error = error
+                failures[stage] += 1
+                Log.warn("[SQL Generation] Rejected SQL candidate", item=obj.sort_id, error=error,
+                         sample="sql_candidate_rejected")
+
+                if cleaned_sql:
+                    prompt = SqlLiteUtil.get_repair_prompt(obj.llm_prompt, cleaned_sql, error)
+
+        # If all attempts fail, return an error message
+        fail_msg = f"-- ERROR: invalid SQL generated\n-- Last error: {last_error}\n-- Last output:\n{last_raw}"
+        obj.llm_returned_sql = fail_msg
+
+        return fail_msg
+
     @staticmethod
     def generate_sql_for_objs(
         obj_list,
         api_key,
+        db_map=None,
+        num_candidates=1,
+        hedge=False,
+        stream=False,
+        semantic_cache=None,
+        router=None,
     ):
         # Wrapper function to call on list of objects 
         #
         # Generate LLM SQL for a list of DatasetTestObj objects sequentially.
+        #
+        # With db_map, generated SQL is compile-checked against the item's database before it is accepted
+        #
+        # num_candidates > 1 or hedge=True switches to speculative generation
+        #
+        # stream=True reads completions as SSE and stops at the end of the first statement
+        #
+        # semantic_cache ( Service.SemanticCache ) reuses the SQL of near-duplicate questions when it
+        #   was built with reuse_sql=True, and remembers every generated query
+        #
+        # router ( Util.ModelRouter ) routes and escalates models per stage; None uses the default model
 
         # Init where store results
         results = []
@@ -247,17 +709,72 @@ NOW RETURN ONLY THE SQL QUERY:
             
             # Call
             try:
-                results.append(SqlLiteUtil.generate_sql_for_obj(obj, api_key))
-                print(f"Completed SQL generation for {counter} out of {len(obj_list)} items.\n\n")
+                cached_sql = semantic_cache.lookup_sql(obj) if semantic_cache else None
+
+                # No db_map: nothing to compile against, both paths accept SQL once it parses
+                db_path = db_map[obj.dev_db_id] if db_map else None
+
+                if cached_sql is not None:
+                    Log.info("[SQL Generation] Reusing SQL of a near-duplicate question", item=obj.sort_id)
+                    SqlLiteUtil.build_sql_prompt(obj)
+                    obj.llm_returned_sql = cached_sql
+                    results.append(cached_sql)
+
+                elif num_candidates > 1 or hedge:
+                    results.append(SqlLiteUtil.generate_sql_for_obj_speculative(
+                        obj, api_key, db_path, num_candidates=num_candidates, hedge=hedge, stream=stream,
+                        router=router
+                    ))
+                else:
+                    results.append(SqlLiteUtil.generate_sql_for_obj(obj, api_key, db_path, stream, router))
+
+                if semantic_cache:
+                    semantic_cache.store(obj)
+
+                Log.info("SQL generation progress", completed=counter, total=len(obj_list))
                 counter += 1
 
-            # Catch and print errors
+            # Catch and log errors
             except Exception as e:
-                print(f"[ERROR] SQL generation failed: {e}")
+                Log.error("[SQL Generation] Failed", item=obj.sort_id, error=str(e))
 
         # Return results
         return results
 
+    @staticmethod
+    def find_terminated_sql(text):
+        # Incremental parser for streamed SQL generation output
+        #
+        # Returns text up to the end of the first SQL statement once it is terminated by a ';' or
+        #   a closing ``` fence ( outside string literals ), else None; parse_sql_string() cleans it
+        #
+        #   "```sql\nSELECT name FROM t"               -> None
+        #   "```sql\nSELECT name FROM t WHERE a = ';'; Explanation: ..." -> "...WHERE a = ';';"
+
+        sql_start = re.search(r"\b(SELECT|WITH|INSERT|UPDATE|DELETE)\b", text, flags=re.IGNORECASE)
+        if not sql_start:
+            return None
+
+        quote = None
+        for i in range(sql_start.start(), len(text)):
+            ch = text[i]
+
+            if quote:
+                # '' inside a literal closes and reopens it, which works out the same
+                if ch == quote:
+                    quote = None
+
+            elif text.startswith("```", i):
+                return text[:i]
+
+            elif ch in "'\"`":
+                quote = ch
+
+            elif ch == ";":
+                return text[:i + 1]
+
+        return None
+
     @staticmethod
     def parse_sql_string(raw):
         # Extract a clean SQL query from inconsistent LLM output
@@ -286,6 +803,9 @@ NOW RETURN ONLY THE SQL QUERY:
         # More string processing    
         text = text[sql_start.start():].strip()
 
+        # Anything after a closing ``` fence is chatter, not SQL
+        text = text.split("```")[0].strip()
+
         # Remove leftover ``` characters from LLM output if exists
         text = text.rstrip("`").strip()
 
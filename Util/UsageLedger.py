@@ -0,0 +1,223 @@
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+
+# Ledger the current code is charging, and the (stage, item) it is charging to
+#
+# Context variables, not globals: two runs in one process keep separate ledgers, and pools that
+#   submit through contextvars.copy_context().run carry both into their worker threads
+_active_ledger = ContextVar("usage_ledger", default=None)
+_active_scope = ContextVar("usage_scope", default=(None, None))
+
+
+class UsageLedger:
+
+    # Token and cost accounting for LLM calls
+    #
+    # callLLM() records every call here: model, stage, item, prompt / completion tokens, cost and
+    #   latency. Totals are kept per stage, per item and per run
+    #
+    # Tokens and cost come from the "usage" block OpenRouter returns. A stream we close early never
+    #   gets that block, so its tokens are estimated from the text ( ~4 characters per token ) and
+    #   the entry is marked estimated; the provider may still bill the full completion
+
+    # USD per million tokens (prompt, completion); used when a response carries no cost
+    PRICES = {
+        "google/gemini-2.0-flash-001": (0.10, 0.40),
+        "google/gemini-2.0-flash-lite-001": (0.075, 0.30),
+    }
+
+    # Process-wide ledger for calls made outside any activate() block
+    _process_ledger = None
+    _process_lock = threading.Lock()
+
+    def __init__(self, name="run", governor=None):
+        self.name = name
+
+        # Optional Util.BudgetGovernor.BudgetGovernor; callLLM() asks it before every call
+        self.governor = governor
+
+        self.entries = []
+        self._lock = threading.Lock()
+
+        self.total = UsageLedger._empty_totals()
+        self.by_stage = {}
+        self.by_item = {}
+        self.by_model = {}
+
+    @staticmethod
+    def _empty_totals():
+        return {"calls": 0, "prompt_tokens": 0, "completion_tokens": 0, "cost": 0.0, "latency": 0.0, "estimated_calls": 0}
+
+    @staticmethod
+    def current():
+        # Ledger of the running code; the process-wide one when nothing is active
+
+        ledger = _active_ledger.get()
+        if ledger is not None:
+            return ledger
+
+        with UsageLedger._process_lock:
+            if UsageLedger._process_ledger is None:
+                UsageLedger._process_ledger = UsageLedger("process")
+            return UsageLedger._process_ledger
+
+    @contextmanager
+    def activate(self):
+        # Charge every LLM call made inside this block ( same thread / copied context ) to this ledger
+
+        token = _active_ledger.set(self)
+        try:
+            yield self
+        finally:
+            _active_ledger.reset(token)
+
+    @staticmethod
+    @contextmanager
+    def scope(stage=None, item=None):
+        # Tag LLM calls with a stage and / or item; unset values are inherited from the outer scope
+
+        outer_stage, outer_item = _active_scope.get()
+        token = _active_scope.set((stage or outer_stage, outer_item if item is None else item))
+        try:
+            yield
+        finally:
+            _active_scope.reset(token)
+
+    @staticmethod
+    def current_scope():
+        return _active_scope.get()
+
+    @staticmethod
+    def estimate_tokens(text):
+        return max(1, len(text or "") // 4)
+
+    @staticmethod
+    def price(model, prompt_tokens, completion_tokens):
+        prompt_price, completion_price = UsageLedger.PRICES.get(model, (0.0, 0.0))
+        return (prompt_tokens * prompt_price + completion_tokens * completion_price) / 1_000_000
+
+    def record(self, model, usage, latency, prompt="", completion=""):
+        # One LLM call; usage is the response's "usage" dict, or None when we never received it
+
+        estimated = not usage
+        usage = usage or {}
+
+        prompt_tokens = usage.get("prompt_tokens") or UsageLedger.estimate_tokens(prompt)
+        completion_tokens = usage.get("completion_tokens") or UsageLedger.estimate_tokens(completion)
+
+        cost = usage.get("cost")
+        if cost is None:
+            cost = UsageLedger.price(model, prompt_tokens, completion_tokens)
+
+        stage, item = UsageLedger.current_scope()
+        entry = {
+            "time": None,
+            "model": model,
+            "stage": stage,
+            "item": item,
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "cost": cost,
+            "latency": latency,
+            "estimated": estimated,
+        }
+
+        with self._lock:
+            entry["time"] = time.time()
+            self.entries.append(entry)
+
+            for totals in (
+                self.total,
+                self.by_stage.setdefault(stage, UsageLedger._empty_totals()),
+                self.by_item.setdefault(item, UsageLedger._empty_totals()),
+                self.by_model.setdefault(model, UsageLedger._empty_totals()),
+            ):
+                totals["calls"] += 1
+                totals["prompt_tokens"] += prompt_tokens
+                totals["completion_tokens"] += completion_tokens
+                totals["cost"] += cost
+                totals["latency"] += latency
+                totals["estimated_calls"] += estimated
+
+        return entry
+
+    def tokens(self):
+        return self.total["prompt_tokens"] + self.total["completion_tokens"]
+
+    def cost(self):
+        return self.total["cost"]
+
+    def tokens_since(self, since):
+        # Tokens of calls that finished after 'since' ( time.time() ); for rate limiting
+        #
+        # Entries are appended as calls finish, so walk back from the newest and stop at the window
+
+        tokens = 0
+        with self._lock:
+            for entry in reversed(self.entries):
+                if entry["time"] < since:
+                    break
+                tokens += entry["prompt_tokens"] + entry["completion_tokens"]
+
+        return tokens
+
+    def report(self, completed_items=None):
+        # Per stage and per model totals, and per item averages
+
+        def row(label, t):
+            return (f"{str(label):<24} {t['calls']:>6} {t['prompt_tokens']:>10} {t['completion_tokens']:>10} "
+                    f"${t['cost']:>9.4f} {t['latency']:>9.1f}s")
+
+        header = f"{'':<24} {'calls':>6} {'prompt':>10} {'completion':>10} {'cost':>10} {'latency':>10}"
+
+        with self._lock:
+            lines = [f"\n-----LLM USAGE ( {self.name} )-----", header]
+            lines += [row(stage, t) for stage, t in self.by_stage.items()]
+            lines.append(row("total", self.total))
+
+            if len(self.by_model) > 1:
+                lines += ["", header] + [row(model, t) for model, t in self.by_model.items()]
+
+            items = [item for item in self.by_item if item is not None]
+            if items:
+                lines.append(f"\n{len(items)} items charged, ${self.total['cost'] / len(items):.5f} "
+                             f"and {self.tokens() / len(items):.0f} tokens per item")
+
+            if completed_items is not None:
+                lines.append(f"{completed_items} items completed, "
+                             f"${self.total['cost'] / completed_items if completed_items else 0.0:.5f} per completed item")
+
+            if self.total["estimated_calls"]:
+                lines.append(f"{self.total['estimated_calls']} calls estimated ( stream closed before usage arrived )")
+
+        report = "\n".join(lines)
+        print(report)
+
+        return report
+
+    def write(self, path):
+        # Full ledger as JSON: totals plus every call
+
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+
+        with self._lock:
+            payload = {
+                "name": self.name,
+                "total": self.total,
+                "by_stage": {str(k): v for k, v in self.by_stage.items()},
+                "by_model": self.by_model,
+                "by_item": {str(k): v for k, v in self.by_item.items()},
+                "entries": self.entries,
+            }
+
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(payload, f, indent=1)
+        os.replace(tmp_path, path)
+
+        return path
@@ -0,0 +1,40 @@
+import json
+import os
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from Service.impls.LoadDevJson import LoadDevJson
+
+
+class IterJsonArrayTest(unittest.TestCase):
+
+    def parse(self, text, chunk_size):
+        with tempfile.NamedTemporaryFile("w", suffix=".json", encoding="utf-8", delete=False) as f:
+            f.write(text)
+        try:
+            return list(LoadDevJson.iter_json_array(f.name, chunk_size=chunk_size))
+        finally:
+            os.remove(f.name)
+
+    def test_numbers_split_at_chunk_boundaries(self):
+        # Every chunk size puts some boundary inside "2.5", "300" or "-1e3"
+        text = '[1,2.5,300,{"a":1}, -1e3 ,true,null,"x",[4.25]]'
+        for chunk_size in range(1, len(text) + 1):
+            with self.subTest(chunk_size=chunk_size):
+                self.assertEqual(self.parse(text, chunk_size), json.loads(text))
+
+    def test_number_last_in_array(self):
+        for chunk_size in (1, 2, 3):
+            with self.subTest(chunk_size=chunk_size):
+                self.assertEqual(self.parse("[10, 20.75]", chunk_size), [10, 20.75])
+
+    def test_truncated_array_raises(self):
+        with self.assertRaises(ValueError):
+            self.parse("[1,2.5", 2)
+
+
+if __name__ == "__main__":
+    unittest.main()